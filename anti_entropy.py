@@ -0,0 +1,325 @@
+import bisect
+import configparser
+import hashlib
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+from config_service import get_config_service
+from db_manager import close_connection
+from db_operations import SYNC_TABLES, delete_bulletin, delete_mail, get_sync_fields, get_sync_versions, prune_tombstones
+from packer import utf8_len
+from sync_transport import encode_fields
+from utils import send_sync_message, send_sync_request
+
+AE_PREFIX = "AE_"
+
+DAY = 86400
+HEX_DIGITS = '0123456789abcdef'
+KEY_LENGTH = 12
+VERSION_LENGTH = 6
+DIGEST_LENGTH = 8
+TOMBSTONE = '-' * VERSION_LENGTH
+
+
+def short_key(unique_id):
+    return hashlib.sha1(unique_id.encode('utf-8')).hexdigest()[:KEY_LENGTH]
+
+
+class SyncIndex:
+    """
+    One node's bulletins or mail as short hashed keys, bucketed by key prefix.
+
+    Each item is the hash of its unique_id mapped to a short content version, or to a
+    tombstone marker once deleted. A bucket's digest is the XOR of its items' hashes, so
+    two nodes hold the same items under a prefix exactly when the digests match.
+    """
+
+    def __init__(self, versions):
+        self.items = {}
+        for unique_id, version in versions:
+            # Tombstones come last, so they replace a row that is being deleted
+            self.items[short_key(unique_id)] = (unique_id, version[:VERSION_LENGTH] if version else TOMBSTONE)
+        self.keys = sorted(self.items)
+        self._hashes = {
+            key: int(hashlib.sha1(f"{key}{token}".encode('utf-8')).hexdigest()[:DIGEST_LENGTH], 16)
+            for key, (_, token) in self.items.items()
+        }
+
+    def bucket(self, prefix):
+        """Keys under a prefix; 'g' sorts after every hex digit."""
+        return self.keys[bisect.bisect_left(self.keys, prefix):bisect.bisect_left(self.keys, prefix + 'g')]
+
+    def digest(self, prefix=''):
+        value = 0
+        for key in self.bucket(prefix):
+            value ^= self._hashes[key]
+        return f"{value:0{DIGEST_LENGTH}x}"
+
+    def children(self, prefix):
+        return ''.join(self.digest(prefix + digit) for digit in HEX_DIGITS)
+
+    def entries(self, prefix):
+        """The bucket's keys without the shared prefix, each followed by its version, as one string."""
+        return ''.join(key[len(prefix):] + self.items[key][1] for key in self.bucket(prefix))
+
+
+class AntiEntropy:
+    """
+    Periodic repair of bulletins and mail that push sync failed to deliver.
+
+    Every ``interval`` seconds each peer BBS is sent the root digest of each kind. A peer
+    whose digest differs answers with the digests of the 16 child buckets, and the two
+    sides only descend into buckets that differ until one holds at most ``leaf_items``
+    items, whose keys are then listed. The node that receives a key list pushes whatever
+    the other side lacks (or holds an older version of) through the sync outbox, asks for
+    what it lacks itself, and applies deletes the other side has tombstones for.
+
+    ``send(peer, fields)`` delivers a one-off message; ``push(peer, fields, item_key)``
+    queues an item for reliable delivery.
+    """
+
+    def __init__(self, send, push, peers, interval=3600, leaf_items=16, max_depth=4, max_message_bytes=600,
+                 tombstone_days=90, index_ttl=60):
+        self.send = send
+        self.push = push
+        self.peers = peers
+        self.interval = interval
+        self.leaf_items = leaf_items
+        self.max_depth = max_depth
+        self.max_message_bytes = max_message_bytes
+        self.tombstone_days = tombstone_days
+        self.index_ttl = index_ttl
+
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.rounds = 0
+        self.in_sync = 0
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.pushed = 0
+        self.wanted = 0
+        self.deleted = 0
+
+    def start(self):
+        if self._thread is not None or not self.interval:
+            return
+        self._thread = threading.Thread(target=self._run, name='anti-entropy', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        logging.info(f"Anti-entropy stopped: {self.stats()}")
+
+    def stats(self):
+        return {
+            'rounds': self.rounds,
+            'in_sync': self.in_sync,
+            'messages_sent': self.messages_sent,
+            'bytes_sent': self.bytes_sent,
+            'pushed': self.pushed,
+            'wanted': self.wanted,
+            'deleted': self.deleted
+        }
+
+    def run_round(self):
+        """Offer every peer the root digest of each kind."""
+        for kind in SYNC_TABLES:
+            digest = self._index(kind, refresh=True).digest()
+            for peer in self.peers:
+                self._send(peer, ['AE_SUM', kind, digest])
+        self.rounds += 1
+
+    def handle(self, peer, fields):
+        """Handle an AE_* message from a peer BBS."""
+        handlers = {'AE_SUM': self._on_sum, 'AE_TREE': self._on_tree, 'AE_KEYS': self._on_keys,
+                    'AE_WANT': self._on_want}
+        handler = handlers.get(fields[0])
+        if handler is None or len(fields) < 3 or fields[1] not in SYNC_TABLES:
+            logging.warning(f"Ignoring malformed anti-entropy message {fields[0]} from {peer}")
+            return
+        try:
+            handler(peer, fields[1], fields[2:])
+        except ValueError as e:
+            logging.warning(f"Ignoring malformed anti-entropy message {fields[0]} from {peer}: {e}")
+
+    def _index(self, kind, refresh=False):
+        with self._lock:
+            built_at, index = self._indexes.get(kind, (None, None))
+            if refresh or index is None or time.monotonic() - built_at > self.index_ttl:
+                index = SyncIndex(get_sync_versions(kind))
+                self._indexes[kind] = (time.monotonic(), index)
+            return index
+
+    def _send(self, peer, fields):
+        self.messages_sent += 1
+        self.bytes_sent += utf8_len(encode_fields(fields))
+        if not self.send(peer, fields):
+            logging.debug(f"Anti-entropy {fields[0]} to {peer} was not queued")
+
+    def _send_batched(self, peer, head, groups):
+        """Send groups of fields after ``head``, packing as many groups per message as fit."""
+        batch = []
+        size = base = utf8_len(encode_fields(head))
+        for group in groups:
+            group_size = sum(utf8_len(field) + 1 for field in group)
+            if batch and size + group_size > self.max_message_bytes:
+                self._send(peer, head + batch)
+                batch, size = [], base
+            batch += group
+            size += group_size
+        if batch:
+            self._send(peer, head + batch)
+
+    def _descend(self, peer, kind, index, prefixes):
+        """Answer buckets known to differ with their key lists, or the digests of their children."""
+        trees, keys = [], []
+        for prefix in prefixes:
+            if len(prefix) >= self.max_depth or len(index.bucket(prefix)) <= self.leaf_items:
+                keys.append([prefix, index.entries(prefix)])
+            else:
+                trees.append([prefix, index.children(prefix)])
+        self._send_batched(peer, ['AE_TREE', kind], trees)
+        self._send_batched(peer, ['AE_KEYS', kind], keys)
+
+    def _on_sum(self, peer, kind, args):
+        index = self._index(kind)
+        if index.digest() == args[0]:
+            self.in_sync += 1
+            return
+        self._descend(peer, kind, index, [''])
+
+    def _on_tree(self, peer, kind, args):
+        index = self._index(kind)
+        mismatched = []
+        for prefix, digests in _pairs(args):
+            if len(prefix) >= KEY_LENGTH or len(digests) != DIGEST_LENGTH * len(HEX_DIGITS):
+                raise ValueError(f"bad digest list for bucket '{prefix}'")
+            mine = index.children(prefix)
+            for i, digit in enumerate(HEX_DIGITS):
+                span = slice(i * DIGEST_LENGTH, (i + 1) * DIGEST_LENGTH)
+                if mine[span] != digests[span]:
+                    mismatched.append(prefix + digit)
+        self._descend(peer, kind, index, mismatched)
+
+    def _on_keys(self, peer, kind, args):
+        index = self._index(kind)
+        push, want, delete = [], [], []
+        for prefix, entries in _pairs(args):
+            width = KEY_LENGTH - len(prefix)
+            if width <= 0 or len(entries) % (width + VERSION_LENGTH):
+                raise ValueError(f"bad key list for bucket '{prefix}'")
+            theirs = {prefix + entries[i:i + width]: entries[i + width:i + width + VERSION_LENGTH]
+                      for i in range(0, len(entries), width + VERSION_LENGTH)}
+            for key in index.bucket(prefix):
+                unique_id, token = index.items[key]
+                their_token = theirs.pop(key, None)
+                if their_token == token:
+                    continue
+                if their_token is None or token == TOMBSTONE:
+                    push.append(unique_id)
+                elif their_token == TOMBSTONE:
+                    delete.append(unique_id)
+                elif token > their_token:
+                    # Both sides keep the version with the higher hash on conflict
+                    push.append(unique_id)
+                else:
+                    want.append(key)
+            want.extend(theirs)
+
+        for unique_id in push:
+            self._push(peer, kind, unique_id)
+        for unique_id in delete:
+            self._delete(kind, unique_id)
+            self.deleted += 1
+        if delete:
+            self._index(kind, refresh=True)
+        self.wanted += len(want)
+        self._send_batched(peer, ['AE_WANT', kind], [[key] for key in want])
+        if push or want or delete:
+            logging.info(f"Anti-entropy with {peer}: {kind} pushed {len(push)}, requested {len(want)}, "
+                         f"deleted {len(delete)}")
+
+    def _on_want(self, peer, kind, keys):
+        index = self._index(kind)
+        for key in keys:
+            item = index.items.get(key)
+            if item is not None:
+                self._push(peer, kind, item[0])
+
+    def _delete(self, kind, unique_id):
+        """Apply a delete the peer has a tombstone for, without sending it on to other peers."""
+        if kind == 'BULLETIN':
+            delete_bulletin(unique_id, [], None)
+        else:
+            delete_mail(unique_id, None, [], None)
+
+    def _push(self, peer, kind, unique_id):
+        fields = get_sync_fields(kind, unique_id)
+        if fields is not None:
+            self.push(peer, fields, unique_id)
+            self.pushed += 1
+
+    def _run(self):
+        # Spread out the first round so peers that start together do not all initiate at once
+        delay = self.interval * random.uniform(0.1, 0.5)
+        while not self._stop.wait(delay):
+            try:
+                pruned = prune_tombstones(self.tombstone_days * DAY)
+                if pruned:
+                    logging.info(f"Pruned {pruned} sync tombstone(s) older than {self.tombstone_days} days")
+                self.run_round()
+            except sqlite3.Error as e:
+                logging.error(f"Anti-entropy round failed: {e}")
+            delay = self.interval * random.uniform(0.9, 1.1)
+        close_connection()
+
+
+def _pairs(args):
+    if len(args) % 2:
+        raise ValueError("unpaired fields")
+    return zip(args[0::2], args[1::2])
+
+
+_anti_entropy = None
+_anti_entropy_lock = threading.Lock()
+
+
+def _push_to_peer(peer, fields, item_key):
+    send_sync_message(fields, item_key, [peer], None)
+
+
+def get_anti_entropy():
+    global _anti_entropy
+    with _anti_entropy_lock:
+        if _anti_entropy is None:
+            config = configparser.ConfigParser()
+            config.read('config.ini')
+            _anti_entropy = AntiEntropy(
+                send_sync_request,
+                _push_to_peer,
+                [],
+                interval=config.getint('sync', 'anti_entropy_interval', fallback=3600),
+                leaf_items=config.getint('sync', 'anti_entropy_leaf_items', fallback=16),
+                tombstone_days=config.getint('sync', 'tombstone_days', fallback=90)
+            )
+        return _anti_entropy
+
+
+def start_anti_entropy(interface):
+    anti_entropy = get_anti_entropy()
+    anti_entropy.peers = interface.bbs_nodes
+    get_config_service().subscribe(lambda snapshot: setattr(anti_entropy, 'peers', list(snapshot.bbs_nodes)))
+    anti_entropy.start()
+
+
+def shutdown_anti_entropy():
+    if _anti_entropy is not None:
+        _anti_entropy.stop()
@@ -1,85 +1,44 @@
-import configparser
 import logging
-import random
 import time
-import requests
-import json
 
 from meshtastic import BROADCAST_NUM
 
+import content_corpus
+from config_service import MENU_TITLES, get_config
 from db_operations import (
     add_bulletin, add_mail, delete_mail,
-    get_bulletin_content, get_bulletins,
-    get_mail, get_mail_content,
-    add_channel, get_channels, get_sender_id_by_mail_id
+    get_bulletin_content, get_bulletin_count, get_bulletins_page,
+    get_mail_content, get_mail_page, get_mailbox_summary, mark_mail_read,
+    add_channel, get_channel, get_channels_page, get_sender_id_by_mail_id
 )
+from listings import get_listing_item, handle_listing_navigation, new_listing, register_listing, show_listing
+from node_stats import get_node_stats
 from utils import (
     get_node_id_from_num, get_node_info,
     get_node_short_name, send_message,
-    update_user_state
+    update_user_state, start_draft, append_draft, take_draft
 )
+from weather_service import STATUS_NOT_FOUND, STATUS_OK, STATUS_UNAVAILABLE, get_weather_service
 
-# Read the configuration for menu options
-config = configparser.ConfigParser()
-config.read('config.ini')
+register_listing('bulletins', get_bulletins_page, lambda row: f"{row[1]} ({row[2]})")
+register_listing('mail', get_mail_page, lambda row: f"{'' if row[4] else '*'}{row[1]}: {row[2]} ({row[3]})")
+register_listing('channels', get_channels_page, lambda row: row[1])
 
-main_menu_items = config['menu']['main_menu_items'].split(',')
-bbs_menu_items = config['menu']['bbs_menu_items'].split(',')
-utilities_menu_items = config['menu']['utilities_menu_items'].split(',')
 
+def build_menu(menu, title=None):
+    """A menu from the current configuration, rendered when the configuration was loaded."""
+    return f"{title or MENU_TITLES[menu]}\n{get_config().menus[menu]}"
 
-def build_menu(items, menu_name):
-    menu_str = f"{menu_name}\n"
-    for item in items:
-        if item.strip() == 'W':
-            # Context-aware: Weather for main menu, Wall of Shame for utilities
-            if "Utilities" in menu_name or "🛠️" in menu_name:
-                menu_str += "[W]all of Shame\n"
-            else:
-                menu_str += "[W]eather\n"
-        elif item.strip() == 'N':
-            menu_str += "[N]etwork Info\n"
-        elif item.strip() == 'Q':
-            if "BBS" in menu_name or "💾" in menu_name:
-                menu_str += "[Q]uote\n"
-            else:
-                menu_str += "[Q]uick Commands\n"
-        elif item.strip() == 'R':
-            menu_str += "[R]esources\n"
-        elif item.strip() == 'B':
-            if menu_name == "📰BBS Menu📰":
-                menu_str += "[B]ulletins\n"
-            else:
-                menu_str += "[B]ulletins\n"
-        elif item.strip() == 'U':
-            menu_str += "[U]tilities\n"
-        elif item.strip() == 'X':
-            menu_str += "E[X]IT\n"
-        elif item.strip() == 'M':
-            menu_str += "[M]ail\n"
-        elif item.strip() == 'C':
-            menu_str += "[C]hannel Dir\n"
-        elif item.strip() == 'J':
-            menu_str += "[J]S8CALL\n"
-        elif item.strip() == 'S':
-            menu_str += "[S]tats\n"
-        elif item.strip() == 'F':
-            menu_str += "[F]ortune\n"
-        elif item.strip() == 'G':
-            menu_str += "[G]ames\n"
-    return menu_str
 
 def handle_help_command(sender_id, interface, menu_name=None):
     if menu_name:
         update_user_state(sender_id, {'command': 'MENU', 'menu': menu_name, 'step': 1})
-        if menu_name == 'bbs':
-            response = build_menu(bbs_menu_items, "📰BBS Menu📰")
-        elif menu_name == 'utilities':
-            response = build_menu(utilities_menu_items, "🛠️Utilities Menu🛠️")
+        response = build_menu(menu_name)
     else:
         update_user_state(sender_id, {'command': 'MAIN_MENU', 'step': 1})  # Reset to main menu state
-        mail = get_mail(get_node_id_from_num(sender_id, interface))
-        response = build_menu(main_menu_items, f"💾Wildcat TC² BBS💾 (✉️:{len(mail)})")
+        total, unread = get_mailbox_summary(get_node_id_from_num(sender_id, interface))
+        badge = f"✉️:{total} 🆕{unread}" if unread else f"✉️:{total}"
+        response = build_menu('main', f"{MENU_TITLES['main']} ({badge})")
     send_message(response, sender_id, interface)
 
 def get_node_name(node_id, interface):
@@ -120,12 +79,10 @@ def handle_stats_command(sender_id, interface):
 
 def handle_fortune_command(sender_id, interface):
     try:
-        with open('fortunes.txt', 'r') as file:
-            fortunes = file.readlines()
-        if not fortunes:
+        fortune = content_corpus.get_fortunes().random()
+        if not fortune:
             send_message("No fortunes available.", sender_id, interface)
             return
-        fortune = random.choice(fortunes).strip()
         decorated_fortune = f"🔮 {fortune} 🔮"
         send_message(decorated_fortune, sender_id, interface)
     except Exception as e:
@@ -143,7 +100,7 @@ def handle_stats_steps(sender_id, message, step, interface):
             handle_help_command(sender_id, interface)
             return
         elif choice == 'n':
-            current_time = int(time.time())
+            stats = get_node_stats(interface)
             timeframes = {
                 "All time": None,
                 "Last 24 hours": 86400,
@@ -156,27 +113,20 @@ def handle_stats_steps(sender_id, message, step, interface):
                 if seconds is None:
                     total_nodes = len(interface.nodes)
                 else:
-                    time_limit = current_time - seconds
-                    total_nodes = sum(1 for node in interface.nodes.values() if node.get('lastHeard') is not None and node['lastHeard'] >= time_limit)
+                    total_nodes = stats.active_count(seconds)
                 total_nodes_summary.append(f"- {period}: {total_nodes}")
 
             response = "Total nodes seen:\n" + "\n".join(total_nodes_summary)
             send_message(response, sender_id, interface)
             handle_stats_command(sender_id, interface)
         elif choice == 'h':
-            hw_models = {}
-            for node in interface.nodes.values():
-                hw_model = node['user'].get('hwModel', 'Unknown')
-                hw_models[hw_model] = hw_models.get(hw_model, 0) + 1
-            response = "Hardware Models:\n" + "\n".join([f"{model}: {count}" for model, count in hw_models.items()])
+            hw_models = get_node_stats(interface).hardware_models()
+            response = "Hardware Models:\n" + "\n".join([f"{model or 'Unknown'}: {count}" for model, count in hw_models])
             send_message(response, sender_id, interface)
             handle_stats_command(sender_id, interface)
         elif choice == 'r':
-            roles = {}
-            for node in interface.nodes.values():
-                role = node['user'].get('role', 'Unknown')
-                roles[role] = roles.get(role, 0) + 1
-            response = "Roles:\n" + "\n".join([f"{role}: {count}" for role, count in roles.items()])
+            roles = get_node_stats(interface).roles()
+            response = "Roles:\n" + "\n".join([f"{role or 'Unknown'}: {count}" for role, count in roles])
             send_message(response, sender_id, interface)
             handle_stats_command(sender_id, interface)
         elif choice == 's':
@@ -202,22 +152,16 @@ def handle_bb_steps(sender_id, message, step, state, interface, bbs_nodes):
             handle_help_command(sender_id, interface, 'bbs')
             return
         board_name = boards[int(message)]
-        bulletins = get_bulletins(board_name)
-        response = f"{board_name} has {len(bulletins)} messages.\n[R]ead  [P]ost"
+        response = f"{board_name} has {get_bulletin_count(board_name)} messages.\n[R]ead  [P]ost"
         send_message(response, sender_id, interface)
         update_user_state(sender_id, {'command': 'BULLETIN_ACTION', 'step': 2, 'board': board_name})
 
     elif step == 2:
         board_name = state['board']
         if message.lower() == 'r':
-            bulletins = get_bulletins(board_name)
-            if bulletins:
-                send_message(f"Select a bulletin number to view from {board_name}:", sender_id, interface)
-                for bulletin in bulletins:
-                    send_message(f"[{bulletin[0]}] {bulletin[1]}", sender_id, interface)
-                update_user_state(sender_id, {'command': 'BULLETIN_READ', 'step': 3, 'board': board_name})
-            else:
-                send_message(f"No bulletins in {board_name}.", sender_id, interface)
+            listing = new_listing('bulletins', [board_name], f"Select a bulletin number to view from {board_name}:",
+                                  f"No bulletins in {board_name}.")
+            if not show_listing(sender_id, interface, listing, {'command': 'BULLETIN_READ', 'step': 3, 'board': board_name}):
                 handle_bb_steps(sender_id, 'e', 1, state, interface, bbs_nodes)
         elif message.lower() == 'p':
             if board_name.lower() == 'urgent':
@@ -232,7 +176,12 @@ def handle_bb_steps(sender_id, message, step, state, interface, bbs_nodes):
             update_user_state(sender_id, {'command': 'BULLETIN_POST', 'step': 4, 'board': board_name})
 
     elif step == 3:
-        bulletin_id = int(message)
+        if handle_listing_navigation(sender_id, message, state, interface):
+            return
+        bulletin_id = get_listing_item(state, message)
+        if bulletin_id is None:
+            send_message("Invalid bulletin number. Please try again.", sender_id, interface)
+            return
         sender_short_name, date, subject, content, unique_id = get_bulletin_content(bulletin_id)
         send_message(f"From: {sender_short_name}\nDate: {date}\nSubject: {subject}\n- - - - - - -\n{content}", sender_id, interface)
         board_name = state['board']
@@ -241,13 +190,14 @@ def handle_bb_steps(sender_id, message, step, state, interface, bbs_nodes):
     elif step == 4:
         subject = message
         send_message("Send the contents of your bulletin. Send a message with END when finished.", sender_id, interface)
-        update_user_state(sender_id, {'command': 'BULLETIN_POST_CONTENT', 'step': 5, 'board': state['board'], 'subject': subject, 'content': ''})
+        update_user_state(sender_id, {'command': 'BULLETIN_POST_CONTENT', 'step': 5, 'board': state['board'], 'subject': subject})
+        start_draft(sender_id)
 
     elif step == 5:
         if message.lower() == "end":
             board = state['board']
             subject = state['subject']
-            content = state['content']
+            content = take_draft(sender_id)
             node_id = get_node_id_from_num(sender_id, interface)
             node_info = interface.nodes.get(node_id)
             if node_info is None:
@@ -258,9 +208,8 @@ def handle_bb_steps(sender_id, message, step, state, interface, bbs_nodes):
             unique_id = add_bulletin(board, sender_short_name, subject, content, bbs_nodes, interface)
             send_message(f"Your bulletin '{subject}' has been posted to {board}.\n(╯°□°)╯📄📌[{board}]", sender_id, interface)
             handle_bb_steps(sender_id, 'e', 1, state, interface, bbs_nodes)
-        else:
-            state['content'] += message + "\n"
-            update_user_state(sender_id, state)
+        elif not append_draft(sender_id, message):
+            send_message("Your bulletin is as long as it can be. Send END to post it.", sender_id, interface)
 
 
 
@@ -273,14 +222,11 @@ def handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes):
         choice = message.lower()
         if choice == 'r':
             sender_node_id = get_node_id_from_num(sender_id, interface)
-            mail = get_mail(sender_node_id)
-            if mail:
-                send_message(f"You have {len(mail)} mail messages. Select a message number to read:", sender_id, interface)
-                for msg in mail:
-                    send_message(f"-{msg[0]}-\nDate: {msg[3]}\nFrom: {msg[1]}\nSubject: {msg[2]}", sender_id, interface)
-                update_user_state(sender_id, {'command': 'MAIL', 'step': 2})
-            else:
-                send_message("There are no messages in your mailbox.📭", sender_id, interface)
+            total, unread = get_mailbox_summary(sender_node_id)
+            listing = new_listing('mail', [sender_node_id], f"You have {total} mail messages ({unread} unread, marked *). "
+                                  "Select a message number to read:",
+                                  "There are no messages in your mailbox.📭")
+            if not show_listing(sender_id, interface, listing, {'command': 'MAIL', 'step': 2}):
                 update_user_state(sender_id, None)
         elif choice == 's':
             send_message("What is the Short Name of the node you want to leave a message for?", sender_id, interface)
@@ -289,10 +235,16 @@ def handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes):
             handle_help_command(sender_id, interface)
 
     elif step == 2:
-        mail_id = int(message)
+        if handle_listing_navigation(sender_id, message, state, interface):
+            return
+        mail_id = get_listing_item(state, message)
+        if mail_id is None:
+            send_message("Invalid message number. Please try again.", sender_id, interface)
+            return
         try:
             sender_node_id = get_node_id_from_num(sender_id, interface)
             sender, date, subject, content, unique_id = get_mail_content(mail_id, sender_node_id)
+            mark_mail_read(mail_id, sender_node_id)
             send_message(f"Date: {date}\nFrom: {sender}\nSubject: {subject}\n{content}", sender_id, interface)
             send_message("What would you like to do with this message?\n[K]eep  [D]elete  [R]eply", sender_id, interface)
             update_user_state(sender_id, {'command': 'MAIL', 'step': 4, 'mail_id': mail_id, 'unique_id': unique_id, 'sender': sender, 'subject': subject, 'content': content})
@@ -328,7 +280,8 @@ def handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes):
         elif message.lower() == "r":
             sender = state['sender']
             send_message(f"Send your reply to {sender} now, followed by a message with END", sender_id, interface)
-            update_user_state(sender_id, {'command': 'MAIL', 'step': 7, 'reply_to_mail_id': state['mail_id'], 'subject': f"Re: {state['subject']}", 'content': ''})
+            update_user_state(sender_id, {'command': 'MAIL', 'step': 7, 'reply_to_mail_id': state['mail_id'], 'subject': f"Re: {state['subject']}"})
+            start_draft(sender_id)
         else:
             send_message("The message has been kept in your inbox.✉️", sender_id, interface)
             update_user_state(sender_id, None)
@@ -336,7 +289,8 @@ def handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes):
     elif step == 5:
         subject = message
         send_message("Send your message. You can send it in multiple messages if it's too long for one.\nSend a single message with END when you're done", sender_id, interface)
-        update_user_state(sender_id, {'command': 'MAIL', 'step': 7, 'recipient_id': state['recipient_id'], 'subject': subject, 'content': ''})
+        update_user_state(sender_id, {'command': 'MAIL', 'step': 7, 'recipient_id': state['recipient_id'], 'subject': subject})
+        start_draft(sender_id)
 
     elif step == 6:
         selected_node_index = int(message)
@@ -353,7 +307,7 @@ def handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes):
             else:
                 recipient_id = state.get('recipient_id')
             subject = state['subject']
-            content = state['content']
+            content = take_draft(sender_id)
             recipient_name = get_node_name(recipient_id, interface)
 
             sender_short_name = get_node_short_name(get_node_id_from_num(sender_id, interface), interface)
@@ -365,9 +319,8 @@ def handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes):
 
             update_user_state(sender_id, None)
             update_user_state(sender_id, {'command': 'MAIL', 'step': 8})
-        else:
-            state['content'] += message + "\n"
-            update_user_state(sender_id, state)
+        elif not append_draft(sender_id, message):
+            send_message("Your message is as long as it can be. Send END to send it.", sender_id, interface)
 
     elif step == 8:
         if message.lower() == "y":
@@ -379,12 +332,8 @@ def handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes):
 
 def handle_wall_of_shame_command(sender_id, interface):
     response = "Devices with battery levels below 20%:\n"
-    for node_id, node in interface.nodes.items():
-        metrics = node.get('deviceMetrics', {})
-        battery_level = metrics.get('batteryLevel', 101)
-        if battery_level < 20:
-            long_name = node['user']['longName']
-            response += f"{long_name} - Battery {battery_level}%\n"
+    for long_name, battery_level in get_node_stats(interface).low_battery():
+        response += f"{long_name or 'Unknown'} - Battery {battery_level}%\n"
     if response == "Devices with battery levels below 20%:\n":
         response = "No devices with battery levels below 20% found."
     send_message(response, sender_id, interface)
@@ -407,24 +356,21 @@ def handle_channel_directory_steps(sender_id, message, step, state, interface):
             handle_help_command(sender_id, interface)
             return
         elif choice.lower() == 'v':
-            channels = get_channels()
-            if channels:
-                response = "Select a channel number to view:\n" + "\n".join(
-                    [f"[{i}] {channel[0]}" for i, channel in enumerate(channels)])
-                send_message(response, sender_id, interface)
-                update_user_state(sender_id, {'command': 'CHANNEL_DIRECTORY', 'step': 2})
-            else:
-                send_message("No channels available in the directory.", sender_id, interface)
+            listing = new_listing('channels', title="Select a channel number to view:",
+                                  empty="No channels available in the directory.")
+            if not show_listing(sender_id, interface, listing, {'command': 'CHANNEL_DIRECTORY', 'step': 2}):
                 handle_channel_directory_command(sender_id, interface)
         elif choice.lower() == 'p':
             send_message("Name your channel for the directory:", sender_id, interface)
             update_user_state(sender_id, {'command': 'CHANNEL_DIRECTORY', 'step': 3})
 
     elif step == 2:
-        channel_index = int(message)
-        channels = get_channels()
-        if 0 <= channel_index < len(channels):
-            channel_name, channel_url = channels[channel_index]
+        if handle_listing_navigation(sender_id, message, state, interface):
+            return
+        channel_id = get_listing_item(state, message)
+        channel = get_channel(channel_id) if channel_id is not None else None
+        if channel:
+            channel_name, channel_url = channel
             send_message(f"Channel Name: {channel_name}\nChannel URL:\n{channel_url}", sender_id, interface)
         handle_channel_directory_command(sender_id, interface)
 
@@ -477,18 +423,10 @@ def handle_send_mail_command(sender_id, message, interface, bbs_nodes):
 def handle_check_mail_command(sender_id, interface):
     try:
         sender_node_id = get_node_id_from_num(sender_id, interface)
-        mail = get_mail(sender_node_id)
-        if not mail:
-            send_message("You have no new messages.", sender_id, interface)
-            return
-
-        response = "📬 You have the following messages:\n"
-        for i, msg in enumerate(mail):
-            response += f"{i + 1:02d}. From: {msg[1]}, Subject: {msg[2]}\n"
-        response += "\nPlease reply with the number of the message you want to read."
-        send_message(response, sender_id, interface)
-
-        update_user_state(sender_id, {'command': 'CHECK_MAIL', 'step': 1, 'mail': mail})
+        total, unread = get_mailbox_summary(sender_node_id)
+        listing = new_listing('mail', [sender_node_id], f"📬 You have {total} messages, {unread} unread (*):",
+                              "You have no new messages.", "Reply with a number to read.")
+        show_listing(sender_id, interface, listing, {'command': 'CHECK_MAIL', 'step': 1})
 
     except Exception as e:
         logging.error(f"Error processing check mail command: {e}")
@@ -497,23 +435,22 @@ def handle_check_mail_command(sender_id, interface):
 
 def handle_read_mail_command(sender_id, message, state, interface):
     try:
-        mail = state.get('mail', [])
-        message_number = int(message) - 1
+        if handle_listing_navigation(sender_id, message, state, interface):
+            return
 
-        if message_number < 0 or message_number >= len(mail):
+        mail_id = get_listing_item(state, message)
+        if mail_id is None:
             send_message("Invalid message number. Please try again.", sender_id, interface)
             return
 
-        mail_id = mail[message_number][0]
         sender_node_id = get_node_id_from_num(sender_id, interface)
         sender, date, subject, content, unique_id = get_mail_content(mail_id, sender_node_id)
+        mark_mail_read(mail_id, sender_node_id)
         response = f"Date: {date}\nFrom: {sender}\nSubject: {subject}\n\n{content}"
         send_message(response, sender_id, interface)
         send_message("What would you like to do with this message?\n[K]eep  [D]elete  [R]eply", sender_id, interface)
         update_user_state(sender_id, {'command': 'CHECK_MAIL', 'step': 2, 'mail_id': mail_id, 'unique_id': unique_id, 'sender': sender, 'subject': subject, 'content': content})
 
-    except ValueError:
-        send_message("Invalid input. Please enter a valid message number.", sender_id, interface)
     except Exception as e:
         logging.error(f"Error processing read mail command: {e}")
         send_message("Error processing read mail command.", sender_id, interface)
@@ -534,7 +471,8 @@ def handle_delete_mail_confirmation(sender_id, message, state, interface, bbs_no
         elif choice == 'r':
             sender = state['sender']
             send_message(f"Send your reply to {sender} now, followed by a message with END", sender_id, interface)
-            update_user_state(sender_id, {'command': 'MAIL', 'step': 7, 'reply_to_mail_id': state['mail_id'], 'subject': f"Re: {state['subject']}", 'content': ''})
+            update_user_state(sender_id, {'command': 'MAIL', 'step': 7, 'reply_to_mail_id': state['mail_id'], 'subject': f"Re: {state['subject']}"})
+            start_draft(sender_id)
         else:
             send_message("The message has been kept in your inbox.✉️", sender_id, interface)
             update_user_state(sender_id, None)
@@ -576,18 +514,9 @@ def handle_check_bulletin_command(sender_id, message, interface):
         board_name = parts[1].strip().capitalize() #get board name from quick command and capitalize it
         board_name = boards[next(key for key, value in boards.items() if value == board_name)] #search for board name in list
 
-        bulletins = get_bulletins(board_name)
-        if not bulletins:
-            send_message(f"No bulletins available on {board_name} board.", sender_id, interface)
-            return
-
-        response = f"📰 Bulletins on {board_name} board:\n"
-        for i, bulletin in enumerate(bulletins):
-            response += f"[{i+1:02d}] Subject: {bulletin[1]}, From: {bulletin[2]}, Date: {bulletin[3]}\n"
-        response += "\nPlease reply with the number of the bulletin you want to read."
-        send_message(response, sender_id, interface)
-
-        update_user_state(sender_id, {'command': 'CHECK_BULLETIN', 'step': 1, 'board_name': board_name, 'bulletins': bulletins})
+        listing = new_listing('bulletins', [board_name], f"📰 Bulletins on {board_name} board:",
+                              f"No bulletins available on {board_name} board.", "Reply with a number to read.")
+        show_listing(sender_id, interface, listing, {'command': 'CHECK_BULLETIN', 'step': 1, 'board_name': board_name})
 
     except Exception as e:
         logging.error(f"Error processing check bulletin command: {e}")
@@ -595,22 +524,20 @@ def handle_check_bulletin_command(sender_id, message, interface):
 
 def handle_read_bulletin_command(sender_id, message, state, interface):
     try:
-        bulletins = state.get('bulletins', [])
-        message_number = int(message) - 1
+        if handle_listing_navigation(sender_id, message, state, interface):
+            return
 
-        if message_number < 0 or message_number >= len(bulletins):
+        bulletin_id = get_listing_item(state, message)
+        if bulletin_id is None:
             send_message("Invalid bulletin number. Please try again.", sender_id, interface)
             return
 
-        bulletin_id = bulletins[message_number][0]
         sender, date, subject, content, unique_id = get_bulletin_content(bulletin_id)
         response = f"Date: {date}\nFrom: {sender}\nSubject: {subject}\n\n{content}"
         send_message(response, sender_id, interface)
 
         update_user_state(sender_id, None)
 
-    except ValueError:
-        send_message("Invalid input. Please enter a valid bulletin number.", sender_id, interface)
     except Exception as e:
         logging.error(f"Error processing read bulletin command: {e}")
         send_message("Error processing read bulletin command.", sender_id, interface)
@@ -635,18 +562,9 @@ def handle_post_channel_command(sender_id, message, interface):
 
 def handle_check_channel_command(sender_id, interface):
     try:
-        channels = get_channels()
-        if not channels:
-            send_message("No channels available in the directory.", sender_id, interface)
-            return
-
-        response = "Available Channels:\n"
-        for i, channel in enumerate(channels):
-            response += f"{i + 1:02d}. Name: {channel[0]}\n"
-        response += "\nPlease reply with the number of the channel you want to view."
-        send_message(response, sender_id, interface)
-
-        update_user_state(sender_id, {'command': 'CHECK_CHANNEL', 'step': 1, 'channels': channels})
+        listing = new_listing('channels', title="Available Channels:", empty="No channels available in the directory.",
+                              prompt="Reply with a number to view.")
+        show_listing(sender_id, interface, listing, {'command': 'CHECK_CHANNEL', 'step': 1})
 
     except Exception as e:
         logging.error(f"Error processing check channel command: {e}")
@@ -655,21 +573,21 @@ def handle_check_channel_command(sender_id, interface):
 
 def handle_read_channel_command(sender_id, message, state, interface):
     try:
-        channels = state.get('channels', [])
-        message_number = int(message) - 1
+        if handle_listing_navigation(sender_id, message, state, interface):
+            return
 
-        if message_number < 0 or message_number >= len(channels):
+        channel_id = get_listing_item(state, message)
+        channel = get_channel(channel_id) if channel_id is not None else None
+        if not channel:
             send_message("Invalid channel number. Please try again.", sender_id, interface)
             return
 
-        channel_name, channel_url = channels[message_number]
+        channel_name, channel_url = channel
         response = f"Channel Name: {channel_name}\nChannel URL: {channel_url}"
         send_message(response, sender_id, interface)
 
         update_user_state(sender_id, None)
 
-    except ValueError:
-        send_message("Invalid input. Please enter a valid channel number.", sender_id, interface)
     except Exception as e:
         logging.error(f"Error processing read channel command: {e}")
         send_message("Error processing read channel command.", sender_id, interface)
@@ -677,18 +595,9 @@ def handle_read_channel_command(sender_id, message, state, interface):
 
 def handle_list_channels_command(sender_id, interface):
     try:
-        channels = get_channels()
-        if not channels:
-            send_message("No channels available in the directory.", sender_id, interface)
-            return
-
-        response = "Available Channels:\n"
-        for i, channel in enumerate(channels):
-            response += f"{i+1:02d}. Name: {channel[0]}\n"
-        response += "\nPlease reply with the number of the channel you want to view."
-        send_message(response, sender_id, interface)
-
-        update_user_state(sender_id, {'command': 'LIST_CHANNELS', 'step': 1, 'channels': channels})
+        listing = new_listing('channels', title="Available Channels:", empty="No channels available in the directory.",
+                              prompt="Reply with a number to view.")
+        show_listing(sender_id, interface, listing, {'command': 'LIST_CHANNELS', 'step': 1})
 
     except Exception as e:
         logging.error(f"Error processing list channels command: {e}")
@@ -716,21 +625,13 @@ def handle_network_info_steps(sender_id, message, step, state, interface):
 
     if choice == 'n':
         # Nodes online
-        nodes = interface.nodes
-        total_nodes = len(nodes)
+        total_nodes = len(interface.nodes)
 
         response = f"📡 Mesh Network Status 📡\n\nTotal Nodes: {total_nodes}\n\nRecent Nodes:\n"
 
-        # Sort by last heard (most recent first)
-        sorted_nodes = sorted(nodes.items(),
-                            key=lambda x: x[1].get('lastHeard', 0) if isinstance(x[1], dict) else 0,
-                            reverse=True)
-
-        for i, (node_id, node_data) in enumerate(sorted_nodes[:10]):  # Show top 10
-            if isinstance(node_data, dict) and 'user' in node_data:
-                short_name = node_data['user'].get('shortName', 'UNK')
-                long_name = node_data['user'].get('longName', 'Unknown')
-                response += f"{i+1}. {short_name} - {long_name}\n"
+        # Most recently heard first, top 10
+        for i, (last_heard, short_name, long_name, snr) in enumerate(get_node_stats(interface).most_recent(10)):
+            response += f"{i+1}. {short_name or 'UNK'} - {long_name or 'Unknown'}\n"
 
         if total_nodes > 10:
             response += f"\n...and {total_nodes - 10} more nodes"
@@ -742,20 +643,11 @@ def handle_network_info_steps(sender_id, message, step, state, interface):
         # Signal reports
         response = "📶 Signal Reports 📶\n\nRecent SNR readings:\n"
 
-        nodes = interface.nodes
-        signal_nodes = []
+        # Best SNR first
+        signal_nodes = get_node_stats(interface).top_snr(10)
 
-        for node_id, node_data in nodes.items():
-            if isinstance(node_data, dict) and 'snr' in node_data:
-                short_name = node_data.get('user', {}).get('shortName', 'UNK')
-                snr = node_data.get('snr', 0)
-                signal_nodes.append((short_name, snr))
-
-        # Sort by SNR (best first)
-        signal_nodes.sort(key=lambda x: x[1], reverse=True)
-
-        for i, (name, snr) in enumerate(signal_nodes[:10]):
-            response += f"{name}: {snr:.1f} dB\n"
+        for snr, short_name, long_name in signal_nodes:
+            response += f"{short_name or 'UNK'}: {snr:.1f} dB\n"
 
         if not signal_nodes:
             response = "No signal data available yet."
@@ -765,22 +657,17 @@ def handle_network_info_steps(sender_id, message, step, state, interface):
 
     elif choice == 'm':
         # Mesh health
-        nodes = interface.nodes
-        total = len(nodes)
+        total = len(interface.nodes)
 
         response = f"🏥 Mesh Health 🏥\n\n"
         response += f"Total Nodes: {total}\n"
 
         # Count by hardware type
-        hw_types = {}
-        for node_id, node_data in nodes.items():
-            if isinstance(node_data, dict) and 'user' in node_data:
-                hw = node_data['user'].get('hwModel', 'UNKNOWN')
-                hw_types[hw] = hw_types.get(hw, 0) + 1
+        hw_types = get_node_stats(interface).hardware_models()
 
         response += f"\nHardware Types:\n"
-        for hw, count in sorted(hw_types.items(), key=lambda x: x[1], reverse=True)[:5]:
-            response += f"{hw}: {count}\n"
+        for hw, count in sorted(hw_types, key=lambda x: x[1], reverse=True)[:5]:
+            response += f"{hw or 'UNKNOWN'}: {count}\n"
 
         send_message(response, sender_id, interface)
         update_user_state(sender_id, None)
@@ -880,38 +767,18 @@ def handle_weather_steps(sender_id, message, step, state, interface):
             send_message("Invalid ZIP code. Please enter a 5-digit ZIP code.", sender_id, interface)
             return
 
-        try:
-            api_key = "b5f7bc717799c13af6c652a35002edd6"
-            country_code = "us"
-
-            # Get current weather
-            url = f"http://api.openweathermap.org/data/2.5/weather?zip={zip_code},{country_code}&appid={api_key}&units=imperial"
-            response = requests.get(url, timeout=5)
-
-            if response.status_code == 200:
-                data = response.json()
-
-                temp = data["main"]["temp"]
-                feels_like = data["main"]["feels_like"]
-                humidity = data["main"]["humidity"]
-                conditions = data["weather"][0]["description"].title()
-                city = data["name"]
-                state_code = data.get("sys", {}).get("country", "")
-
-                weather_msg = (f"☁️ {city} Weather ☁️\n\n"
-                              f"Temp: {temp:.0f}°F (feels {feels_like:.0f}°F)\n"
-                              f"Conditions: {conditions}\n"
-                              f"Humidity: {humidity}%")
-
+        def reply(status, weather_msg):
+            if status == STATUS_OK:
                 send_message(weather_msg, sender_id, interface)
-            elif response.status_code == 404:
+            elif status == STATUS_NOT_FOUND:
                 send_message("ZIP code not found. Please try again.", sender_id, interface)
-            else:
+            elif status == STATUS_UNAVAILABLE:
                 send_message("Unable to get weather at this time.", sender_id, interface)
+            else:
+                send_message("Weather service unavailable.", sender_id, interface)
 
-        except Exception as e:
-            logging.error(f"Error getting weather: {e}")
-            send_message("Weather service unavailable.", sender_id, interface)
+        # The lookup runs on the weather worker thread; reply() sends the result when it is ready
+        get_weather_service().request(zip_code, reply)
 
         update_user_state(sender_id, None)
 
@@ -921,18 +788,12 @@ def handle_weather_steps(sender_id, message, step, state, interface):
 def handle_trivia_command(sender_id, interface):
     """Start trivia game"""
     try:
-        with open('trivia.txt', 'r') as file:
-            questions = [line.strip() for line in file.readlines() if line.strip()]
-
-        if not questions:
+        entry = content_corpus.get_trivia_deck().draw(sender_id)
+        if not entry:
             send_message("No trivia questions available.", sender_id, interface)
             return
 
-        question_line = random.choice(questions)
-        parts = question_line.split('|')
-        question = parts[0]
-        answer = parts[1]
-        category = parts[2] if len(parts) > 2 else 'A'
+        question, answer, category = entry
 
         response = f"🎯 Meshtastic Trivia 🎯\n\n{question}\n\nReply with your answer!"
         send_message(response, sender_id, interface)
@@ -1023,26 +884,16 @@ def handle_propagation_steps(sender_id, message, step, state, interface):
 def handle_snr_leaderboard(sender_id, interface):
     """Show SNR leaderboard"""
     try:
-        # Collect SNR data from nodes
-        snr_data = []
-        for node_id, node_info in interface.nodes.items():
-            if 'snr' in node_info:
-                snr = node_info['snr']
-                name = node_info['user'].get('longName', 'Unknown')
-                short_name = node_info['user'].get('shortName', 'Unknown')
-                snr_data.append((snr, short_name, name))
+        # Top 10, best SNR first
+        snr_data = get_node_stats(interface).top_snr(10)
 
         if not snr_data:
             send_message("No SNR data available yet.", sender_id, interface)
             return
 
-        # Sort by SNR (best first)
-        snr_data.sort(reverse=True, key=lambda x: x[0])
-
-        # Top 10
         response = "📶 SNR Leaderboard 📶\n\nBest Signals:\n"
-        for i, (snr, short, name) in enumerate(snr_data[:10], 1):
-            response += f"{i}. {short} - {snr:.1f} dB\n"
+        for i, (snr, short, name) in enumerate(snr_data, 1):
+            response += f"{i}. {short or 'Unknown'} - {snr:.1f} dB\n"
 
         send_message(response, sender_id, interface)
     except Exception as e:
@@ -1147,27 +998,18 @@ def handle_channel_activity(sender_id, interface):
 def handle_top_nodes(sender_id, interface):
     """Show most active nodes"""
     try:
-        # Sort by lastHeard to find most recently active
-        recent_nodes = []
+        # The 10 most recently heard nodes
+        recent_nodes = get_node_stats(interface).most_recent(10)
         current_time = int(time.time())
 
-        for node_id, node_info in interface.nodes.items():
-            if 'lastHeard' in node_info:
-                last_heard = node_info['lastHeard']
-                minutes_ago = (current_time - last_heard) / 60
-                name = node_info['user'].get('shortName', 'Unknown')
-                snr = node_info.get('snr', 0)
-                recent_nodes.append((last_heard, name, snr, minutes_ago))
-
         if not recent_nodes:
             send_message("No activity data available.", sender_id, interface)
             return
 
-        # Sort by most recent
-        recent_nodes.sort(reverse=True)
-
         response = "⭐ Most Active Nodes ⭐\n\nRecent Activity:\n"
-        for i, (timestamp, name, snr, mins) in enumerate(recent_nodes[:10], 1):
+        for i, (last_heard, short_name, long_name, snr) in enumerate(recent_nodes, 1):
+            name = short_name or 'Unknown'
+            mins = (current_time - last_heard) / 60
             if mins < 1:
                 time_str = "Just now"
             elif mins < 60:
@@ -1252,11 +1094,8 @@ def handle_prop_node_input_steps(sender_id, message, step, state, interface):
     import time
     
     # Find node by short name
-    node_id = None
-    for nid, node_info in interface.nodes.items():
-        if node_info['user'].get('shortName', '').lower() == message.lower().strip():
-            node_id = nid
-            break
+    nodes = get_node_info(interface, message.lower().strip())
+    node_id = nodes[0]['num'] if nodes else None
     
     if node_id:
         stats = get_node_reliability(node_id)
@@ -0,0 +1,117 @@
+from operator import itemgetter
+
+
+class Route:
+    """
+    A registered handler and the arguments it takes.
+
+    Handlers are called as ``handler(sender_id, [message], [step], [state], interface, [bbs_nodes])``,
+    with each optional argument included only when the route asks for it. ``step`` may be
+    a fixed number to pass instead of the step in the user state. A route with
+    ``handles_exit`` also sees the X (exit) command instead of it returning to the menu.
+    """
+
+    __slots__ = ('handler', 'step', 'handles_exit', '_pick')
+
+    def __init__(self, handler, with_message=True, with_step=False, step=None, with_state=False,
+                 with_bbs_nodes=False, handles_exit=False):
+        self.handler = handler
+        self.step = step
+        self.handles_exit = handles_exit
+        # Positions in (sender_id, message, step, state, interface, bbs_nodes) of the arguments to pass
+        wanted = (True, with_message, with_step or step is not None, with_state, True, with_bbs_nodes)
+        self._pick = itemgetter(*(i for i, want in enumerate(wanted) if want))
+
+    def __call__(self, sender_id, message, step, state, interface, bbs_nodes):
+        if self.step is not None:
+            step = self.step
+        return self.handler(*self._pick((sender_id, message, step, state, interface, bbs_nodes)))
+
+
+# Quick commands such as "sm,," by prefix, as a trie of characters; a node's route is under None
+prefix_routes = {}
+# Routes for users part way through a command, by (state command, step); step None matches any step
+step_routes = {}
+step_commands = set()
+# Single-letter menus, by menu name for MENU states or by state command otherwise
+menus = {}
+DEFAULT_MENU = 'main'
+
+
+def register_prefix(prefix, handler, **options):
+    """Route messages starting with ``prefix`` (lower case) to ``handler``, whatever state the user is in."""
+    node = prefix_routes
+    for char in prefix:
+        node = node.setdefault(char, {})
+    node[None] = Route(handler, **options)
+
+
+def register_step(command, handler, step=None, **options):
+    """Route messages from users whose state command is ``command`` (at ``step``, or any step if None)."""
+    step_routes[(command, step)] = Route(handler, **options)
+    step_commands.add(command)
+
+
+def register_menu(name, handlers, with_state=False):
+    """Register a menu of ``{letter: handler(sender_id, interface[, state])}``."""
+    menus[name] = (handlers, with_state)
+
+
+def match_prefix(text):
+    node = prefix_routes
+    for char in text:
+        node = node.get(char)
+        if node is None:
+            return None
+        if None in node:
+            return node[None]
+    return None
+
+
+def dispatch(sender_id, message, interface, state, fallback):
+    """
+    Route a direct message from a user.
+
+    Quick commands win, then the route for the user's current command and step, then
+    the letters of the menu the user is in; anything else goes to ``fallback(sender_id, interface)``.
+    """
+    message_lower = message.lower().strip()
+    # Handle repeated characters for single character commands using a prefix
+    if len(message_lower) == 2 and message_lower[1] == 'x':
+        message_lower = message_lower[0]
+    bbs_nodes = interface.bbs_nodes
+
+    route = match_prefix(message_lower)
+    if route is not None:
+        route(sender_id, message.strip(), None, state, interface, bbs_nodes)
+        return
+
+    command = state['command'] if state else None
+    step = state.get('step') if state else None
+    route = step_routes.get((command, step)) or step_routes.get((command, None))
+    if route is not None and route.handles_exit:
+        route(sender_id, message, step, state, interface, bbs_nodes)
+        return
+
+    if message_lower == 'x':
+        # Reset to main menu state
+        fallback(sender_id, interface)
+        return
+
+    # Submenu steps have priority over menu letters
+    if route is not None:
+        route(sender_id, message, step, state, interface, bbs_nodes)
+        return
+    if command in step_commands:
+        # The command has no route for this step
+        return
+
+    menu = state['menu'] if command == 'MENU' else command
+    handlers, with_state = menus.get(menu) or menus[DEFAULT_MENU]
+    handler = handlers.get(message_lower)
+    if handler is None:
+        fallback(sender_id, interface)
+    elif with_state:
+        handler(sender_id, interface, state)
+    else:
+        handler(sender_id, interface)
@@ -0,0 +1,178 @@
+import configparser
+import logging
+import os
+import threading
+from collections import namedtuple
+
+MENU_TITLES = {
+    'main': "💾Wildcat TC² BBS💾",
+    'bbs': "📰BBS Menu📰",
+    'utilities': "🛠️Utilities Menu🛠️",
+}
+DEFAULT_MENU_ITEMS = {
+    'main': "Q, B, U, X",
+    'bbs': "M, B, C, J, X",
+    'utilities': "S, F, W, X",
+}
+MENU_LABELS = {
+    'N': "[N]etwork Info",
+    'R': "[R]esources",
+    'B': "[B]ulletins",
+    'U': "[U]tilities",
+    'X': "E[X]IT",
+    'M': "[M]ail",
+    'C': "[C]hannel Dir",
+    'J': "[J]S8CALL",
+    'S': "[S]tats",
+    'F': "[F]ortune",
+    'G': "[G]ames",
+}
+# Letters whose label depends on the menu
+MENU_LABELS_BY_MENU = {
+    'W': {'utilities': "[W]all of Shame", None: "[W]eather"},
+    'Q': {'utilities': "[Q]uick Commands", None: "[Q]uote"},
+}
+
+# An immutable view of config.ini; a reload replaces the whole snapshot
+ConfigSnapshot = namedtuple('ConfigSnapshot', ['config', 'bbs_nodes', 'allowed_nodes', 'menus'])
+
+
+def render_menu(menu, items):
+    """The option lines of a menu, one per configured letter; unknown letters are left out."""
+    lines = []
+    for item in items:
+        letter = item.strip()
+        if letter in MENU_LABELS_BY_MENU:
+            labels = MENU_LABELS_BY_MENU[letter]
+            lines.append(labels.get(menu, labels[None]))
+        elif letter in MENU_LABELS:
+            lines.append(MENU_LABELS[letter])
+    return ''.join(f"{line}\n" for line in lines)
+
+
+def _node_list(config, section, option):
+    nodes = config.get(section, option, fallback='').split(',')
+    return () if nodes == [''] else tuple(nodes)
+
+
+def load_snapshot(path):
+    config = configparser.ConfigParser()
+    if not config.read(path):
+        raise FileNotFoundError(path)
+    menus = {
+        menu: render_menu(menu, config.get('menu', f"{menu}_menu_items", fallback=DEFAULT_MENU_ITEMS[menu]).split(','))
+        for menu in MENU_TITLES
+    }
+    return ConfigSnapshot(config, _node_list(config, 'sync', 'bbs_nodes'),
+                          _node_list(config, 'allow_list', 'allowed_nodes'), menus)
+
+
+class ConfigService:
+    """
+    The current configuration snapshot, reloaded when config.ini changes.
+
+    A thread polls the file's modification time every ``interval`` seconds. A file that
+    has changed and then stayed the same for one more poll is parsed into a new snapshot,
+    with menus already rendered, which replaces the current one in a single assignment,
+    so readers always see one consistent version. Subscribers are then called with the
+    new snapshot. A file that fails to parse leaves the current snapshot in place.
+    """
+
+    def __init__(self, path='config.ini', interval=None):
+        self.path = path
+        self._signature = self._stat()
+        self._snapshot = load_snapshot(path)
+        if interval is None:
+            interval = self._snapshot.config.getint('config', 'reload_interval', fallback=5)
+        self.interval = interval
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.reloads = 0
+        self.failures = 0
+
+    def snapshot(self):
+        return self._snapshot
+
+    def subscribe(self, callback):
+        """Call ``callback(snapshot)`` after every reload."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def start(self):
+        if self._thread is not None or not self.interval:
+            return
+        self._thread = threading.Thread(target=self._run, name='config-reload', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def reload(self):
+        """Load the file now and notify subscribers. Returns False if it could not be loaded."""
+        signature = self._stat()
+        try:
+            snapshot = load_snapshot(self.path)
+        except (OSError, configparser.Error) as e:
+            self.failures += 1
+            logging.error(f"Keeping the current configuration, {self.path} could not be loaded: {e}")
+            self._signature = signature
+            return False
+        self._snapshot = snapshot
+        self._signature = signature
+        self.reloads += 1
+        logging.info(f"Reloaded {self.path}: {len(snapshot.bbs_nodes)} BBS node(s), "
+                     f"{len(snapshot.allowed_nodes)} allowed node(s)")
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logging.error(f"Configuration subscriber {getattr(callback, '__name__', callback)} failed: {e}")
+        return True
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _run(self):
+        pending = None
+        while not self._stop.wait(self.interval):
+            signature = self._stat()
+            if signature == self._signature:
+                pending = None
+            elif signature == pending:
+                # Unchanged since the last poll, so the file is not still being written
+                self.reload()
+            else:
+                pending = signature
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_config_service(path='config.ini'):
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ConfigService(path)
+        return _service
+
+
+def get_config():
+    """The current configuration snapshot."""
+    return get_config_service().snapshot()
+
+
+def shutdown_config_service():
+    if _service is not None:
+        _service.stop()
@@ -0,0 +1,190 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from config_service import get_config_service
+
+
+def parse_fortunes(lines):
+    return tuple(line.strip() for line in lines if line.strip())
+
+
+def parse_trivia(lines):
+    """Parse 'question|answer|category' lines into (question, answer, category) tuples."""
+    questions = []
+    for line in lines:
+        parts = line.strip().split('|')
+        if len(parts) < 2:
+            continue
+        questions.append((parts[0], parts[1], parts[2] if len(parts) > 2 else 'A'))
+    return tuple(questions)
+
+
+class ContentPack:
+    """
+    One content file parsed into an immutable tuple.
+
+    The file is only re-read when its mtime changes, and the mtime itself is checked
+    at most once every ``check_interval`` seconds.
+    """
+
+    def __init__(self, name, path, parser, check_interval=5.0):
+        self.name = name
+        self.path = path
+        self.parser = parser
+        self.check_interval = check_interval
+        self.entries = ()
+        self.generation = 0
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self._reload_if_changed()
+        return self.entries
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            if self._mtime is not None:
+                logging.error(f"Content pack '{self.name}' unavailable: {e}")
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, 'r', encoding='utf-8') as file:
+                    entries = self.parser(file.readlines())
+            except (OSError, UnicodeDecodeError) as e:
+                logging.error(f"Error loading content pack '{self.name}' from {self.path}: {e}")
+                return
+            self.entries = entries
+            self._mtime = mtime
+            self.generation += 1
+            logging.info(f"Loaded {len(entries)} entries from content pack '{self.name}' ({self.path})")
+
+
+class Corpus:
+    """A set of selectable content packs of one kind (fortunes, trivia, ...)."""
+
+    def __init__(self, packs):
+        self.packs = OrderedDict((pack.name, pack) for pack in packs)
+        self._combined = ()
+        self._combined_key = None
+
+    def pack_names(self):
+        return list(self.packs)
+
+    def entries(self, pack=None):
+        """Entries of one pack, or of every pack combined when ``pack`` is None."""
+        if pack is not None:
+            selected = self.packs.get(pack)
+            return selected.get() if selected else ()
+        for p in self.packs.values():
+            p.get()
+        key = tuple(p.generation for p in self.packs.values())
+        if key != self._combined_key:
+            self._combined = tuple(entry for p in self.packs.values() for entry in p.entries)
+            self._combined_key = key
+        return self._combined
+
+    def random(self, pack=None):
+        entries = self.entries(pack)
+        if not entries:
+            return None
+        return entries[random.randrange(len(entries))]
+
+
+class ShuffleDeck:
+    """
+    Per-user non-repeating draws from a corpus.
+
+    Each user gets their own shuffled order of entry indices and draws from it until
+    it is exhausted (or the corpus is reloaded), then gets a fresh shuffle. Only the
+    ``max_users`` most recently active decks are kept.
+    """
+
+    def __init__(self, corpus, max_users=1000):
+        self.corpus = corpus
+        self.max_users = max_users
+        self._decks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def draw(self, user_id, pack=None):
+        entries = self.corpus.entries(pack)
+        if not entries:
+            return None
+        key = (user_id, pack)
+        with self._lock:
+            deck = self._decks.pop(key, None)
+            if deck is None or deck[0] is not entries or not deck[1]:
+                order = list(range(len(entries)))
+                random.shuffle(order)
+                deck = (entries, order)
+            self._decks[key] = deck
+            while len(self._decks) > self.max_users:
+                self._decks.popitem(last=False)
+            return entries[deck[1].pop()]
+
+
+def _pack_paths(config, option, default):
+    return tuple(path.strip() for path in config.get('content', option, fallback=default).split(',') if path.strip())
+
+
+def _corpus(paths, parser):
+    return Corpus([ContentPack(os.path.splitext(os.path.basename(path))[0], path, parser) for path in paths])
+
+
+_fortunes = None
+_trivia_deck = None
+_pack_lists = None
+_corpora_lock = threading.Lock()
+_load_lock = threading.Lock()
+
+
+def _load_corpora(snapshot):
+    """(Re)build the corpora when the configured pack lists differ from the ones in use."""
+    global _fortunes, _trivia_deck, _pack_lists
+    pack_lists = (_pack_paths(snapshot.config, 'fortune_packs', 'fortunes.txt'),
+                  _pack_paths(snapshot.config, 'trivia_packs', 'trivia.txt'))
+    with _corpora_lock:
+        if pack_lists == _pack_lists:
+            return
+        if _pack_lists is not None:
+            logging.info(f"Content packs changed, now serving fortunes from {', '.join(pack_lists[0])} "
+                         f"and trivia from {', '.join(pack_lists[1])}")
+        previous = _pack_lists or ((), ())
+        if pack_lists[0] != previous[0] or _fortunes is None:
+            _fortunes = _corpus(pack_lists[0], parse_fortunes)
+        # Players' trivia decks are only reshuffled when the trivia packs themselves changed
+        if pack_lists[1] != previous[1] or _trivia_deck is None:
+            _trivia_deck = ShuffleDeck(_corpus(pack_lists[1], parse_trivia))
+        _pack_lists = pack_lists
+
+
+def _ensure_loaded():
+    """Build the corpora from the config on first use and rebuild them whenever it is reloaded."""
+    with _load_lock:
+        if _pack_lists is None:
+            service = get_config_service()
+            _load_corpora(service.snapshot())
+            service.subscribe(_load_corpora)
+
+
+def get_fortunes():
+    _ensure_loaded()
+    return _fortunes
+
+
+def get_trivia_deck():
+    _ensure_loaded()
+    return _trivia_deck
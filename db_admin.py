@@ -1,13 +1,11 @@
 import os
-import sqlite3
-import threading
+import time
+
+from db_manager import get_connection
 
-thread_local = threading.local()
 
 def get_db_connection():
-    if not hasattr(thread_local, 'connection'):
-        thread_local.connection = sqlite3.connect('bulletins.db')
-    return thread_local.connection
+    return get_connection()
 
 def initialize_database():
     conn = get_db_connection()
@@ -36,6 +34,12 @@ def initialize_database():
                     name TEXT NOT NULL,
                     url TEXT NOT NULL
                 );''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sync_tombstones (
+                    kind TEXT NOT NULL,
+                    unique_id TEXT NOT NULL,
+                    deleted_at REAL NOT NULL,
+                    PRIMARY KEY (kind, unique_id)
+                );''')
     conn.commit()
 
 def list_bulletins():
@@ -91,6 +95,9 @@ def delete_bulletin():
         conn = get_db_connection()
         c = conn.cursor()
         for bulletin_id in bulletin_ids:
+            # Tombstone the bulletin so peer BBS nodes do not sync it back
+            c.execute("INSERT OR REPLACE INTO sync_tombstones (kind, unique_id, deleted_at) "
+                      "SELECT 'BULLETIN', unique_id, ? FROM bulletins WHERE id = ?", (time.time(), bulletin_id.strip()))
             c.execute("DELETE FROM bulletins WHERE id = ?", (bulletin_id.strip(),))
         conn.commit()
         print_bold(f"Bulletin(s) with ID(s) {', '.join(bulletin_ids)} deleted.")
@@ -107,6 +114,8 @@ def delete_mail():
         conn = get_db_connection()
         c = conn.cursor()
         for mail_id in mail_ids:
+            c.execute("INSERT OR REPLACE INTO sync_tombstones (kind, unique_id, deleted_at) "
+                      "SELECT 'MAIL', unique_id, ? FROM mail WHERE id = ?", (time.time(), mail_id.strip()))
             c.execute("DELETE FROM mail WHERE id = ?", (mail_id.strip(),))
         conn.commit()
         print_bold(f"Mail with ID(s) {', '.join(mail_ids)} deleted.")
@@ -0,0 +1,250 @@
+import configparser
+import logging
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB_PATH = 'bulletins.db'
+
+DEFAULT_SETTINGS = {
+    'path': DEFAULT_DB_PATH,
+    'busy_timeout_ms': 5000,
+    'cache_size_kb': 8192,
+    'mmap_size_mb': 64,
+    'checkpoint_interval': 300,
+    'log_batch_rows': 50,
+    'log_batch_ms': 2000
+}
+
+thread_local = threading.local()
+_settings = None
+_settings_lock = threading.Lock()
+
+
+def load_settings(config=None):
+    """
+    Read the [database] section of the config, falling back to defaults.
+
+    The BBS and db_admin read ./config.ini; the telemetry logger passes in the config it
+    has already loaded from its own location.
+    """
+    global _settings
+    if config is None:
+        config = configparser.ConfigParser()
+        config.read('config.ini')
+    settings = dict(DEFAULT_SETTINGS)
+    settings['path'] = config.get('database', 'path', fallback=settings['path'])
+    for key in ('busy_timeout_ms', 'cache_size_kb', 'mmap_size_mb', 'checkpoint_interval',
+                'log_batch_rows', 'log_batch_ms'):
+        settings[key] = config.getint('database', key, fallback=settings[key])
+    with _settings_lock:
+        _settings = settings
+    return settings
+
+
+def get_settings():
+    if _settings is None:
+        return load_settings()
+    return _settings
+
+
+def open_connection(db_path=None):
+    """Open a new connection with the shared WAL/pragma configuration applied."""
+    settings = get_settings()
+    db_path = db_path or settings['path']
+    conn = sqlite3.connect(db_path, timeout=settings['busy_timeout_ms'] / 1000)
+    conn.execute(f"PRAGMA busy_timeout = {int(settings['busy_timeout_ms'])}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{int(settings['cache_size_kb'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['mmap_size_mb']) * 1024 * 1024}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def get_connection(db_path=None):
+    """Return this thread's connection to ``db_path``, opening it on first use."""
+    db_path = db_path or get_settings()['path']
+    connections = getattr(thread_local, 'connections', None)
+    if connections is None:
+        connections = thread_local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = open_connection(db_path)
+    return conn
+
+
+def close_connection(db_path=None):
+    db_path = db_path or get_settings()['path']
+    connections = getattr(thread_local, 'connections', {})
+    conn = connections.pop(db_path, None)
+    if conn is not None:
+        conn.close()
+
+
+class Checkpointer:
+    """Background thread that periodically checkpoints the WAL back into the main database file."""
+
+    def __init__(self, db_path=None, interval=None):
+        settings = get_settings()
+        self.db_path = db_path or settings['path']
+        self.interval = interval if interval is not None else settings['checkpoint_interval']
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='db-checkpoint', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.checkpoint()
+
+    def checkpoint(self, mode='PASSIVE'):
+        try:
+            conn = get_connection(self.db_path)
+            busy, log_pages, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+            logging.debug(f"WAL checkpoint {self.db_path}: busy={busy} log={log_pages} checkpointed={checkpointed}")
+        except sqlite3.Error as e:
+            logging.error(f"WAL checkpoint failed for {self.db_path}: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.checkpoint()
+        close_connection(self.db_path)
+
+
+class BatchWriter:
+    """
+    Background group-commit writer.
+
+    Callers queue ``(sql, params)`` rows with ``add`` and return immediately. A writer
+    thread flushes the pending rows every ``flush_rows`` rows or ``flush_ms``
+    milliseconds, whichever comes first, using one ``executemany`` per statement inside
+    a single transaction. Rows for the same statement are written in the order they were
+    added. Pending rows are flushed on ``stop``.
+    """
+
+    def __init__(self, db_path=None, flush_rows=50, flush_ms=1000, max_pending=10000, name='batch-writer'):
+        self.db_path = db_path
+        self.flush_rows = max(1, flush_rows)
+        self.flush_ms = max(1, flush_ms)
+        self.max_pending = max_pending
+        self.name = name
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_failed = 0
+        self.batches = 0
+        self.flush_ms_total = 0.0
+        self.flush_ms_max = 0.0
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def add(self, sql, params):
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self.rows_dropped += 1
+                if self.rows_dropped % 1000 == 1:
+                    logging.error(f"{self.name}: {len(self._pending)} rows pending, dropping writes")
+                return False
+            self._pending.append((sql, params))
+            if len(self._pending) >= self.flush_rows:
+                self._cond.notify()
+        return True
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self):
+        return {
+            'pending': self.pending(),
+            'rows_written': self.rows_written,
+            'rows_dropped': self.rows_dropped,
+            'rows_failed': self.rows_failed,
+            'batches': self.batches,
+            'avg_flush_ms': self.flush_ms_total / self.batches if self.batches else 0.0,
+            'max_flush_ms': self.flush_ms_max
+        }
+
+    def stop(self):
+        if not self._running:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=30)
+        logging.info(f"{self.name} stopped: {self.stats()}")
+
+    def _take(self):
+        with self._cond:
+            deadline = time.monotonic() + self.flush_ms / 1000
+            while self._running and len(self._pending) < self.flush_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            rows, self._pending = self._pending, []
+            return rows
+
+    def _run(self):
+        while True:
+            running = self._running
+            rows = self._take()
+            if rows:
+                self.flush(rows)
+            if not running and not self.pending():
+                break
+        close_connection(self.db_path)
+
+    def flush(self, rows):
+        statements = {}
+        for sql, params in rows:
+            statements.setdefault(sql, []).append(params)
+
+        started = time.perf_counter()
+        conn = get_connection(self.db_path)
+        try:
+            with conn:
+                for sql, param_rows in statements.items():
+                    conn.executemany(sql, param_rows)
+        except sqlite3.IntegrityError as e:
+            # One bad row should not cost the whole batch; fall back to writing rows individually
+            logging.warning(f"{self.name}: batch of {len(rows)} rows rejected ({e}), retrying row by row")
+            self._flush_rows_individually(conn, rows)
+            return
+        except sqlite3.Error as e:
+            self.rows_failed += len(rows)
+            logging.error(f"{self.name}: failed to write batch of {len(rows)} rows: {e}")
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.rows_written += len(rows)
+        self.batches += 1
+        self.flush_ms_total += elapsed_ms
+        self.flush_ms_max = max(self.flush_ms_max, elapsed_ms)
+
+    def _flush_rows_individually(self, conn, rows):
+        for sql, params in rows:
+            try:
+                with conn:
+                    conn.execute(sql, params)
+                self.rows_written += 1
+            except sqlite3.Error as e:
+                self.rows_failed += 1
+                logging.error(f"{self.name}: dropping row: {e}")
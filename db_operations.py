@@ -1,11 +1,15 @@
+import hashlib
 import logging
 import sqlite3
 import threading
+import time
 import uuid
 from datetime import datetime
 
 from meshtastic import BROADCAST_NUM
 
+from db_manager import BatchWriter, get_connection, get_settings
+from send_queue import PRIORITY_URGENT
 from utils import (
     send_bulletin_to_bbs_nodes,
     send_delete_bulletin_to_bbs_nodes,
@@ -14,12 +18,8 @@ from utils import (
 )
 
 
-thread_local = threading.local()
-
 def get_db_connection():
-    if not hasattr(thread_local, 'connection'):
-        thread_local.connection = sqlite3.connect('bulletins.db')
-    return thread_local.connection
+    return get_connection()
 
 def initialize_database():
     conn = get_db_connection()
@@ -61,24 +61,183 @@ def initialize_database():
                     hop_limit INTEGER
                 );''')
     conn.commit()
+    apply_migrations(conn)
     print("Database schema initialized.")
 
+
+# Forward-only schema migrations, applied in order at startup. Each entry is
+# (version, description, [SQL statements]); append new migrations to the end.
+MIGRATIONS = [
+    (1, "Add lookup indexes and unique message ids", [
+        "DELETE FROM bulletins WHERE id NOT IN (SELECT MIN(id) FROM bulletins GROUP BY unique_id)",
+        "DELETE FROM mail WHERE id NOT IN (SELECT MIN(id) FROM mail GROUP BY unique_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_bulletins_unique_id ON bulletins (unique_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_mail_unique_id ON mail (unique_id)",
+        "CREATE INDEX IF NOT EXISTS idx_bulletins_board ON bulletins (board COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_mail_recipient ON mail (recipient)",
+        "CREATE INDEX IF NOT EXISTS idx_message_logs_timestamp ON message_logs (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_message_logs_sender_timestamp ON message_logs (sender_id, timestamp)",
+    ]),
+    (2, "Add hourly and daily message_logs rollups", [
+        f"""CREATE TABLE IF NOT EXISTS {table} (
+                bucket INTEGER NOT NULL,
+                sender_id TEXT NOT NULL,
+                sender_short_name TEXT,
+                msg_count INTEGER NOT NULL DEFAULT 0,
+                snr_count INTEGER NOT NULL DEFAULT 0,
+                snr_sum REAL NOT NULL DEFAULT 0,
+                snr_min REAL,
+                snr_max REAL,
+                rssi_count INTEGER NOT NULL DEFAULT 0,
+                rssi_sum REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket, sender_id)
+            )""" for table in ('message_log_hourly', 'message_log_daily')
+    ] + [
+        "CREATE INDEX IF NOT EXISTS idx_message_log_hourly_sender ON message_log_hourly (sender_id, bucket)",
+        "CREATE INDEX IF NOT EXISTS idx_message_log_daily_sender ON message_log_daily (sender_id, bucket)",
+    ] + [
+        f"""INSERT INTO {table} (bucket, sender_id, sender_short_name, msg_count, snr_count, snr_sum, snr_min, snr_max, rssi_count, rssi_sum)
+            SELECT (timestamp / {size}) * {size}, sender_id, MAX(sender_short_name), COUNT(*),
+                   COUNT(snr), COALESCE(SUM(snr), 0), MIN(snr), MAX(snr), COUNT(rssi), COALESCE(SUM(rssi), 0)
+            FROM message_logs GROUP BY 1, 2""" for table, size in (('message_log_hourly', 3600), ('message_log_daily', 86400))
+    ]),
+    (3, "Add weather lookup cache", [
+        """CREATE TABLE IF NOT EXISTS weather_cache (
+                zip TEXT PRIMARY KEY,
+                fetched_at REAL NOT NULL,
+                status TEXT NOT NULL,
+                message TEXT
+            )""",
+    ]),
+    (4, "Add peer sync outbox", [
+        """CREATE TABLE IF NOT EXISTS sync_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                peer TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                item_key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                message_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL
+            )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_sync_outbox_item ON sync_outbox (peer, kind, item_key)",
+        "CREATE INDEX IF NOT EXISTS idx_sync_outbox_message ON sync_outbox (peer, message_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sync_outbox_due ON sync_outbox (next_attempt)",
+    ]),
+    (5, "Deduplicate channels and add a unique index", [
+        "DELETE FROM channels WHERE id NOT IN (SELECT MIN(id) FROM channels GROUP BY name, url)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_channels_name_url ON channels (name, url)",
+    ]),
+    (6, "Add tombstones for deleted bulletins and mail", [
+        """CREATE TABLE IF NOT EXISTS sync_tombstones (
+                kind TEXT NOT NULL,
+                unique_id TEXT NOT NULL,
+                deleted_at REAL NOT NULL,
+                PRIMARY KEY (kind, unique_id)
+            )""",
+        "CREATE INDEX IF NOT EXISTS idx_sync_tombstones_deleted ON sync_tombstones (deleted_at)",
+    ]),
+    (7, "Add saved user sessions with unfinished drafts", [
+        """CREATE TABLE IF NOT EXISTS user_sessions (
+                user_id INTEGER PRIMARY KEY,
+                state TEXT NOT NULL,
+                draft TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )""",
+    ]),
+    (8, "Add read flags and per-recipient mailbox counters kept by triggers", [
+        "ALTER TABLE mail ADD COLUMN is_read INTEGER NOT NULL DEFAULT 0",
+        """CREATE TABLE IF NOT EXISTS mailbox_summary (
+                recipient TEXT PRIMARY KEY,
+                total INTEGER NOT NULL DEFAULT 0,
+                unread INTEGER NOT NULL DEFAULT 0
+            )""",
+        """INSERT OR REPLACE INTO mailbox_summary (recipient, total, unread)
+            SELECT recipient, COUNT(*), COUNT(*) - SUM(is_read) FROM mail GROUP BY recipient""",
+        # Every insert, delete or read of mail adjusts the counters in the same transaction, whatever the code path
+        """CREATE TRIGGER IF NOT EXISTS mail_summary_insert AFTER INSERT ON mail BEGIN
+                INSERT INTO mailbox_summary (recipient, total, unread) VALUES (NEW.recipient, 1, 1 - NEW.is_read)
+                ON CONFLICT(recipient) DO UPDATE SET total = total + 1, unread = unread + 1 - NEW.is_read;
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS mail_summary_delete AFTER DELETE ON mail BEGIN
+                UPDATE mailbox_summary SET total = total - 1, unread = unread - 1 + OLD.is_read
+                WHERE recipient = OLD.recipient;
+            END""",
+        """CREATE TRIGGER IF NOT EXISTS mail_summary_update AFTER UPDATE OF recipient, is_read ON mail BEGIN
+                UPDATE mailbox_summary SET total = total - 1, unread = unread - 1 + OLD.is_read
+                WHERE recipient = OLD.recipient;
+                INSERT INTO mailbox_summary (recipient, total, unread) VALUES (NEW.recipient, 1, 1 - NEW.is_read)
+                ON CONFLICT(recipient) DO UPDATE SET total = total + 1, unread = unread + 1 - NEW.is_read;
+            END""",
+    ]),
+]
+
+SYNC_APPLIED = 'applied'
+SYNC_DUPLICATE = 'duplicate'
+SYNC_CONFLICT = 'conflict'
+
+# Synced kinds: table and the columns that make up an item's content, in sync message order
+SYNC_TABLES = {
+    'BULLETIN': ('bulletins', ('board', 'sender_short_name', 'subject', 'content')),
+    'MAIL': ('mail', ('sender', 'sender_short_name', 'recipient', 'subject', 'content')),
+}
+
+
+def get_schema_version(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TEXT NOT NULL
+                )''')
+    conn.commit()
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def apply_migrations(conn):
+    current = get_schema_version(conn)
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        logging.info(f"Applying database migration {version}: {description}")
+        c = conn.cursor()
+        try:
+            c.execute("BEGIN")
+            for statement in statements:
+                c.execute(statement)
+            c.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                      (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            c.execute("COMMIT")
+        except sqlite3.Error as e:
+            c.execute("ROLLBACK")
+            logging.error(f"Database migration {version} failed: {e}")
+            raise
+
 def add_channel(name, url, bbs_nodes=None, interface=None):
+    """Add a channel to the directory. Returns False if the same channel is already listed."""
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("INSERT INTO channels (name, url) VALUES (?, ?)", (name, url))
+    c.execute("INSERT OR IGNORE INTO channels (name, url) VALUES (?, ?)", (name, url))
     conn.commit()
+    added = c.rowcount == 1
 
-    if bbs_nodes and interface:
+    if added and bbs_nodes and interface:
         send_channel_to_bbs_nodes(name, url, bbs_nodes, interface)
+    return added
 
 
-def get_channels():
+def get_channels_page(after_id=None, limit=20):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT name, url FROM channels")
+    c.execute("SELECT id, name FROM channels WHERE id > ? ORDER BY id LIMIT ?", (after_id or 0, limit))
     return c.fetchall()
 
+def get_channel(channel_id):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT name, url FROM channels WHERE id = ?", (channel_id,))
+    return c.fetchone()
+
 
 
 def add_bulletin(board, sender_short_name, subject, content, bbs_nodes, interface, unique_id=None):
@@ -88,7 +247,7 @@ def add_bulletin(board, sender_short_name, subject, content, bbs_nodes, interfac
     if not unique_id:
         unique_id = str(uuid.uuid4())
     c.execute(
-        "INSERT INTO bulletins (board, sender_short_name, date, subject, content, unique_id) VALUES (?, ?, ?, ?, ?, ?)",
+        "INSERT OR IGNORE INTO bulletins (board, sender_short_name, date, subject, content, unique_id) VALUES (?, ?, ?, ?, ?, ?)",
         (board, sender_short_name, date, subject, content, unique_id))
     conn.commit()
     if bbs_nodes and interface:
@@ -97,15 +256,59 @@ def add_bulletin(board, sender_short_name, subject, content, bbs_nodes, interfac
     # New logic to send group chat notification for urgent bulletins
     if board.lower() == "urgent":
         notification_message = f"💥NEW URGENT BULLETIN💥\nFrom: {sender_short_name}\nTitle: {subject}\nDM 'CB,,Urgent' to view"
-        send_message(notification_message, BROADCAST_NUM, interface)
+        send_message(notification_message, BROADCAST_NUM, interface, PRIORITY_URGENT)
 
     return unique_id
 
 
-def get_bulletins(board):
+def _sync_version(fields):
+    return hashlib.sha1('\x1f'.join(str(field) for field in fields).encode('utf-8')).hexdigest()
+
+
+def _upsert_synced(conn, kind, values, unique_id):
+    """
+    Store a row received from a peer BBS, keyed by unique_id.
+
+    A different version of an existing row is a conflict; every node keeps the version
+    with the higher content hash, so peers converge whatever order versions arrive in.
+    Rows that have a tombstone are not recreated.
+    """
+    table, columns = SYNC_TABLES[kind]
+    row = conn.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE unique_id = ?", (unique_id,)).fetchone()
+    if row is None and is_tombstoned(conn, kind, unique_id):
+        # Deleted here already; a late or replayed copy must not bring it back
+        return SYNC_DUPLICATE
+    if row is None:
+        conn.execute(f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}, date, unique_id) VALUES "
+                     f"({', '.join('?' for _ in columns)}, ?, ?)",
+                     tuple(values) + (datetime.now().strftime('%Y-%m-%d %H:%M'), unique_id))
+        return SYNC_APPLIED
+    if tuple(row) == tuple(values):
+        return SYNC_DUPLICATE
+    if _sync_version(values) > _sync_version(row):
+        conn.execute(f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)} WHERE unique_id = ?",
+                     tuple(values) + (unique_id,))
+    return SYNC_CONFLICT
+
+
+def upsert_bulletin(board, sender_short_name, subject, content, unique_id):
+    """Store a synced bulletin. Returns SYNC_APPLIED, SYNC_DUPLICATE or SYNC_CONFLICT."""
+    conn = get_db_connection()
+    with conn:
+        return _upsert_synced(conn, 'BULLETIN', (board, sender_short_name, subject, content), unique_id)
+
+
+def get_bulletin_count(board):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT id, subject, sender_short_name, date, unique_id FROM bulletins WHERE board = ? COLLATE NOCASE", (board,))
+    c.execute("SELECT COUNT(*) FROM bulletins WHERE board = ? COLLATE NOCASE", (board,))
+    return c.fetchone()[0]
+
+def get_bulletins_page(board, after_id=None, limit=20):
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT id, subject, sender_short_name, date FROM bulletins WHERE board = ? COLLATE NOCASE AND id > ? "
+              "ORDER BY id LIMIT ?", (board, after_id or 0, limit))
     return c.fetchall()
 
 def get_bulletin_content(bulletin_id):
@@ -115,12 +318,14 @@ def get_bulletin_content(bulletin_id):
     return c.fetchone()
 
 
-def delete_bulletin(bulletin_id, bbs_nodes, interface):
+def delete_bulletin(unique_id, bbs_nodes, interface):
+    """Delete a bulletin by unique_id and leave a tombstone. Returns False if it was already gone."""
     conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("DELETE FROM bulletins WHERE id = ?", (bulletin_id,))
-    conn.commit()
-    send_delete_bulletin_to_bbs_nodes(bulletin_id, bbs_nodes, interface)
+    with conn:
+        deleted = conn.execute("DELETE FROM bulletins WHERE unique_id = ?", (unique_id,)).rowcount > 0
+        record_tombstone(conn, 'BULLETIN', unique_id)
+    send_delete_bulletin_to_bbs_nodes(unique_id, bbs_nodes, interface)
+    return deleted
 
 def add_mail(sender_id, sender_short_name, recipient_id, subject, content, bbs_nodes, interface, unique_id=None):
     conn = get_db_connection()
@@ -128,19 +333,38 @@ def add_mail(sender_id, sender_short_name, recipient_id, subject, content, bbs_n
     date = datetime.now().strftime('%Y-%m-%d %H:%M')
     if not unique_id:
         unique_id = str(uuid.uuid4())
-    c.execute("INSERT INTO mail (sender, sender_short_name, recipient, date, subject, content, unique_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+    c.execute("INSERT OR IGNORE INTO mail (sender, sender_short_name, recipient, date, subject, content, unique_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
               (sender_id, sender_short_name, recipient_id, date, subject, content, unique_id))
     conn.commit()
     if bbs_nodes and interface:
         send_mail_to_bbs_nodes(sender_id, sender_short_name, recipient_id, subject, content, unique_id, bbs_nodes, interface)
     return unique_id
 
-def get_mail(recipient_id):
+def upsert_mail(sender_id, sender_short_name, recipient_id, subject, content, unique_id):
+    """Store synced mail. Returns SYNC_APPLIED, SYNC_DUPLICATE or SYNC_CONFLICT."""
+    conn = get_db_connection()
+    with conn:
+        return _upsert_synced(conn, 'MAIL', (sender_id, sender_short_name, recipient_id, subject, content), unique_id)
+
+def get_mail_page(recipient_id, after_id=None, limit=20):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT id, sender_short_name, subject, date, unique_id FROM mail WHERE recipient = ?", (recipient_id,))
+    c.execute("SELECT id, sender_short_name, subject, date, is_read FROM mail WHERE recipient = ? AND id > ? "
+              "ORDER BY id LIMIT ?", (recipient_id, after_id or 0, limit))
     return c.fetchall()
 
+def get_mailbox_summary(recipient_id):
+    """(total, unread) mail for a recipient, from the counters the mail triggers maintain."""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT total, unread FROM mailbox_summary WHERE recipient = ?", (recipient_id,))
+    return c.fetchone() or (0, 0)
+
+def mark_mail_read(mail_id, recipient_id):
+    conn = get_db_connection()
+    with conn:
+        conn.execute("UPDATE mail SET is_read = 1 WHERE id = ? AND recipient = ? AND is_read = 0", (mail_id, recipient_id))
+
 def get_mail_content(mail_id, recipient_id):
     # TODO: ensure only recipient can read mail
     conn = get_db_connection()
@@ -156,18 +380,63 @@ def delete_mail(unique_id, recipient_id, bbs_nodes, interface):
         result = c.fetchone()
         if result is None:
             logging.error(f"No mail found with unique_id: {unique_id}")
-            return  # Early exit if no matching mail found
+            if recipient_id is None:
+                # A delete from a peer BBS; remember it in case the mail itself arrives late
+                with conn:
+                    record_tombstone(conn, 'MAIL', unique_id)
+            return False  # Early exit if no matching mail found
         recipient_id = result[0]
         logging.info(f"Attempting to delete mail with unique_id: {unique_id} by {recipient_id}")
-        c.execute("DELETE FROM mail WHERE unique_id = ? and recipient = ?", (unique_id, recipient_id,))
-        conn.commit()
+        with conn:
+            c.execute("DELETE FROM mail WHERE unique_id = ? and recipient = ?", (unique_id, recipient_id,))
+            record_tombstone(conn, 'MAIL', unique_id)
         send_delete_mail_to_bbs_nodes(unique_id, bbs_nodes, interface)
         logging.info(f"Mail with unique_id: {unique_id} deleted and sync message sent.")
+        return True
     except Exception as e:
         logging.error(f"Error deleting mail with unique_id {unique_id}: {e}")
         raise
 
 
+def record_tombstone(conn, kind, unique_id):
+    conn.execute("INSERT OR REPLACE INTO sync_tombstones (kind, unique_id, deleted_at) VALUES (?, ?, ?)",
+                 (kind, unique_id, time.time()))
+
+
+def is_tombstoned(conn, kind, unique_id):
+    return conn.execute("SELECT 1 FROM sync_tombstones WHERE kind = ? AND unique_id = ?",
+                        (kind, unique_id)).fetchone() is not None
+
+
+def prune_tombstones(max_age):
+    """Forget deletes older than ``max_age`` seconds. Returns the number of tombstones removed."""
+    conn = get_db_connection()
+    with conn:
+        return conn.execute("DELETE FROM sync_tombstones WHERE deleted_at < ?", (time.time() - max_age,)).rowcount
+
+
+def get_sync_versions(kind):
+    """(unique_id, version) for every row of a synced kind, and (unique_id, None) for every tombstone."""
+    table, columns = SYNC_TABLES[kind]
+    conn = get_db_connection()
+    versions = [(row[-1], _sync_version(row[:-1]))
+                for row in conn.execute(f"SELECT {', '.join(columns)}, unique_id FROM {table}")]
+    versions += conn.execute("SELECT unique_id, NULL FROM sync_tombstones WHERE kind = ?", (kind,)).fetchall()
+    return versions
+
+
+def get_sync_fields(kind, unique_id):
+    """The sync message that recreates an item on a peer: the row itself, its delete, or None if unknown."""
+    table, columns = SYNC_TABLES[kind]
+    conn = get_db_connection()
+    row = conn.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE unique_id = ?", (unique_id,)).fetchone()
+    if row is not None:
+        return [kind, *row, unique_id]
+    if is_tombstoned(conn, kind, unique_id):
+        return [f"DELETE_{kind}", unique_id]
+    return None
+
+
 def get_sender_id_by_mail_id(mail_id):
     conn = get_db_connection()
     c = conn.cursor()
@@ -178,15 +447,56 @@ def get_sender_id_by_mail_id(mail_id):
     return None
 
 
+_message_log_writer = None
+_message_log_writer_lock = threading.Lock()
+
+
+def get_message_log_writer():
+    global _message_log_writer
+    with _message_log_writer_lock:
+        if _message_log_writer is None:
+            settings = get_settings()
+            _message_log_writer = BatchWriter(flush_rows=settings['log_batch_rows'],
+                                              flush_ms=settings['log_batch_ms'],
+                                              name='message-log-writer')
+            _message_log_writer.start()
+        return _message_log_writer
+
+
+def shutdown_message_log_writer():
+    if _message_log_writer is not None:
+        _message_log_writer.stop()
+
+
+ROLLUP_UPSERT = """
+    INSERT INTO {table} (bucket, sender_id, sender_short_name, msg_count, snr_count, snr_sum, snr_min, snr_max, rssi_count, rssi_sum)
+    VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(bucket, sender_id) DO UPDATE SET
+        sender_short_name = excluded.sender_short_name,
+        msg_count = msg_count + 1,
+        snr_count = snr_count + excluded.snr_count,
+        snr_sum = snr_sum + excluded.snr_sum,
+        snr_min = MIN(COALESCE(snr_min, excluded.snr_min), COALESCE(excluded.snr_min, snr_min)),
+        snr_max = MAX(COALESCE(snr_max, excluded.snr_max), COALESCE(excluded.snr_max, snr_max)),
+        rssi_count = rssi_count + excluded.rssi_count,
+        rssi_sum = rssi_sum + excluded.rssi_sum
+"""
+ROLLUP_TABLES = (('message_log_hourly', 3600), ('message_log_daily', 86400))
+
+
 def log_message(sender_id, sender_short_name, to_id, message, timestamp, channel_index=0, snr=None, rssi=None, hop_limit=None):
-    """Log a message to the database for analytics"""
+    """Queue a message for the analytics log; rows are written in batches by the message log writer"""
     try:
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute(
+        writer = get_message_log_writer()
+        writer.add(
             "INSERT INTO message_logs (timestamp, sender_id, sender_short_name, to_id, channel_index, message, snr, rssi, hop_limit) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
             (timestamp, sender_id, sender_short_name, to_id, channel_index, message, snr, rssi, hop_limit))
-        conn.commit()
+        # Keep the hourly/daily rollups in step; they are written in the same transaction as the raw row
+        for table, size in ROLLUP_TABLES:
+            writer.add(ROLLUP_UPSERT.format(table=table), (
+                int(timestamp) // size * size, sender_id, sender_short_name,
+                0 if snr is None else 1, snr or 0, snr, snr,
+                0 if rssi is None else 1, rssi or 0))
     except Exception as e:
         logging.error(f"Error logging message: {e}")
 
@@ -251,6 +561,12 @@ def get_message_stats(hours=24):
 
 
 # ========== PROPAGATION STUDY TOOLS ==========
+# The aggregate queries below read the message_log_hourly / message_log_daily rollups,
+# so their cost depends on the window size rather than on how much history is logged.
+
+def _hour_bucket(cutoff_time):
+    return cutoff_time - cutoff_time % 3600
+
 
 def get_propagation_trends(hours=24, node_id=None):
     """Get SNR/RSSI trends over time"""
@@ -269,14 +585,16 @@ def get_propagation_trends(hours=24, node_id=None):
                 ORDER BY timestamp ASC
             """, (cutoff_time, node_id))
         else:
-            # All nodes average
-            c.execute("""
-                SELECT timestamp, AVG(snr) as avg_snr, AVG(rssi) as avg_rssi, COUNT(*) as msg_count
-                FROM message_logs 
-                WHERE timestamp >= ? AND snr IS NOT NULL
-                GROUP BY timestamp / 3600
-                ORDER BY timestamp ASC
-            """, (cutoff_time,))
+            # All nodes average, per hour (or per day for windows longer than a week)
+            table, size = ROLLUP_TABLES[0] if hours <= 168 else ROLLUP_TABLES[1]
+            c.execute(f"""
+                SELECT bucket, SUM(snr_sum) / SUM(snr_count) as avg_snr,
+                       SUM(rssi_sum) / NULLIF(SUM(rssi_count), 0) as avg_rssi, SUM(snr_count) as msg_count
+                FROM {table}
+                WHERE bucket >= ? AND snr_count > 0
+                GROUP BY bucket
+                ORDER BY bucket ASC
+            """, (cutoff_time - cutoff_time % size,))
         
         return c.fetchall()
     except Exception as e:
@@ -289,27 +607,29 @@ def get_best_worst_conditions():
     try:
         conn = get_db_connection()
         c = conn.cursor()
+        cutoff_bucket = _hour_bucket(int(__import__('time').time()) - 604800)
         
-        # Best SNR in last 7 days
+        # Best SNR in last 7 days. Grouping by +sender_id keeps the planner on the bucket range
+        # of the primary key instead of walking the whole (sender_id, bucket) index to group
         c.execute("""
-            SELECT sender_short_name, MAX(snr) as best_snr, timestamp
-            FROM message_logs 
-            WHERE timestamp >= ? AND snr IS NOT NULL
-            GROUP BY sender_id
+            SELECT sender_short_name, MAX(snr_max) as best_snr, bucket
+            FROM message_log_hourly 
+            WHERE bucket >= ? AND snr_count > 0
+            GROUP BY +sender_id
             ORDER BY best_snr DESC
             LIMIT 10
-        """, (int(__import__('time').time()) - 604800,))
+        """, (cutoff_bucket,))
         best = c.fetchall()
         
         # Worst SNR
         c.execute("""
-            SELECT sender_short_name, MIN(snr) as worst_snr, timestamp
-            FROM message_logs 
-            WHERE timestamp >= ? AND snr IS NOT NULL
-            GROUP BY sender_id
+            SELECT sender_short_name, MIN(snr_min) as worst_snr, bucket
+            FROM message_log_hourly 
+            WHERE bucket >= ? AND snr_count > 0
+            GROUP BY +sender_id
             ORDER BY worst_snr ASC
             LIMIT 10
-        """, (int(__import__('time').time()) - 604800,))
+        """, (cutoff_bucket,))
         worst = c.fetchall()
         
         return {'best': best, 'worst': worst}
@@ -327,15 +647,15 @@ def get_hourly_propagation_stats():
         # Group by hour of day over last 7 days
         c.execute("""
             SELECT 
-                strftime('%H', datetime(timestamp, 'unixepoch', 'localtime')) as hour,
-                AVG(snr) as avg_snr,
-                AVG(rssi) as avg_rssi,
-                COUNT(*) as msg_count
-            FROM message_logs 
-            WHERE timestamp >= ? AND snr IS NOT NULL
+                strftime('%H', datetime(bucket, 'unixepoch', 'localtime')) as hour,
+                SUM(snr_sum) / SUM(snr_count) as avg_snr,
+                SUM(rssi_sum) / NULLIF(SUM(rssi_count), 0) as avg_rssi,
+                SUM(snr_count) as msg_count
+            FROM message_log_hourly 
+            WHERE bucket >= ? AND snr_count > 0
             GROUP BY hour
             ORDER BY hour ASC
-        """, (int(__import__('time').time()) - 604800,))
+        """, (_hour_bucket(int(__import__('time').time()) - 604800),))
         
         return c.fetchall()
     except Exception as e:
@@ -351,10 +671,11 @@ def get_node_reliability(node_id):
         
         # Messages received in last 7 days
         c.execute("""
-            SELECT COUNT(*), AVG(snr), MIN(snr), MAX(snr), AVG(rssi)
-            FROM message_logs 
-            WHERE sender_id = ? AND timestamp >= ?
-        """, (node_id, int(__import__('time').time()) - 604800))
+            SELECT COALESCE(SUM(msg_count), 0), SUM(snr_sum) / NULLIF(SUM(snr_count), 0), MIN(snr_min), MAX(snr_max),
+                   SUM(rssi_sum) / NULLIF(SUM(rssi_count), 0)
+            FROM message_log_hourly 
+            WHERE sender_id = ? AND bucket >= ?
+        """, (node_id, _hour_bucket(int(__import__('time').time()) - 604800)))
         
         stats = c.fetchone()
         return {
@@ -1,17 +1,25 @@
-from socket import socket, AF_INET, SOCK_STREAM
+import socket
 import json
+import queue
+import threading
 import time
-import sqlite3
 import configparser
 import logging
 
 from meshtastic import BROADCAST_NUM
 
 from command_handlers import handle_help_command
+from command_router import register_step
+from config_service import get_config
+from db_manager import BatchWriter, get_connection, open_connection
+from listings import handle_listing_navigation, new_listing, register_listing, show_listing
+from send_queue import PRIORITY_URGENT
 from utils import send_message, update_user_state
 
 config_file = 'config.ini'
 
+JS8_MENU_OPTIONS = "[G]roup [S]tation [U]rgent E[X]IT"
+
 def from_message(content):
     try:
         return json.loads(content)
@@ -24,6 +32,50 @@ def to_message(typ, value='', params=None):
     return json.dumps({'type': typ, 'value': value, 'params': params})
 
 
+class LineDecoder:
+    """
+    Incremental decoder for JS8Call's newline-delimited JSON stream.
+
+    TCP may split one frame across several reads or deliver several frames in one
+    read, so bytes are accumulated in a reusable buffer and only complete lines are
+    decoded. A partial line longer than ``max_line`` is discarded.
+    """
+
+    def __init__(self, max_line=65536):
+        self.max_line = max_line
+        self.invalid = 0
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes and return the messages from every line they complete."""
+        buffer = self._buffer
+        buffer += data
+        messages = []
+        start = 0
+        while True:
+            end = buffer.find(b'\n', start)
+            if end < 0:
+                break
+            line = bytes(buffer[start:end])
+            start = end + 1
+            if not line.strip():
+                continue
+            message = from_message(line)
+            if message and isinstance(message, dict):
+                messages.append(message)
+            else:
+                self.invalid += 1
+        if start:
+            del buffer[:start]
+        if len(buffer) > self.max_line:
+            self.invalid += 1
+            buffer.clear()
+        return messages
+
+    def reset(self):
+        self._buffer.clear()
+
+
 class JS8CallClient:
     def __init__(self, interface, logger=None):
         self.logger = logger or logging.getLogger('js8call')
@@ -44,14 +96,36 @@ class JS8CallClient:
         self.js8groups = [group.strip() for group in self.js8groups]
         self.js8urgent = [group.strip() for group in self.js8urgent]
 
+        self.reconnect_min = self.config.getfloat('js8call', 'reconnect_min', fallback=1.0)
+        self.reconnect_max = self.config.getfloat('js8call', 'reconnect_max', fallback=60.0)
+        queue_size = self.config.getint('js8call', 'queue_size', fallback=1000)
+
         self.connected = False
         self.sock = None
         self.db_conn = None
+        self.writer = None
         self.interface = interface
 
+        self.decoder = LineDecoder()
+        self.inbound = queue.Queue(maxsize=queue_size)
+        self.outbound = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._threads = []
+
+        self.frames_received = 0
+        self.inbound_dropped = 0
+        self.outbound_dropped = 0
+        self.reconnects = 0
+
         if self.db_file:
-            self.db_conn = sqlite3.connect(self.db_file)
+            self.db_conn = open_connection(self.db_file)
             self.create_tables()
+            self.writer = BatchWriter(
+                self.db_file,
+                flush_rows=self.config.getint('js8call', 'batch_rows', fallback=50),
+                flush_ms=self.config.getint('js8call', 'batch_ms', fallback=1000),
+                name='js8call-ingest'
+            )
         else:
             self.logger.info("JS8Call configuration not found. Skipping JS8Call integration.")
 
@@ -87,14 +161,17 @@ class JS8CallClient:
                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
+            self.db_conn.execute("CREATE INDEX IF NOT EXISTS idx_groups_groupname ON groups (groupname, timestamp)")
+            self.db_conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp)")
+            self.db_conn.execute("CREATE INDEX IF NOT EXISTS idx_urgent_timestamp ON urgent (timestamp)")
         self.logger.info("Database tables created or verified.")
 
     def insert_message(self, table, sender, recipient, message):
         """
-        Inserts a message into the specified table in the database.
+        Queues a message for insertion into the specified table in the database.
 
-        This method saves a message along with its sender and receiver or group name into the specified table.
-        If the database connection is not available, it logs an error message.
+        Rows are written by the ingest writer thread in batched transactions, so this
+        returns immediately. If the database is not configured, it logs an error message.
 
         Parameters:
         -----------
@@ -102,7 +179,7 @@ class JS8CallClient:
             The name of the table where the message should be inserted. It can be 'messages', 'groups', or 'urgent'.
         
         sender : str
-            The meshtastic node identifier of the sender who issued the command
+            The callsign of the station that sent the message
         
         recipient : str
             The identifier of the receiver of the message or the group name.
@@ -112,23 +189,19 @@ class JS8CallClient:
 
         Example Usage:
         --------------
-        client.insert_message('messages', sender='CALLSIGN1', receiver_or_group='CALLSIGN2', message='This is a message.')
-        client.insert_message('groups', sender='CALLSIGN1', receiver_or_group='GroupName', message='This is a group message.')
-        client.insert_message('urgent', sender='CALLSIGN1', receiver_or_group='UrgentGroupName', message='This is an urgent message.')
+        client.insert_message('messages', sender='CALLSIGN1', recipient='CALLSIGN2', message='This is a message.')
+        client.insert_message('groups', sender='CALLSIGN1', recipient='GroupName', message='This is a group message.')
+        client.insert_message('urgent', sender='CALLSIGN1', recipient='UrgentGroupName', message='This is an urgent message.')
         """
 
-        if not self.db_conn:
+        if not self.writer:
             self.logger.error("Database connection is not available.")
-            return
+            return False
 
-        try:
-            with self.db_conn:
-                self.db_conn.execute(f'''
-                    INSERT INTO {table} (sender, { 'receiver' if table == 'messages' else 'groupname' }, message)
-                    VALUES (?, ?, ?)
-                ''', (sender, receiver_or_group, message))
-        except sqlite3.Error as e:
-            self.logger.error(f"Failed to insert message into {table} table: {e}")
+        return self.writer.add(
+            f"INSERT INTO {table} (sender, {'receiver' if table == 'messages' else 'groupname'}, message) VALUES (?, ?, ?)",
+            (sender, recipient, message)
+        )
 
     def process(self, message):
         typ = message.get('type', '')
@@ -160,9 +233,9 @@ class JS8CallClient:
             self.logger.info(f"Received JS8Call message: {sender} to {receiver} - {msg}")
 
             if receiver in self.js8urgent:
-                self.insert_urgent('urgent', sender, receiver, msg)
+                self.insert_message('urgent', sender, receiver, msg)
                 notification_message = f"💥 URGENT JS8Call Message Received 💥\nFrom: {sender}\nCheck BBS for message"
-                send_message(notification_message, BROADCAST_NUM, self.interface)
+                send_message(notification_message, BROADCAST_NUM, self.interface, PRIORITY_URGENT)
             elif receiver in self.js8groups:
                 self.insert_message('groups', sender, receiver, msg)
             elif self.store_messages:
@@ -171,46 +244,127 @@ class JS8CallClient:
             pass
 
     def send(self, *args, **kwargs):
+        """Queue a message for JS8Call. It is written once a connection is available."""
         params = kwargs.get('params', {})
         if '_ID' not in params:
             params['_ID'] = '{}'.format(int(time.time() * 1000))
             kwargs['params'] = params
         message = to_message(*args, **kwargs)
-        self.sock.send((message + '\n').encode('utf-8'))  # Convert to bytes
+        try:
+            self.outbound.put_nowait((message + '\n').encode('utf-8'))
+        except queue.Full:
+            self.outbound_dropped += 1
+            self.logger.warning(f"JS8Call outbound queue full, dropping {args[0] if args else 'message'}")
 
-    def connect(self):
+    def start(self):
+        """Start the connection supervisor and message dispatcher threads."""
         if not self.server[0] or not self.server[1]:
             self.logger.info("JS8Call server configuration not found. Skipping JS8Call connection.")
             return
+        if self._threads:
+            return
+        if self.writer:
+            self.writer.start()
+        for target, name in ((self._supervise, 'js8call-connection'), (self._dispatch, 'js8call-dispatch')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stats(self):
+        return {
+            'connected': self.connected,
+            'frames_received': self.frames_received,
+            'frames_invalid': self.decoder.invalid,
+            'inbound_dropped': self.inbound_dropped,
+            'outbound_dropped': self.outbound_dropped,
+            'reconnects': self.reconnects
+        }
+
+    def _supervise(self):
+        """Keep a connection open, reconnecting with exponential backoff when it drops."""
+        backoff = self.reconnect_min
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.connect()
+            except OSError as e:
+                self.logger.error(f"JS8Call connection to {self.server} failed: {e}")
+            if self._stop.is_set():
+                break
+            # A connection that stayed up for a while was healthy, so start backing off from scratch
+            if time.monotonic() - started > self.reconnect_max:
+                backoff = self.reconnect_min
+            self.logger.info(f"Reconnecting to JS8Call in {backoff:.0f}s")
+            if self._stop.wait(backoff):
+                break
+            self.reconnects += 1
+            backoff = min(backoff * 2, self.reconnect_max)
 
+    def connect(self):
+        """Connect once and read frames until the connection drops or the client is closed."""
         self.logger.info(f"Connecting to {self.server}")
-        self.sock = socket(AF_INET, SOCK_STREAM)
+        self.decoder.reset()
+        sock = socket.create_connection(self.server, timeout=10)
+        sock.settimeout(1.0)
+        self.sock = sock
+        self.connected = True
+        writer = threading.Thread(target=self._write, args=(sock,), name='js8call-writer', daemon=True)
+        writer.start()
         try:
-            self.sock.connect(self.server)
-            self.connected = True
             self.send("STATION.GET_STATUS")
-
-            while self.connected:
-                content = self.sock.recv(65500).decode('utf-8')  # Decode received bytes to string
-                if not content:
-                    continue  # Skip empty content
-
+            while not self._stop.is_set():
                 try:
-                    message = json.loads(content)
-                except ValueError:
-                    continue  # Skip invalid JSON content
-
-                if not message:
-                    continue  # Skip empty message
+                    data = sock.recv(65536)
+                except socket.timeout:
+                    continue
+                if not data:
+                    self.logger.warning("JS8Call closed the connection")
+                    break
+                for message in self.decoder.feed(data):
+                    self.frames_received += 1
+                    try:
+                        self.inbound.put_nowait(message)
+                    except queue.Full:
+                        self.inbound_dropped += 1
+                        if self.inbound_dropped % 1000 == 1:
+                            self.logger.warning("JS8Call inbound queue full, dropping messages")
+        finally:
+            self.connected = False
+            sock.close()
+            writer.join(timeout=2)
+
+    def _write(self, sock):
+        while self.connected and not self._stop.is_set():
+            try:
+                data = self.outbound.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                sock.sendall(data)
+            except OSError as e:
+                self.logger.error(f"Failed to send to JS8Call: {e}")
+                return
 
+    def _dispatch(self):
+        while not self._stop.is_set():
+            try:
+                message = self.inbound.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
                 self.process(message)
-        except ConnectionRefusedError:
-            self.logger.error(f"Connection to JS8Call server {self.server} refused.")
-        finally:
-            self.sock.close()
+            except Exception as e:
+                self.logger.error(f"Error processing JS8Call message: {e}")
 
     def close(self):
-        self.connected = False
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        if self.writer:
+            self.writer.stop()
+        if self.frames_received or self.reconnects:
+            self.logger.info(f"JS8Call client stopped: {self.stats()}")
 
 
 def handle_js8call_command(sender_id, interface):
@@ -224,7 +378,10 @@ def handle_js8call_steps(sender_id, message, step, interface, state):
     if len(message) == 2 and message[1] == 'x':
         message = message[0]
 
-    if step == 1:
+    if step == 2 and handle_listing_navigation(sender_id, message, state, interface):
+        return
+
+    if step in (1, 2):
         choice = message
         if choice == 'x':
             handle_help_command(sender_id, interface, 'bbs')
@@ -240,10 +397,52 @@ def handle_js8call_steps(sender_id, message, step, interface, state):
             handle_js8call_command(sender_id, interface)
 
 
+def get_js8call_connection():
+    """Shared (per-thread) read connection to the JS8Call database in the current config snapshot."""
+    return get_connection(get_config().config.get('js8call', 'db_file', fallback='js8call.db'))
+
+
+def fetch_js8call_page(kind, group, after, limit):
+    """
+    Fetch up to ``limit`` rows of a JS8Call listing, newest first.
+
+    Pagination is keyset-based: ``after`` is the (timestamp, id) of the last row already
+    shown, so each page is a range scan of the timestamp indexes rather than an OFFSET.
+    """
+    if kind == 'group':
+        table, columns, where, params = 'groups', 'sender, message, timestamp', ['groupname = ?'], [group]
+    elif kind == 'urgent':
+        table, columns, where, params = 'urgent', 'sender, groupname, message, timestamp', [], []
+    else:
+        table, columns, where, params = 'messages', 'sender, receiver, message, timestamp', [], []
+    if after is not None:
+        where.append('(timestamp, id) < (?, ?)')
+        params.extend(after)
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ''
+    c = get_js8call_connection().cursor()
+    c.execute(f"SELECT id, {columns} FROM {table} {where_sql} ORDER BY timestamp DESC, id DESC LIMIT ?",
+              params + [limit])
+    return c.fetchall()
+
+
+def format_js8call_row(row):
+    # Group rows have no receiver column
+    if len(row) == 4:
+        return f"{row[1]}: {row[2]} ({row[3]})"
+    return f"{row[1]} -> {row[2]}: {row[3]} ({row[4]})"
+
+
+register_listing('js8call', fetch_js8call_page, format_js8call_row, cursor=lambda row: [row[-1], row[0]])
+
+
+def show_js8call_listing(sender_id, interface, kind, title, empty, group=None):
+    listing = new_listing('js8call', [kind, group], title + ":", empty, JS8_MENU_OPTIONS)
+    if not show_listing(sender_id, interface, listing, {'command': 'JS8CALL_MENU', 'step': 2}):
+        handle_js8call_command(sender_id, interface)
+
 
 def handle_group_messages_command(sender_id, interface):
-    conn = sqlite3.connect('js8call.db')
-    c = conn.cursor()
+    c = get_js8call_connection().cursor()
     c.execute("SELECT DISTINCT groupname FROM groups")
     groups = c.fetchall()
     if groups:
@@ -255,47 +454,26 @@ def handle_group_messages_command(sender_id, interface):
         handle_js8call_command(sender_id, interface)
 
 def handle_station_messages_command(sender_id, interface):
-    conn = sqlite3.connect('js8call.db')
-    c = conn.cursor()
-    c.execute("SELECT sender, receiver, message, timestamp FROM messages")
-    messages = c.fetchall()
-    if messages:
-        response = "Station Messages:\n" + "\n".join([f"[{i+1}] {msg[0]} -> {msg[1]}: {msg[2]} ({msg[3]})" for i, msg in enumerate(messages)])
-        send_message(response, sender_id, interface)
-    else:
-        send_message("No station messages available.", sender_id, interface)
-    handle_js8call_command(sender_id, interface)
+    show_js8call_listing(sender_id, interface, 'station', "Station Messages", "No station messages available.")
 
 def handle_urgent_messages_command(sender_id, interface):
-    conn = sqlite3.connect('js8call.db')
-    c = conn.cursor()
-    c.execute("SELECT sender, groupname, message, timestamp FROM urgent")
-    messages = c.fetchall()
-    if messages:
-        response = "Urgent Messages:\n" + "\n".join([f"[{i+1}] {msg[0]} -> {msg[1]}: {msg[2]} ({msg[3]})" for i, msg in enumerate(messages)])
-        send_message(response, sender_id, interface)
-    else:
-        send_message("No urgent messages available.", sender_id, interface)
-    handle_js8call_command(sender_id, interface)
+    show_js8call_listing(sender_id, interface, 'urgent', "Urgent Messages", "No urgent messages available.")
 
 def handle_group_message_selection(sender_id, message, step, state, interface):
     groups = state['groups']
     try:
         group_index = int(message)
         groupname = groups[group_index][0]
-
-        conn = sqlite3.connect('js8call.db')
-        c = conn.cursor()
-        c.execute("SELECT sender, message, timestamp FROM groups WHERE groupname=?", (groupname,))
-        messages = c.fetchall()
-
-        if messages:
-            response = f"Messages for group {groupname}:\n" + "\n".join([f"[{i+1}] {msg[0]}: {msg[1]} ({msg[2]})" for i, msg in enumerate(messages)])
-            send_message(response, sender_id, interface)
-        else:
-            send_message(f"No messages for group {groupname}.", sender_id, interface)
     except (IndexError, ValueError):
         send_message("Invalid group selection. Please choose again.", sender_id, interface)
         handle_group_messages_command(sender_id, interface)
+        return
+
+    show_js8call_listing(sender_id, interface, 'group', f"Messages for group {groupname}",
+                         f"No messages for group {groupname}.", groupname)
+
 
-    handle_js8call_command(sender_id, interface)
\ No newline at end of file
+# The JS8Call menus see X too; from the menu it goes back to the BBS menu rather than the main menu
+register_step('JS8CALL_MENU', lambda sender_id, message, step, state, interface: handle_js8call_steps(
+    sender_id, message, step, interface, state), with_step=True, with_state=True, handles_exit=True)
+register_step('GROUP_MESSAGES', handle_group_message_selection, with_step=True, with_state=True, handles_exit=True)
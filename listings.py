@@ -0,0 +1,106 @@
+from packer import utf8_len
+from utils import get_max_payload, send_message, update_user_state
+
+# Rows fetched per page; a page usually holds fewer once packed into a single frame
+PAGE_ROWS = 20
+
+listing_sources = {}
+
+
+def register_listing(name, fetch, format_row, cursor=lambda row: row[0]):
+    """
+    Register a paged listing.
+
+    ``fetch(*args, after, limit)`` returns up to ``limit`` rows that follow the keyset
+    cursor ``after`` (None for the first page), in display order. ``format_row(row)``
+    renders one entry and ``cursor(row)`` returns the keyset cursor of a row, by
+    default its id in the first column.
+    """
+    listing_sources[name] = (fetch, format_row, cursor)
+
+
+def new_listing(source, args=(), title='', empty='Nothing to show.', prompt=''):
+    """A listing as stored in the user state, positioned before its first page."""
+    return {'source': source, 'args': list(args), 'title': title, 'empty': empty, 'prompt': prompt,
+            'pages': [[None, 1]], 'page': 0, 'next': None}
+
+
+def render_page(title, lines, footer, max_bytes):
+    """Pack as many lines as fit under the title in one frame. Returns (text, lines used)."""
+    text = title
+    used = 0
+    for line in lines:
+        if used and utf8_len(f"{text}\n{line}{footer}") > max_bytes:
+            break
+        text += f"\n{line}"
+        used += 1
+    return text + footer, used
+
+
+def _footer(listing, has_next):
+    labels = [listing['prompt']] if listing['prompt'] else []
+    if has_next:
+        labels.append("[N]ext")
+    if listing['page'] > 0:
+        labels.append("[P]rev")
+    return '\n' + ' '.join(labels) if labels else ''
+
+
+def show_listing(sender_id, interface, listing, state):
+    """
+    Send the listing's current page and store it in ``state``.
+
+    The page is numbered from where the previous page stopped, and ``state['items']``
+    maps the numbers shown to row cursors. Returns False if the listing is empty.
+    """
+    fetch, format_row, cursor = listing_sources[listing['source']]
+    after, first_number = listing['pages'][listing['page']]
+    rows = fetch(*listing['args'], after, PAGE_ROWS + 1)
+    if not rows:
+        if listing['page'] == 0:
+            send_message(listing['empty'], sender_id, interface)
+            return False
+        # Rows were removed since the page was first shown; fall back to the first page
+        listing['page'] = 0
+        return show_listing(sender_id, interface, listing, state)
+
+    lines = [f"[{first_number + i}] {format_row(row)}" for i, row in enumerate(rows[:PAGE_ROWS])]
+    # Size the page for the longest footer, then drop [N]ext if everything fitted
+    footer = _footer(listing, True)
+    text, used = render_page(listing['title'], lines, footer, get_max_payload())
+    has_next = used < len(rows)
+    if not has_next:
+        text = text[:len(text) - len(footer)] + _footer(listing, False)
+    send_message(text, sender_id, interface)
+
+    listing['next'] = [cursor(rows[used - 1]), first_number + used] if has_next else None
+    state['listing'] = listing
+    state['items'] = {str(first_number + i): cursor(row) for i, row in enumerate(rows[:used])}
+    update_user_state(sender_id, state)
+    return True
+
+
+def handle_listing_navigation(sender_id, message, state, interface):
+    """Handle N/P for the listing in ``state``. Returns True if the message was a navigation command."""
+    listing = state.get('listing') if state else None
+    choice = message.strip().lower()
+    if not listing or choice not in ('n', 'p'):
+        return False
+    if choice == 'n':
+        if listing['next'] is None:
+            send_message("No more entries.", sender_id, interface)
+            return True
+        listing['pages'] = listing['pages'][:listing['page'] + 1] + [listing['next']]
+        listing['page'] += 1
+    else:
+        if listing['page'] == 0:
+            send_message("Already on the first page.", sender_id, interface)
+            return True
+        listing['page'] -= 1
+    show_listing(sender_id, interface, listing, state)
+    return True
+
+
+def get_listing_item(state, message):
+    """The row cursor for an entry number the user picked from the current page, or None."""
+    return (state or {}).get('items', {}).get(message.strip().lstrip('0') or '0')
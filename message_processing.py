@@ -1,7 +1,6 @@
 import logging
 
-from meshtastic import BROADCAST_NUM
-
+from anti_entropy import AE_PREFIX, get_anti_entropy
 from command_handlers import (
     handle_mail_command, handle_bulletin_command, handle_help_command, handle_stats_command, handle_fortune_command,
     handle_bb_steps, handle_mail_steps, handle_stats_steps, handle_wall_of_shame_command,
@@ -15,9 +14,14 @@ from command_handlers import (
     handle_propagation_command, handle_propagation_steps,
     handle_propagation_analysis_command, handle_propagation_analysis_steps, handle_prop_node_input_steps
 )
-from db_operations import add_bulletin, add_mail, delete_bulletin, delete_mail, get_db_connection, add_channel, log_message
-from js8call_integration import handle_js8call_command, handle_js8call_steps, handle_group_message_selection
-from utils import get_user_state, get_node_short_name, get_node_id_from_num, send_message
+from command_router import dispatch, register_menu, register_prefix, register_step
+from db_operations import log_message
+from js8call_integration import handle_js8call_command
+from node_index import get_node_index
+from node_stats import get_node_stats
+from sync_apply import get_sync_applier
+from sync_transport import FRAME_PREFIX, decode_fields, get_reassembler, parse_frame
+from utils import get_user_state, get_node_short_name, get_node_id_from_num, get_sync_outbox, send_sync_ack
 
 main_menu_handlers = {
     "w": handle_weather_command,
@@ -63,169 +67,73 @@ board_action_handlers = {
     "x": handle_help_command
 }
 
-def process_message(sender_id, message, interface, is_sync_message=False):
-    state = get_user_state(sender_id)
-    message_lower = message.lower().strip()
-    message_strip = message.strip()
-
-    bbs_nodes = interface.bbs_nodes
+# Quick commands work from any state
+register_prefix("sm,,", handle_send_mail_command, with_bbs_nodes=True)
+register_prefix("cm", handle_check_mail_command, with_message=False)
+register_prefix("pb,,", handle_post_bulletin_command, with_bbs_nodes=True)
+register_prefix("cb,,", handle_check_bulletin_command)
+register_prefix("chp,,", handle_post_channel_command)
+register_prefix("chl", handle_list_channels_command, with_message=False)
+
+register_step('NETWORK_INFO', handle_network_info_steps, with_step=True, with_state=True)
+register_step('RESOURCES', handle_resources_steps, with_step=True, with_state=True)
+register_step('WEATHER', handle_weather_steps, with_step=True, with_state=True)
+register_step('MAIL', handle_mail_steps, with_step=True, with_state=True, with_bbs_nodes=True)
+register_step('BULLETIN', handle_bb_steps, with_step=True, with_state=True, with_bbs_nodes=True)
+register_step('STATS', handle_stats_steps, with_step=True)
+register_step('CHANNEL_DIRECTORY', handle_channel_directory_steps, with_step=True, with_state=True)
+register_step('CHECK_MAIL', handle_read_mail_command, step=1, with_state=True)
+register_step('CHECK_MAIL', handle_delete_mail_confirmation, step=2, with_state=True, with_bbs_nodes=True)
+register_step('CHECK_BULLETIN', handle_read_bulletin_command, step=1, with_state=True)
+register_step('CHECK_CHANNEL', handle_read_channel_command, step=1, with_state=True)
+register_step('LIST_CHANNELS', handle_read_channel_command, step=1, with_state=True)
+register_step('BULLETIN_POST', lambda sender_id, message, state, interface, bbs_nodes: handle_bb_steps(
+    sender_id, message, 4, state, interface, bbs_nodes), with_state=True, with_bbs_nodes=True)
+register_step('BULLETIN_POST_CONTENT', lambda sender_id, message, state, interface, bbs_nodes: handle_bb_steps(
+    sender_id, message, 5, state, interface, bbs_nodes), with_state=True, with_bbs_nodes=True)
+register_step('BULLETIN_READ', lambda sender_id, message, state, interface, bbs_nodes: handle_bb_steps(
+    sender_id, message, 3, state, interface, bbs_nodes), with_state=True, with_bbs_nodes=True)
+register_step('GAMES', handle_games_steps, with_step=True, with_state=True)
+register_step('TRIVIA', handle_trivia_steps, with_step=True, with_state=True)
+register_step('PROPAGATION', handle_propagation_steps, with_step=True, with_state=True)
+register_step('PROP_ANALYSIS', handle_propagation_analysis_steps, with_step=True, with_state=True)
+register_step('PROP_NODE_INPUT', handle_prop_node_input_steps, with_step=True, with_state=True)
+
+register_menu('main', main_menu_handlers)
+register_menu('bbs', bbs_menu_handlers)
+register_menu('utilities', utilities_menu_handlers)
+register_menu('BULLETIN_MENU', bulletin_menu_handlers)
+register_menu('BULLETIN_ACTION', board_action_handlers, with_state=True)
 
-    # Handle repeated characters for single character commands using a prefix
-    if len(message_lower) == 2 and message_lower[1] == 'x':
-        message_lower = message_lower[0]
 
+def process_message(sender_id, message, interface, is_sync_message=False):
     if is_sync_message:
-        if message.startswith("BULLETIN|"):
-            parts = message.split("|")
-            board, sender_short_name, subject, content, unique_id = parts[1], parts[2], parts[3], parts[4], parts[5]
-            add_bulletin(board, sender_short_name, subject, content, [], interface, unique_id=unique_id)
-
-            if board.lower() == "urgent":
-                notification_message = f"💥NEW URGENT BULLETIN💥\nFrom: {sender_short_name}\nTitle: {subject}\nDM 'CB,,Urgent' to view"
-                send_message(notification_message, BROADCAST_NUM, interface)
-        elif message.startswith("MAIL|"):
-            parts = message.split("|")
-            sender_id, sender_short_name, recipient_id, subject, content, unique_id = parts[1], parts[2], parts[3], parts[4], parts[5], parts[6]
-            add_mail(sender_id, sender_short_name, recipient_id, subject, content, [], interface, unique_id=unique_id)
-        elif message.startswith("DELETE_BULLETIN|"):
-            unique_id = message.split("|")[1]
-            delete_bulletin(unique_id, [], interface)
-        elif message.startswith("DELETE_MAIL|"):
-            unique_id = message.split("|")[1]
-            logging.info(f"Processing delete mail with unique_id: {unique_id}")
-            recipient_id = get_recipient_id_by_mail(unique_id)
-            delete_mail(unique_id, recipient_id, [], interface)
-        elif message.startswith("CHANNEL|"):
-            parts = message.split("|")
-            channel_name, channel_url = parts[1], parts[2]
-            add_channel(channel_name, channel_url)
+        get_sync_applier().apply(decode_fields(message), interface)
     else:
-        if message_lower.startswith("sm,,"):
-            handle_send_mail_command(sender_id, message_strip, interface, bbs_nodes)
-        elif message_lower.startswith("cm"):
-            handle_check_mail_command(sender_id, interface)
-        elif message_lower.startswith("pb,,"):
-            handle_post_bulletin_command(sender_id, message_strip, interface, bbs_nodes)
-        elif message_lower.startswith("cb,,"):
-            handle_check_bulletin_command(sender_id, message_strip, interface)
-        elif message_lower.startswith("chp,,"):
-            handle_post_channel_command(sender_id, message_strip, interface)
-        elif message_lower.startswith("chl"):
-            handle_list_channels_command(sender_id, interface)
-        else:
-            if state and state['command'] == 'MENU':
-                menu_name = state['menu']
-                if menu_name == 'bbs':
-                    handlers = bbs_menu_handlers
-                elif menu_name == 'utilities':
-                    handlers = utilities_menu_handlers
-                else:
-                    handlers = main_menu_handlers
-            elif state and state['command'] == 'BULLETIN_MENU':
-                handlers = bulletin_menu_handlers
-            elif state and state['command'] == 'BULLETIN_ACTION':
-                handlers = board_action_handlers
-            elif state and state['command'] == 'JS8CALL_MENU':
-                handle_js8call_steps(sender_id, message, state['step'], interface, state)
-                return
-            elif state and state['command'] == 'GROUP_MESSAGES':
-                handle_group_message_selection(sender_id, message, state['step'], state, interface)
-                return
-            else:
-                handlers = main_menu_handlers
-
-            if message_lower == 'x':
-                # Reset to main menu state
-                handle_help_command(sender_id, interface)
-                return
-
-            # Check state-based commands FIRST (submenus have priority)
-            if state:
-                command = state['command']
-                step = state['step']
+        dispatch(sender_id, message, interface, get_user_state(sender_id), handle_help_command)
 
-                if command == 'NETWORK_INFO':
-                    handle_network_info_steps(sender_id, message, step, state, interface)
-                    return
-                elif command == 'RESOURCES':
-                    handle_resources_steps(sender_id, message, step, state, interface)
-                    return
-                elif command == 'WEATHER':
-                    handle_weather_steps(sender_id, message, step, state, interface)
-                    return
-                elif command == 'MAIL':
-                    handle_mail_steps(sender_id, message, step, state, interface, bbs_nodes)
-                    return
-                elif command == 'BULLETIN':
-                    handle_bb_steps(sender_id, message, step, state, interface, bbs_nodes)
-                    return
-                elif command == 'STATS':
-                    handle_stats_steps(sender_id, message, step, interface)
-                    return
-                elif command == 'CHANNEL_DIRECTORY':
-                    handle_channel_directory_steps(sender_id, message, step, state, interface)
-                    return
-                elif command == 'CHECK_MAIL':
-                    if step == 1:
-                        handle_read_mail_command(sender_id, message, state, interface)
-                    elif step == 2:
-                        handle_delete_mail_confirmation(sender_id, message, state, interface, bbs_nodes)
-                    return
-                elif command == 'CHECK_BULLETIN':
-                    if step == 1:
-                        handle_read_bulletin_command(sender_id, message, state, interface)
-                    return
-                elif command == 'CHECK_CHANNEL':
-                    if step == 1:
-                        handle_read_channel_command(sender_id, message, state, interface)
-                    return
-                elif command == 'LIST_CHANNELS':
-                    if step == 1:
-                        handle_read_channel_command(sender_id, message, state, interface)
-                    return
-                elif command == 'BULLETIN_POST':
-                    handle_bb_steps(sender_id, message, 4, state, interface, bbs_nodes)
-                    return
-                elif command == 'BULLETIN_POST_CONTENT':
-                    handle_bb_steps(sender_id, message, 5, state, interface, bbs_nodes)
-                    return
-                elif command == 'BULLETIN_READ':
-                    handle_bb_steps(sender_id, message, 3, state, interface, bbs_nodes)
-                    return
-                elif command == 'JS8CALL_MENU':
-                    handle_js8call_steps(sender_id, message, step, interface, state)
-                    return
-                elif command == 'GROUP_MESSAGES':
-                    handle_group_message_selection(sender_id, message, step, state, interface)
-                    return
-                elif command == 'GAMES':
-                    handle_games_steps(sender_id, message, step, state, interface)
-                    return
-                elif command == 'TRIVIA':
-                    handle_trivia_steps(sender_id, message, step, state, interface)
-                    return
-                elif command == 'PROPAGATION':
-                    handle_propagation_steps(sender_id, message, step, state, interface)
-                    return
-                elif command == 'PROP_ANALYSIS':
-                    handle_propagation_analysis_steps(sender_id, message, step, state, interface)
-                    return
-                elif command == 'PROP_NODE_INPUT':
-                    handle_prop_node_input_steps(sender_id, message, step, state, interface)
-                    return
 
-            # Now check menu handlers (for main menu navigation)
-            if message_lower in handlers:
-                if state and state['command'] in ['BULLETIN_ACTION', 'BULLETIN_READ', 'BULLETIN_POST', 'BULLETIN_POST_CONTENT']:
-                    handlers[message_lower](sender_id, interface, state)
-                else:
-                    handlers[message_lower](sender_id, interface)
-            else:
-                handle_help_command(sender_id, interface)
+def handle_sync_frame(sender_id, sender_node_id, frame, interface):
+    """Reassemble a framed sync message from a peer BBS, apply it, and acknowledge it."""
+    reassembler = get_reassembler()
+    payload = reassembler.add(sender_node_id, frame)
+    parsed = parse_frame(frame)
+    if payload is not None and payload.startswith(AE_PREFIX):
+        # Anti-entropy exchanges are repeated every round, so they are not acknowledged
+        get_anti_entropy().handle(sender_node_id, decode_fields(payload))
+    elif payload is not None:
+        process_message(sender_id, payload, interface, is_sync_message=True)
+        send_sync_ack(parsed[0], sender_id, interface)
+    elif parsed and parsed[1] == parsed[2] - 1 and reassembler.completed_recently(sender_node_id, parsed[0]):
+        # A retransmission of a message that was already applied, so the earlier ACK was lost
+        send_sync_ack(parsed[0], sender_id, interface)
 
 
 def on_receive(packet, interface):
     try:
+        get_node_stats(interface).update_from_packet(packet, interface.nodes)
+        if packet.get('fromId') in interface.bbs_nodes:
+            get_sync_outbox().peer_heard(packet['fromId'])
         if 'decoded' in packet and packet['decoded']['portnum'] == 'TEXT_MESSAGE_APP':
             message_bytes = packet['decoded']['payload']
             message_string = message_bytes.decode('utf-8')
@@ -248,10 +156,14 @@ def on_receive(packet, interface):
 
             bbs_nodes = interface.bbs_nodes
             is_sync_message = any(message_string.startswith(prefix) for prefix in
-                                  ["BULLETIN|", "MAIL|", "DELETE_BULLETIN|", "DELETE_MAIL|"])
+                                  ["BULLETIN|", "MAIL|", "DELETE_BULLETIN|", "DELETE_MAIL|", "CHANNEL|"])
 
             if sender_node_id in bbs_nodes:
-                if is_sync_message:
+                if message_string.startswith(FRAME_PREFIX):
+                    handle_sync_frame(sender_id, sender_node_id, message_string, interface)
+                elif message_string.startswith("SYNC_ACK|"):
+                    get_sync_outbox().acknowledge(sender_node_id, message_string.split("|")[1].strip())
+                elif is_sync_message:
                     process_message(sender_id, message_string, interface, is_sync_message=True)
                 else:
                     logging.info("Ignoring non-sync message from known BBS node")
@@ -259,15 +171,7 @@ def on_receive(packet, interface):
                 process_message(sender_id, message_string, interface, is_sync_message=False)
             else:
                 logging.info("Ignoring message sent to group chat or from unknown node")
+        elif 'decoded' in packet and packet['decoded']['portnum'] == 'NODEINFO_APP':
+            get_node_index(interface).update_from_packet(packet)
     except KeyError as e:
         logging.error(f"Error processing packet: {e}")
-
-def get_recipient_id_by_mail(unique_id):
-    # Fix for Mail Delete sync issue
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT recipient FROM mail WHERE unique_id = ?", (unique_id,))
-    result = c.fetchone()
-    if result:
-        return result[0]
-    return None
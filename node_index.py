@@ -0,0 +1,100 @@
+import threading
+
+
+class NodeIndex:
+    """
+    Lookup index over ``interface.nodes``.
+
+    ``interface.nodes`` is keyed by node id ('!abcd1234'), so id lookups are already
+    O(1); this index adds node num -> node id and lowercased short name -> node ids.
+    It is updated incrementally from node-DB updates and NODEINFO packets. A lookup
+    miss only triggers a rebuild when the node DB has changed size since the last
+    rebuild, so unknown senders do not cause a full scan on every packet.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_num = {}
+        self._by_short_name = {}
+        self._short_names = {}
+        self._indexed_count = -1
+
+    def rebuild(self, nodes):
+        with self._lock:
+            self._by_num = {}
+            self._by_short_name = {}
+            self._short_names = {}
+            for node_id, node in list(nodes.items()):
+                self._add(node_id, node)
+            self._indexed_count = len(nodes)
+
+    def update_node(self, node_id, node):
+        if not node_id:
+            return
+        with self._lock:
+            self._add(node_id, node)
+
+    def update_from_packet(self, packet):
+        """Index the sender of a NODEINFO_APP packet."""
+        user = packet.get('decoded', {}).get('user', {})
+        node_id = user.get('id') or packet.get('fromId')
+        self.update_node(node_id, {'num': packet.get('from'), 'user': user})
+
+    def _add(self, node_id, node):
+        num = node.get('num')
+        if num is not None:
+            self._by_num[num] = node_id
+
+        short_name = (node.get('user') or {}).get('shortName')
+        old_short_name = self._short_names.get(node_id)
+        if old_short_name is not None and old_short_name != (short_name or '').lower():
+            ids = self._by_short_name.get(old_short_name)
+            if ids:
+                ids.discard(node_id)
+                if not ids:
+                    del self._by_short_name[old_short_name]
+        if short_name:
+            key = short_name.lower()
+            self._short_names[node_id] = key
+            self._by_short_name.setdefault(key, set()).add(node_id)
+
+    def _refresh_if_changed(self, nodes):
+        if len(nodes) != self._indexed_count:
+            self.rebuild(nodes)
+            return True
+        return False
+
+    def id_from_num(self, node_num, nodes):
+        node_id = self._by_num.get(node_num)
+        if node_id is not None:
+            node = nodes.get(node_id)
+            if node is not None and node.get('num') == node_num:
+                return node_id
+        if self._refresh_if_changed(nodes):
+            return self._by_num.get(node_num)
+        return None
+
+    def ids_by_short_name(self, short_name, nodes):
+        key = short_name.lower()
+        ids = self._by_short_name.get(key)
+        if not ids and self._refresh_if_changed(nodes):
+            ids = self._by_short_name.get(key)
+        if not ids:
+            return []
+        return [node_id for node_id in sorted(ids)
+                if (nodes.get(node_id) or {}).get('user', {}).get('shortName', '').lower() == key]
+
+
+def get_node_index(interface):
+    index = getattr(interface, 'node_index', None)
+    if index is None:
+        index = NodeIndex()
+        index.rebuild(interface.nodes)
+        interface.node_index = index
+    return index
+
+
+def on_node_updated(node, interface):
+    """pubsub handler for 'meshtastic.node.updated'."""
+    node_id = (node.get('user') or {}).get('id')
+    get_node_index(interface).update_node(node_id, node)
@@ -0,0 +1,261 @@
+import heapq
+import threading
+import time
+from collections import Counter
+
+LOW_BATTERY_LEVEL = 20
+ACTIVE_WINDOWS = (3600, 28800, 86400)
+
+
+class NodeEntry:
+    """What the stats menus show about one node."""
+
+    __slots__ = ('short_name', 'long_name', 'has_user', 'hw_model', 'role', 'snr', 'snr_seq',
+                 'last_heard', 'heard_seq', 'battery')
+
+    def __init__(self):
+        self.short_name = None
+        self.long_name = None
+        self.has_user = False
+        self.hw_model = None
+        self.role = None
+        self.snr = None
+        self.snr_seq = 0
+        self.last_heard = None
+        self.heard_seq = 0
+        self.battery = None
+
+
+class ActiveWindow:
+    """
+    The nodes heard in the last ``seconds``.
+
+    Each node in the window has one heap entry holding the time it entered, which may be
+    older than its current last heard time. Expiring an entry whose node was heard again
+    since re-queues it at the newer time instead of dropping the node.
+    """
+
+    __slots__ = ('seconds', 'members', 'heap')
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.members = {}
+        self.heap = []
+
+    def heard(self, node_id, last_heard, now):
+        if node_id in self.members:
+            self.members[node_id] = last_heard
+        elif last_heard >= now - self.seconds:
+            self.members[node_id] = last_heard
+            heapq.heappush(self.heap, (last_heard, node_id))
+
+    def count(self, now):
+        cutoff = now - self.seconds
+        heap, members = self.heap, self.members
+        while heap and heap[0][0] < cutoff:
+            _, node_id = heapq.heappop(heap)
+            last_heard = members[node_id]
+            if last_heard < cutoff:
+                del members[node_id]
+            else:
+                heapq.heappush(heap, (last_heard, node_id))
+        return len(members)
+
+
+class NodeStats:
+    """
+    Aggregates over ``interface.nodes`` for the Stats and Network Info menus.
+
+    Hardware and role histograms, top-k heaps by SNR and by last heard time, the set of
+    nodes with a low battery and counts of nodes heard in each of ``windows`` are kept up
+    to date from node-DB updates and received packets, so a menu only reads the handful of
+    entries it shows. Heap entries are tagged with a sequence number and skipped once the
+    node has a newer one; a heap is rebuilt when it holds more than twice as many entries
+    as there are nodes. If the node DB changes size behind our back, the aggregates are
+    rebuilt from it at most once every ``resync_interval`` seconds.
+    """
+
+    def __init__(self, windows=ACTIVE_WINDOWS, low_battery_level=LOW_BATTERY_LEVEL, resync_interval=300):
+        self.low_battery_level = low_battery_level
+        self.resync_interval = resync_interval
+        self._lock = threading.Lock()
+        self._window_seconds = windows
+        self._reset()
+        self._rebuilt_at = float('-inf')
+        self.rebuilds = 0
+
+    def _reset(self):
+        self._entries = {}
+        self._hw_models = Counter()
+        self._roles = Counter()
+        # Dicts rather than sets, so the menu lists nodes in the order they went low
+        self._low_battery = {}
+        self._snr_heap = []
+        self._heard_heap = []
+        self._seq = 0
+        self._windows = {seconds: ActiveWindow(seconds) for seconds in self._window_seconds}
+
+    def rebuild(self, nodes):
+        now = time.time()
+        with self._lock:
+            self._reset()
+            for node_id, node in list(nodes.items()):
+                if isinstance(node, dict):
+                    self._apply(node_id, node.get('user'), node.get('lastHeard'), node.get('snr'),
+                                (node.get('deviceMetrics') or {}).get('batteryLevel'), now)
+            self._rebuilt_at = time.monotonic()
+            self.rebuilds += 1
+
+    def update_node(self, node_id, node):
+        if not node_id:
+            return
+        with self._lock:
+            self._apply(node_id, node.get('user'), node.get('lastHeard'), node.get('snr'),
+                        (node.get('deviceMetrics') or {}).get('batteryLevel'), time.time())
+
+    def update_from_packet(self, packet, nodes):
+        """Account for a received packet: its sender was heard, with this SNR and maybe new user or battery info."""
+        node_id = packet.get('fromId')
+        if not node_id:
+            return
+        node = nodes.get(node_id) or {}
+        decoded = packet.get('decoded') or {}
+        user = node.get('user')
+        battery = (node.get('deviceMetrics') or {}).get('batteryLevel')
+        portnum = decoded.get('portnum')
+        if portnum == 'NODEINFO_APP' and decoded.get('user'):
+            user = decoded['user']
+        elif portnum == 'TELEMETRY_APP':
+            battery = ((decoded.get('telemetry') or {}).get('deviceMetrics') or {}).get('batteryLevel', battery)
+        last_heard = packet.get('rxTime', node.get('lastHeard'))
+        snr = packet.get('rxSnr', node.get('snr'))
+        with self._lock:
+            self._apply(node_id, user, last_heard, snr, battery, time.time())
+
+    def _apply(self, node_id, user, last_heard, snr, battery, now):
+        entry = self._entries.get(node_id)
+        if entry is None:
+            entry = self._entries[node_id] = NodeEntry()
+
+        if isinstance(user, dict):
+            if entry.has_user:
+                self._uncount(self._hw_models, entry.hw_model)
+                self._uncount(self._roles, entry.role)
+            entry.has_user = True
+            entry.short_name = user.get('shortName')
+            entry.long_name = user.get('longName')
+            entry.hw_model = user.get('hwModel')
+            entry.role = user.get('role')
+            self._hw_models[entry.hw_model] += 1
+            self._roles[entry.role] += 1
+
+        if snr is not None and snr != entry.snr:
+            entry.snr = snr
+            entry.snr_seq = self._push(self._snr_heap, -snr, node_id)
+
+        # lastHeard only moves forward; an older value from a stale node record is ignored
+        if last_heard is not None and (entry.last_heard is None or last_heard > entry.last_heard):
+            entry.last_heard = last_heard
+            entry.heard_seq = self._push(self._heard_heap, -last_heard, node_id)
+            for window in self._windows.values():
+                window.heard(node_id, last_heard, now)
+
+        if battery is not None:
+            entry.battery = battery
+            if battery < self.low_battery_level:
+                self._low_battery.setdefault(node_id, None)
+            else:
+                self._low_battery.pop(node_id, None)
+
+        # Only once the entry holds its new sequence numbers, or _compact would re-add it as outdated
+        limit = 2 * len(self._entries) + 64
+        if len(self._snr_heap) > limit or len(self._heard_heap) > limit:
+            self._compact()
+
+    @staticmethod
+    def _uncount(counter, key):
+        counter[key] -= 1
+        if counter[key] <= 0:
+            del counter[key]
+
+    def _push(self, heap, key, node_id):
+        """Add a heap entry and return its sequence number; the caller stores it on the node entry."""
+        self._seq += 1
+        heapq.heappush(heap, (key, self._seq, node_id))
+        return self._seq
+
+    def _compact(self):
+        entries = self._entries
+        self._snr_heap = [(-entry.snr, entry.snr_seq, node_id) for node_id, entry in entries.items()
+                          if entry.snr is not None]
+        self._heard_heap = [(-entry.last_heard, entry.heard_seq, node_id) for node_id, entry in entries.items()
+                            if entry.last_heard is not None]
+        heapq.heapify(self._snr_heap)
+        heapq.heapify(self._heard_heap)
+
+    def _top(self, heap, k, seq_field):
+        """The first ``k`` current entries of a heap, dropping the outdated ones passed on the way."""
+        entries = self._entries
+        top = []
+        while heap and len(top) < k:
+            item = heapq.heappop(heap)
+            entry = entries.get(item[2])
+            if entry is not None and getattr(entry, seq_field) == item[1]:
+                top.append(item)
+        for item in top:
+            heapq.heappush(heap, item)
+        return [(node_id, entries[node_id]) for _, _, node_id in top]
+
+    def sync(self, nodes):
+        """Rebuild if the node DB has a different number of nodes and the last rebuild was a while ago."""
+        if len(nodes) != len(self._entries) and time.monotonic() - self._rebuilt_at >= self.resync_interval:
+            self.rebuild(nodes)
+
+    def top_snr(self, k=10):
+        """(snr, short name, long name) of the ``k`` nodes with the best SNR."""
+        with self._lock:
+            return [(entry.snr, entry.short_name, entry.long_name)
+                    for _, entry in self._top(self._snr_heap, k, 'snr_seq')]
+
+    def most_recent(self, k=10):
+        """(last heard, short name, long name, snr) of the ``k`` nodes heard most recently."""
+        with self._lock:
+            return [(entry.last_heard, entry.short_name, entry.long_name, entry.snr)
+                    for _, entry in self._top(self._heard_heap, k, 'heard_seq')]
+
+    def active_count(self, seconds, now=None):
+        """Nodes heard in the last ``seconds``, which must be one of the tracked windows."""
+        with self._lock:
+            return self._windows[seconds].count(time.time() if now is None else now)
+
+    def hardware_models(self):
+        """(hwModel, count) for nodes with user info, in the order the models were first seen."""
+        with self._lock:
+            return list(self._hw_models.items())
+
+    def roles(self):
+        with self._lock:
+            return list(self._roles.items())
+
+    def low_battery(self):
+        """(long name, battery level) of nodes below ``low_battery_level``."""
+        with self._lock:
+            return [(self._entries[node_id].long_name, self._entries[node_id].battery)
+                    for node_id in self._low_battery]
+
+
+def get_node_stats(interface):
+    stats = getattr(interface, 'node_stats', None)
+    if stats is None:
+        stats = NodeStats()
+        stats.rebuild(interface.nodes)
+        interface.node_stats = stats
+    else:
+        stats.sync(interface.nodes)
+    return stats
+
+
+def on_node_updated(node, interface):
+    """pubsub handler for 'meshtastic.node.updated'."""
+    node_id = (node.get('user') or {}).get('id')
+    get_node_stats(interface).update_node(node_id, node)
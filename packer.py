@@ -0,0 +1,86 @@
+DEFAULT_MAX_PAYLOAD = 200
+# Smaller frames would leave no room for the sync frame header, and barely any text
+MIN_MAX_PAYLOAD = 32
+
+
+def utf8_len(text):
+    return len(text.encode('utf-8'))
+
+
+def split_utf8(text, max_bytes):
+    """
+    Split text into pieces of at most max_bytes UTF-8 bytes without cutting a character in half.
+
+    A character wider than ``max_bytes`` becomes a piece on its own, so every piece
+    holds at least one whole character.
+    """
+    if max_bytes < 1:
+        raise ValueError(f"Cannot split text into pieces of {max_bytes} bytes")
+    data = text.encode('utf-8')
+    pieces = []
+    start = 0
+    while start < len(data):
+        end = min(start + max_bytes, len(data))
+        # Back off continuation bytes (0b10xxxxxx) so the cut lands on a character boundary
+        while end < len(data) and end > start and data[end] & 0xC0 == 0x80:
+            end -= 1
+        if end == start:
+            # The next character alone is longer than max_bytes; take all of it
+            end += 1
+            while end < len(data) and data[end] & 0xC0 == 0x80:
+                end += 1
+        pieces.append(data[start:end].decode('utf-8'))
+        start = end
+    return pieces
+
+
+def _split_line(line, max_bytes):
+    """Split one line that is too long for a frame, preferring word boundaries."""
+    pieces = []
+    current = ''
+    for word in line.split(' '):
+        candidate = f"{current} {word}" if current else word
+        if utf8_len(candidate) <= max_bytes:
+            current = candidate
+            continue
+        if current:
+            pieces.append(current)
+        if utf8_len(word) <= max_bytes:
+            current = word
+        else:
+            *full, current = split_utf8(word, max_bytes)
+            pieces.extend(full)
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def pack_message(message, max_bytes=DEFAULT_MAX_PAYLOAD):
+    """
+    Pack a message into frames of at most ``max_bytes`` UTF-8 bytes.
+
+    Whole lines are packed greedily into each frame. A line that does not fit in the
+    current frame starts the next one, and a line longer than a whole frame is split
+    at spaces, or between characters as a last resort. The newline or space a frame
+    boundary falls on is dropped, since each frame is displayed as its own message.
+    """
+    if utf8_len(message) <= max_bytes:
+        return [message] if message else []
+
+    frames = []
+    current = None
+    for line in message.split('\n'):
+        if current is not None:
+            candidate = f"{current}\n{line}"
+            if utf8_len(candidate) <= max_bytes:
+                current = candidate
+                continue
+            frames.append(current)
+        if utf8_len(line) <= max_bytes:
+            current = line
+        else:
+            *full, current = _split_line(line, max_bytes) or ['']
+            frames.extend(full)
+    if current:
+        frames.append(current)
+    return [frame for frame in frames if frame.strip()]
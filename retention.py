@@ -0,0 +1,242 @@
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import db_manager
+
+DAY = 86400
+HOUR = 3600
+
+
+class RetentionPolicy:
+    """
+    How long rows in one table are kept and what happens when they expire.
+
+    Raw rows older than ``raw_days`` are optionally appended to a gzip JSON-lines
+    archive, optionally downsampled into an hourly rollup table (``<metric>_sum`` and
+    ``<metric>_count`` per metric, grouped by ``keys`` and hour), and then deleted.
+    Rollup buckets older than ``rollup_days`` are deleted in turn.
+    """
+
+    def __init__(self, table, raw_days, time_column='timestamp', archive=True,
+                 rollup_table=None, keys=(), metrics=(), rollup_days=365):
+        self.table = table
+        self.raw_days = raw_days
+        self.time_column = time_column
+        self.archive = archive
+        self.rollup_table = rollup_table
+        self.keys = tuple(keys)
+        self.metrics = tuple(metrics)
+        self.rollup_days = rollup_days
+
+    def rollup_schema(self):
+        columns = [f"{key} TEXT NOT NULL" for key in self.keys]
+        columns += ["bucket INTEGER NOT NULL", "samples INTEGER NOT NULL DEFAULT 0"]
+        for metric in self.metrics:
+            columns += [f"{metric}_sum REAL NOT NULL DEFAULT 0", f"{metric}_count INTEGER NOT NULL DEFAULT 0"]
+        primary_key = ', '.join(self.keys + ('bucket',))
+        return f"CREATE TABLE IF NOT EXISTS {self.rollup_table} ({', '.join(columns)}, PRIMARY KEY ({primary_key}))"
+
+    def rollup_sql(self):
+        """INSERT ... SELECT that folds the rows matched by (max rowid, cutoff) into the rollup table."""
+        targets = list(self.keys) + ['bucket', 'samples']
+        selects = list(self.keys) + [f"({self.time_column} / {HOUR}) * {HOUR}", "COUNT(*)"]
+        updates = ["samples = samples + excluded.samples"]
+        for metric in self.metrics:
+            targets += [f"{metric}_sum", f"{metric}_count"]
+            selects += [f"COALESCE(SUM({metric}), 0)", f"COUNT({metric})"]
+            updates += [f"{metric}_sum = {metric}_sum + excluded.{metric}_sum",
+                        f"{metric}_count = {metric}_count + excluded.{metric}_count"]
+        group_by = ', '.join(str(i + 1) for i in range(len(self.keys) + 1))
+        conflict = ', '.join(self.keys + ('bucket',))
+        return (f"INSERT INTO {self.rollup_table} ({', '.join(targets)}) "
+                f"SELECT {', '.join(selects)} FROM {self.table} "
+                f"WHERE rowid <= ? AND {self.time_column} < ? GROUP BY {group_by} "
+                f"ON CONFLICT({conflict}) DO UPDATE SET {', '.join(updates)}")
+
+
+DEFAULT_POLICIES = [
+    # message_logs is already rolled up into message_log_hourly/daily as rows are logged
+    RetentionPolicy('message_logs', raw_days=14),
+    RetentionPolicy('message_log_hourly', raw_days=365, time_column='bucket', archive=False),
+    RetentionPolicy('telemetry_logs', raw_days=14, rollup_table='telemetry_hourly', keys=('node_id',),
+                    metrics=('battery_level', 'voltage', 'channel_util', 'air_util_tx',
+                             'temperature', 'humidity', 'pressure')),
+    RetentionPolicy('position_logs', raw_days=14, rollup_table='position_hourly', keys=('node_id',),
+                    metrics=('latitude', 'longitude', 'altitude', 'satellites_in_view')),
+    RetentionPolicy('neighbor_info', raw_days=14, rollup_table='neighbor_hourly', keys=('node_id', 'neighbor_id'),
+                    metrics=('snr',)),
+]
+
+BBS_TABLES = ('message_logs', 'message_log_hourly')
+TELEMETRY_TABLES = ('telemetry_logs', 'position_logs', 'neighbor_info')
+
+
+class RetentionEngine:
+    """
+    Applies retention policies in small batches.
+
+    Each batch is its own short transaction of at most ``batch_size`` rows, with a
+    pause between batches, so a large backlog never holds the write lock for long.
+    """
+
+    def __init__(self, db_path=None, policies=None, batch_size=500, max_batches=20, pause=0.2,
+                 archive_dir='archive'):
+        self.db_path = db_path
+        self.policies = policies if policies is not None else DEFAULT_POLICIES
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.pause = pause
+        self.archive_dir = archive_dir
+        self.rows_archived = 0
+        self.rows_downsampled = 0
+        self.rows_deleted = 0
+
+    def run(self, now=None):
+        """Run one incremental pass over every policy. Returns the number of rows removed."""
+        now = int(now or time.time())
+        conn = db_manager.get_connection(self.db_path)
+        removed = 0
+        for policy in self.policies:
+            if not self._table_exists(conn, policy.table):
+                continue
+            try:
+                if policy.rollup_table:
+                    with conn:
+                        conn.execute(policy.rollup_schema())
+                removed += self._expire(conn, policy.table, policy.time_column,
+                                        now - policy.raw_days * DAY, policy)
+                if policy.rollup_table and policy.rollup_days:
+                    removed += self._expire(conn, policy.rollup_table, 'bucket',
+                                            now - policy.rollup_days * DAY, None)
+            except sqlite3.Error as e:
+                logging.error(f"Retention pass failed for {policy.table}: {e}")
+        if removed:
+            logging.info(f"Retention removed {removed} rows (archived={self.rows_archived} "
+                         f"downsampled={self.rows_downsampled} deleted={self.rows_deleted})")
+        return removed
+
+    def _table_exists(self, conn, table):
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+
+    def _expire(self, conn, table, time_column, cutoff, raw_policy):
+        removed = 0
+        for _ in range(self.max_batches):
+            # Rows are appended in roughly time order, so the oldest expired rows are found
+            # at the start of a rowid scan without needing a timestamp index. The probe runs
+            # before the write lock is taken: when nothing has expired it still reads the whole
+            # table, and writers must not wait on that. Rows added after it have higher rowids,
+            # so the (max rowid, cutoff) bounds below still match only what it found.
+            row = conn.execute(f"SELECT MAX(rowid) FROM (SELECT rowid FROM {table} "
+                               f"WHERE {time_column} < ? ORDER BY rowid LIMIT ?)",
+                               (cutoff, self.batch_size)).fetchone()
+            max_id = row[0]
+            if max_id is None:
+                break
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if raw_policy and raw_policy.archive:
+                    self._archive(conn, table, time_column, max_id, cutoff)
+                if raw_policy and raw_policy.rollup_table:
+                    c = conn.execute(raw_policy.rollup_sql(), (max_id, cutoff))
+                    self.rows_downsampled += max(c.rowcount, 0)
+                c = conn.execute(f"DELETE FROM {table} WHERE rowid <= ? AND {time_column} < ?", (max_id, cutoff))
+                removed += c.rowcount
+                self.rows_deleted += c.rowcount
+            time.sleep(self.pause)
+        return removed
+
+    def _archive(self, conn, table, time_column, max_id, cutoff):
+        cursor = conn.execute(f"SELECT * FROM {table} WHERE rowid <= ? AND {time_column} < ?", (max_id, cutoff))
+        columns = [description[0] for description in cursor.description]
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        os.makedirs(self.archive_dir, exist_ok=True)
+        time_index = columns.index(time_column)
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(time.strftime('%Y%m', time.gmtime(row[time_index])), []).append(row)
+        for month, month_rows in by_month.items():
+            path = os.path.join(self.archive_dir, f"{table}-{month}.jsonl.gz")
+            # Appending to a gzip file adds a new member; gzip readers treat the members as one stream
+            with gzip.open(path, 'at', encoding='utf-8') as archive:
+                for row in month_rows:
+                    archive.write(json.dumps(dict(zip(columns, row))) + '\n')
+        self.rows_archived += len(rows)
+
+
+def build_engine(config, tables, db_path=None):
+    """
+    Build a RetentionEngine for ``tables`` from the [retention] config section.
+
+    ``raw_days`` applies to raw tables, ``rollup_days`` to hourly rollups, and
+    ``<table>_days`` overrides either for a single table.
+    """
+    raw_days = config.getint('retention', 'raw_days', fallback=None)
+    rollup_days = config.getint('retention', 'rollup_days', fallback=None)
+    policies = []
+    for default in DEFAULT_POLICIES:
+        if default.table not in tables:
+            continue
+        is_rollup = default.time_column == 'bucket'
+        days = (rollup_days if is_rollup else raw_days) or default.raw_days
+        policies.append(RetentionPolicy(
+            default.table,
+            config.getint('retention', f'{default.table}_days', fallback=days),
+            default.time_column,
+            default.archive,
+            default.rollup_table,
+            default.keys,
+            default.metrics,
+            rollup_days or default.rollup_days
+        ))
+    return RetentionEngine(
+        db_path,
+        policies,
+        batch_size=config.getint('retention', 'batch_size', fallback=500),
+        archive_dir=config.get('retention', 'archive_dir', fallback='archive')
+    )
+
+
+class RetentionScheduler:
+    """Runs a RetentionEngine pass every ``interval`` seconds on a background thread."""
+
+    def __init__(self, engine, interval=3600):
+        self.engine = engine
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.engine.run()
+            except Exception as e:
+                logging.error(f"Retention pass failed: {e}")
+        db_manager.close_connection(self.engine.db_path)
+
+
+def start_retention(config, tables, db_path=None):
+    """Start scheduled retention for ``tables`` unless it is disabled in the config."""
+    if not config.getboolean('retention', 'enabled', fallback=False):
+        return None
+    scheduler = RetentionScheduler(build_engine(config, tables, db_path),
+                                   config.getint('retention', 'interval', fallback=3600))
+    scheduler.start()
+    return scheduler
@@ -0,0 +1,174 @@
+import bisect
+import heapq
+import logging
+import threading
+import time
+
+PRIORITY_URGENT = 'urgent'
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_SYNC = 'sync'
+
+DEFAULT_WEIGHTS = {
+    PRIORITY_URGENT: 8.0,
+    PRIORITY_INTERACTIVE: 4.0,
+    PRIORITY_SYNC: 1.0
+}
+
+# Upper bounds (seconds) of the queueing-latency histogram buckets; the last bucket is open-ended.
+LATENCY_BUCKETS = [1, 2, 5, 10, 30, 60, 120, 300]
+
+
+class SendScheduler:
+    """
+    Outbound transmit scheduler for the mesh radio.
+
+    Handlers enqueue a message (already split into chunks) and return immediately; a
+    single pacing thread drains the queue and hands each chunk to ``transmit`` with
+    ``pacing`` seconds of airtime between sends.
+
+    Messages are scheduled with start-time weighted fair queuing. Every (priority,
+    destination) pair is its own flow, weighted by its priority class, and a message
+    costs one unit per chunk. The flow with the smallest virtual finish tag is served
+    next, so a chatty user or a large peer-sync backlog only ever gets its weighted
+    share of the airtime. Finish tags only grow within a flow, so messages for one
+    destination and class go out in submission order and their chunks are never
+    interleaved.
+    """
+
+    def __init__(self, transmit, pacing=2.0, maxsize=500, put_timeout=5.0, weights=None, stats_interval=900):
+        self.transmit = transmit
+        self.pacing = pacing
+        self.maxsize = maxsize
+        self.put_timeout = put_timeout
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights:
+            self.weights.update(weights)
+        self.stats_interval = stats_interval
+
+        self._heap = []
+        self._seq = 0
+        self._virtual_time = 0.0
+        self._flow_finish = {}
+        self._cond = threading.Condition()
+
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.latency = {priority: [0] * (len(LATENCY_BUCKETS) + 1) for priority in self.weights}
+        self._running = False
+        self._thread = None
+        self._last_stats_log = time.time()
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='send-scheduler', daemon=True)
+        self._thread.start()
+
+    def submit(self, chunks, destination, interface, priority=PRIORITY_INTERACTIVE):
+        """Queue one message's chunks for transmission. Returns False if the queue stayed full."""
+        if priority not in self.weights:
+            priority = PRIORITY_INTERACTIVE
+        deadline = time.time() + self.put_timeout
+        with self._cond:
+            while len(self._heap) >= self.maxsize:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.dropped += 1
+                    logging.error(f"Send queue full ({self.maxsize}), dropping {priority} message to {destination}")
+                    return False
+                self._cond.wait(remaining)
+
+            flow = (priority, destination)
+            start = max(self._virtual_time, self._flow_finish.get(flow, 0.0))
+            finish = start + len(chunks) / self.weights[priority]
+            self._flow_finish[flow] = finish
+            self._seq += 1
+            heapq.heappush(self._heap, (finish, self._seq, start, flow, chunks, interface, time.time()))
+
+            depth = len(self._heap)
+            if depth > self.max_depth:
+                self.max_depth = depth
+            self._cond.notify_all()
+        return True
+
+    def depth(self):
+        with self._cond:
+            return len(self._heap)
+
+    def depth_by_priority(self):
+        with self._cond:
+            depths = {priority: 0 for priority in self.weights}
+            for entry in self._heap:
+                depths[entry[3][0]] += 1
+            return depths
+
+    def stats(self):
+        return {
+            'depth': self.depth(),
+            'depth_by_priority': self.depth_by_priority(),
+            'max_depth': self.max_depth,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'latency': {priority: list(counts) for priority, counts in self.latency.items()}
+        }
+
+    def log_stats(self):
+        labels = [f"<={bound}s" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+        logging.info(f"Send queue: depth={self.depth()} max_depth={self.max_depth} sent={self.sent} "
+                     f"dropped={self.dropped} failed={self.failed}")
+        for priority, counts in self.latency.items():
+            histogram = ' '.join(f"{label}:{count}" for label, count in zip(labels, counts) if count)
+            logging.info(f"Send queue latency [{priority}] {histogram or 'no samples'}")
+
+    def stop(self, timeout=10.0):
+        """Stop the pacing thread, giving queued chunks up to ``timeout`` seconds to drain."""
+        if not self._running:
+            return
+        deadline = time.time() + timeout
+        while self.depth() and time.time() < deadline:
+            time.sleep(0.1)
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._thread.join(timeout=max(0.0, deadline - time.time()) + self.pacing)
+        self.log_stats()
+
+    def _next(self):
+        with self._cond:
+            while self._running and not self._heap:
+                self._cond.wait()
+            if not self._running:
+                return None
+            finish, _, start, flow, chunks, interface, queued_at = heapq.heappop(self._heap)
+            self._virtual_time = max(self._virtual_time, start)
+            if not self._heap:
+                # Idle: drop finish tags so returning flows are not penalised for past usage.
+                self._flow_finish.clear()
+            self._cond.notify_all()
+            return flow, chunks, interface, queued_at
+
+    def _run(self):
+        while True:
+            item = self._next()
+            if item is None:
+                break
+            (priority, destination), chunks, interface, queued_at = item
+            waited = time.time() - queued_at
+            self.latency[priority][bisect.bisect_left(LATENCY_BUCKETS, waited)] += 1
+
+            for chunk in chunks:
+                try:
+                    self.transmit(chunk, destination, interface)
+                    self.sent += 1
+                except Exception as e:
+                    self.failed += 1
+                    logging.error(f"REPLY SEND ERROR {e}")
+                time.sleep(self.pacing)
+
+            if self.stats_interval and time.time() - self._last_stats_log >= self.stats_interval:
+                self._last_stats_log = time.time()
+                self.log_stats()
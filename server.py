@@ -15,10 +15,20 @@ other BBS servers listed in the config.ini file.
 import logging
 import time
 
+from anti_entropy import shutdown_anti_entropy, start_anti_entropy
 from config_init import initialize_config, get_interface, init_cli_parser, merge_config
-from db_operations import initialize_database
+from config_service import get_config_service, shutdown_config_service
+from db_manager import Checkpointer
+from db_operations import initialize_database, shutdown_message_log_writer
 from js8call_integration import JS8CallClient
 from message_processing import on_receive
+from node_index import on_node_updated
+from node_stats import on_node_updated as on_node_stats_updated
+from retention import BBS_TABLES, start_retention
+from session_store import get_session_store, shutdown_session_store
+from sync_apply import get_sync_applier
+from utils import shutdown_send_scheduler, shutdown_sync_outbox, start_sync_outbox
+from weather_service import shutdown_weather_service
 from pubsub import pub
 
 # General logging
@@ -63,21 +73,39 @@ def main():
     interface.bbs_nodes = system_config['bbs_nodes']
     interface.allowed_nodes = system_config['allowed_nodes']
 
+    def apply_node_lists(snapshot):
+        interface.bbs_nodes = list(snapshot.bbs_nodes)
+        interface.allowed_nodes = list(snapshot.allowed_nodes)
+        logging.info(f"Now syncing with BBS nodes {interface.bbs_nodes}, allowed nodes {interface.allowed_nodes}")
+
+    # Menus, sync peers and the allow list follow edits to the config file without a restart
+    config_service = get_config_service(config_file or 'config.ini')
+    config_service.subscribe(apply_node_lists)
+    config_service.start()
+
     logging.info(f"TC²-BBS is running on {system_config['interface_type']} interface...")
 
     initialize_database()
+    checkpointer = Checkpointer()
+    checkpointer.start()
+    retention = start_retention(system_config['config'], BBS_TABLES)
+    get_session_store().start()
 
     def receive_packet(packet, interface):
         on_receive(packet, interface)
 
     pub.subscribe(receive_packet, system_config['mqtt_topic'])
+    pub.subscribe(on_node_updated, 'meshtastic.node.updated')
+    pub.subscribe(on_node_stats_updated, 'meshtastic.node.updated')
+    start_sync_outbox(interface)
+    start_anti_entropy(interface)
 
     # Initialize and start JS8Call Client if configured
     js8call_client = JS8CallClient(interface)
     js8call_client.logger = js8call_logger
 
     if js8call_client.db_conn:
-        js8call_client.connect()
+        js8call_client.start()
 
     try:
         while True:
@@ -85,9 +113,19 @@ def main():
 
     except KeyboardInterrupt:
         logging.info("Shutting down the server...")
+        shutdown_config_service()
+        shutdown_weather_service()
+        shutdown_anti_entropy()
+        shutdown_sync_outbox()
+        logging.info(f"Sync apply counters: {get_sync_applier().stats()}")
+        shutdown_send_scheduler()
+        shutdown_session_store()
+        shutdown_message_log_writer()
+        if retention:
+            retention.stop()
+        checkpointer.stop()
+        js8call_client.close()
         interface.close()
-        if js8call_client.connected:
-            js8call_client.close()
 
 if __name__ == "__main__":
     main()
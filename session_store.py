@@ -0,0 +1,287 @@
+import configparser
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import db_manager
+
+
+class Draft:
+    """A bulletin or mail body being composed line by line, appended to one UTF-8 buffer until it is taken."""
+
+    __slots__ = ('buffer', 'max_bytes')
+
+    def __init__(self, max_bytes, text=''):
+        self.buffer = bytearray(text.encode('utf-8'))
+        self.max_bytes = max_bytes
+
+    def append(self, line):
+        """Add a line. Returns False, leaving the draft unchanged, if it would exceed ``max_bytes``."""
+        part = (line + "\n").encode('utf-8')
+        if self.max_bytes and len(self.buffer) + len(part) > self.max_bytes:
+            return False
+        self.buffer += part
+        return True
+
+    def text(self):
+        return self.buffer.decode('utf-8')
+
+
+class Session:
+    __slots__ = ('state', 'draft', 'last_seen')
+
+    def __init__(self, state, draft=None, last_seen=None):
+        self.state = state
+        self.draft = draft
+        self.last_seen = time.monotonic() if last_seen is None else last_seen
+
+
+class SessionStore:
+    """
+    Per-user command state, shared by the mesh and JS8Call threads.
+
+    Sessions are spread over ``stripes`` independently locked LRU maps. A session idle
+    for longer than ``idle_ttl`` seconds (``draft_ttl`` while a draft is being written)
+    is dropped, as is the least recently used one when a stripe is over its share of
+    ``max_sessions``. Sessions with a draft are written behind to the user_sessions
+    table every ``flush_interval`` seconds and reloaded on start, so a restart does not
+    lose a bulletin or mail that is half written.
+    """
+
+    def __init__(self, db_path=None, idle_ttl=1800, draft_ttl=86400, max_sessions=5000, stripes=16,
+                 max_draft_bytes=4000, flush_interval=5):
+        self.db_path = db_path
+        self.idle_ttl = idle_ttl
+        self.draft_ttl = draft_ttl
+        self.max_draft_bytes = max_draft_bytes
+        self.flush_interval = flush_interval
+        # Plain dicts keep insertion order, so re-inserting a session on use keeps each stripe in LRU order
+        self._stripes = [(threading.Lock(), {}) for _ in range(stripes)]
+        self._stripe_size = max(1, max_sessions // stripes)
+
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.expired = 0
+        self.evicted = 0
+        self.flushed = 0
+        self.draft_rejects = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.load()
+        self._thread = threading.Thread(target=self._run, name='session-store', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+        logging.info(f"Session store stopped: {self.stats()}")
+
+    def get(self, user_id):
+        """The user's current state dict, or None."""
+        lock, sessions = self._stripe(user_id)
+        now = time.monotonic()
+        with lock:
+            session = sessions.get(user_id)
+            if session is None:
+                return None
+            if self._is_expired(session, now):
+                self._drop(user_id, sessions)
+                self.expired += 1
+                return None
+            session.last_seen = now
+            sessions[user_id] = sessions.pop(user_id)
+            return session.state
+
+    def set(self, user_id, state):
+        """
+        Replace the user's state; None ends the session along with any draft.
+
+        A draft belongs to the state it was started in, so moving to any other state
+        (a quick command sent mid-post, or leaving for a menu) discards it.
+        """
+        lock, sessions = self._stripe(user_id)
+        with lock:
+            if state is None:
+                self._drop(user_id, sessions)
+                return
+            session = sessions.get(user_id)
+            if session is None:
+                sessions[user_id] = Session(state)
+                self._evict(sessions)
+                return
+            if session.draft is not None:
+                if state != session.state:
+                    session.draft = None
+                self._mark_dirty(user_id)
+            session.state = state
+            session.last_seen = time.monotonic()
+            sessions[user_id] = sessions.pop(user_id)
+
+    def start_draft(self, user_id):
+        """Begin an empty draft for a user who already has a session."""
+        self._with_session(user_id, lambda session: setattr(session, 'draft', Draft(self.max_draft_bytes)))
+
+    def append_draft(self, user_id, line):
+        """Add a line to the user's draft. Returns False if the draft is full or missing."""
+        def append(session):
+            if session.draft is None:
+                session.draft = Draft(self.max_draft_bytes)
+            return session.draft.append(line)
+        appended = self._with_session(user_id, append)
+        if appended is False:
+            self.draft_rejects += 1
+        return bool(appended)
+
+    def take_draft(self, user_id):
+        """Return the draft text and remove the draft from the session."""
+        def take(session):
+            draft, session.draft = session.draft, None
+            return draft.text() if draft else ''
+        return self._with_session(user_id, take) or ''
+
+    def load(self):
+        """Restore sessions with drafts saved before the last shutdown."""
+        conn = db_manager.get_connection(self.db_path)
+        now, wall = time.monotonic(), time.time()
+        loaded = 0
+        for user_id, state, draft, updated_at in conn.execute(
+                "SELECT user_id, state, draft, updated_at FROM user_sessions"):
+            lock, sessions = self._stripe(user_id)
+            with lock:
+                if user_id not in sessions:
+                    sessions[user_id] = Session(json.loads(state), Draft(self.max_draft_bytes, draft),
+                                                now - (wall - updated_at))
+                    loaded += 1
+        if loaded:
+            logging.info(f"Restored {loaded} session(s) with unfinished drafts")
+
+    def flush(self):
+        """Write dirty sessions with drafts to the database and delete rows of sessions that no longer have one."""
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        upserts, deletes = [], []
+        wall = time.time()
+        for user_id in dirty:
+            lock, sessions = self._stripe(user_id)
+            with lock:
+                session = sessions.get(user_id)
+                if session is None or session.draft is None:
+                    deletes.append((user_id,))
+                    continue
+                try:
+                    upserts.append((user_id, json.dumps(session.state), session.draft.text(), wall))
+                except TypeError:
+                    logging.warning(f"Session state of {user_id} cannot be saved")
+        conn = db_manager.get_connection(self.db_path)
+        try:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO user_sessions (user_id, state, draft, updated_at) "
+                                 "VALUES (?, ?, ?, ?)", upserts)
+                conn.executemany("DELETE FROM user_sessions WHERE user_id = ?", deletes)
+            self.flushed += len(upserts) + len(deletes)
+        except sqlite3.Error as e:
+            logging.error(f"Saving sessions failed: {e}")
+            with self._dirty_lock:
+                self._dirty |= dirty
+
+    def sweep(self):
+        """Drop every idle session."""
+        now = time.monotonic()
+        for lock, sessions in self._stripes:
+            with lock:
+                expired = [user_id for user_id, session in sessions.items() if self._is_expired(session, now)]
+                for user_id in expired:
+                    self._drop(user_id, sessions)
+            self.expired += len(expired)
+
+    def stats(self):
+        sessions = drafts = 0
+        for lock, stripe in self._stripes:
+            with lock:
+                sessions += len(stripe)
+                drafts += sum(1 for session in stripe.values() if session.draft is not None)
+        return {
+            'sessions': sessions,
+            'drafts': drafts,
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'flushed': self.flushed,
+            'draft_rejects': self.draft_rejects
+        }
+
+    def _stripe(self, user_id):
+        return self._stripes[hash(user_id) % len(self._stripes)]
+
+    def _with_session(self, user_id, action):
+        lock, sessions = self._stripe(user_id)
+        with lock:
+            session = sessions.get(user_id)
+            if session is None:
+                return None
+            result = action(session)
+            session.last_seen = time.monotonic()
+            self._mark_dirty(user_id)
+            return result
+
+    def _is_expired(self, session, now):
+        ttl = self.draft_ttl if session.draft is not None else self.idle_ttl
+        return now - session.last_seen > ttl
+
+    def _drop(self, user_id, sessions):
+        session = sessions.pop(user_id, None)
+        if session is not None and session.draft is not None:
+            self._mark_dirty(user_id)
+
+    def _evict(self, sessions):
+        while len(sessions) > self._stripe_size:
+            user_id = next(iter(sessions))
+            session = sessions.pop(user_id)
+            if session.draft is not None:
+                self._mark_dirty(user_id)
+            self.evicted += 1
+
+    def _mark_dirty(self, user_id):
+        with self._dirty_lock:
+            self._dirty.add(user_id)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.sweep()
+            self.flush()
+        db_manager.close_connection(self.db_path)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = configparser.ConfigParser()
+            config.read('config.ini')
+            _store = SessionStore(
+                idle_ttl=config.getint('sessions', 'idle_ttl', fallback=1800),
+                draft_ttl=config.getint('sessions', 'draft_ttl', fallback=86400),
+                max_sessions=config.getint('sessions', 'max_sessions', fallback=5000),
+                max_draft_bytes=config.getint('sessions', 'max_draft_bytes', fallback=4000),
+                flush_interval=config.getint('sessions', 'flush_interval', fallback=5)
+            )
+        return _store
+
+
+def shutdown_session_store():
+    if _store is not None:
+        _store.stop()
@@ -0,0 +1,110 @@
+import logging
+import threading
+from collections import Counter, OrderedDict
+
+from meshtastic import BROADCAST_NUM
+
+from db_operations import (
+    SYNC_APPLIED, SYNC_CONFLICT, SYNC_DUPLICATE,
+    add_channel, delete_bulletin, delete_mail, upsert_bulletin, upsert_mail
+)
+from send_queue import PRIORITY_URGENT
+from utils import send_message
+
+SYNC_MALFORMED = 'malformed'
+
+
+class SyncApplier:
+    """
+    Applies sync messages from peer BBS nodes idempotently.
+
+    Bulletins and mail are upserted by unique_id, channels are unique per (name, url)
+    and deletes of rows that are already gone are no-ops, so replayed or looped
+    messages never create duplicate rows. The last ``max_recent`` messages applied are
+    also remembered so exact repeats are skipped without touching the database. Side
+    effects such as the urgent-bulletin broadcast only happen when a message was
+    actually applied.
+    """
+
+    def __init__(self, max_recent=4096):
+        self.max_recent = max_recent
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {}
+
+    def apply(self, fields, interface):
+        """Apply one decoded sync message. Returns SYNC_APPLIED, SYNC_DUPLICATE, SYNC_CONFLICT or SYNC_MALFORMED."""
+        kind = fields[0]
+        key = hash(tuple(fields))
+        with self._lock:
+            seen = key in self._recent
+            if seen:
+                self._recent.move_to_end(key)
+        if seen:
+            status = SYNC_DUPLICATE
+        else:
+            try:
+                status = self._apply(kind, fields, interface)
+            except IndexError:
+                logging.warning(f"Ignoring malformed {kind} sync message with {len(fields)} fields")
+                status = SYNC_MALFORMED
+            if status != SYNC_MALFORMED:
+                with self._lock:
+                    self._recent[key] = True
+                    while len(self._recent) > self.max_recent:
+                        self._recent.popitem(last=False)
+        with self._lock:
+            self.counters.setdefault(kind, Counter())[status] += 1
+        if status != SYNC_APPLIED:
+            logging.info(f"SERVER SYNC: {kind} sync {status}")
+        return status
+
+    def _apply(self, kind, fields, interface):
+        if kind == "BULLETIN":
+            board, sender_short_name, subject, content, unique_id = fields[1], fields[2], fields[3], fields[4], fields[5]
+            status = upsert_bulletin(board, sender_short_name, subject, content, unique_id)
+            if status == SYNC_APPLIED and board.lower() == "urgent":
+                notification_message = f"💥NEW URGENT BULLETIN💥\nFrom: {sender_short_name}\nTitle: {subject}\nDM 'CB,,Urgent' to view"
+                send_message(notification_message, BROADCAST_NUM, interface, PRIORITY_URGENT)
+            return status
+        elif kind == "MAIL":
+            sender_id, sender_short_name, recipient_id, subject, content, unique_id = fields[1], fields[2], fields[3], fields[4], fields[5], fields[6]
+            return upsert_mail(sender_id, sender_short_name, recipient_id, subject, content, unique_id)
+        elif kind == "DELETE_BULLETIN":
+            if fields[1].isdigit():
+                # Older peers sent their local row id, which means nothing here
+                logging.warning(f"Ignoring DELETE_BULLETIN by row id {fields[1]} from a peer without unique_id deletes")
+                return SYNC_MALFORMED
+            return SYNC_APPLIED if delete_bulletin(fields[1], [], interface) else SYNC_DUPLICATE
+        elif kind == "DELETE_MAIL":
+            logging.info(f"Processing delete mail with unique_id: {fields[1]}")
+            return SYNC_APPLIED if delete_mail(fields[1], None, [], interface) else SYNC_DUPLICATE
+        elif kind == "CHANNEL":
+            return SYNC_APPLIED if add_channel(fields[1], fields[2]) else SYNC_DUPLICATE
+        logging.warning(f"Ignoring unknown sync message type {kind}")
+        return SYNC_MALFORMED
+
+    def stats(self):
+        with self._lock:
+            totals = Counter()
+            for counts in self.counters.values():
+                totals.update(counts)
+            return {
+                'applied': totals[SYNC_APPLIED],
+                'duplicate': totals[SYNC_DUPLICATE],
+                'conflict': totals[SYNC_CONFLICT],
+                'malformed': totals[SYNC_MALFORMED],
+                'by_kind': {kind: dict(counts) for kind, counts in self.counters.items()}
+            }
+
+
+_applier = None
+_applier_lock = threading.Lock()
+
+
+def get_sync_applier():
+    global _applier
+    with _applier_lock:
+        if _applier is None:
+            _applier = SyncApplier()
+        return _applier
@@ -0,0 +1,202 @@
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+import db_manager
+
+# Deleting an item cancels an add of the same item that has not been sent yet
+DELETE_KINDS = {'DELETE_BULLETIN': 'BULLETIN', 'DELETE_MAIL': 'MAIL'}
+
+
+class SyncOutbox:
+    """
+    Durable, acknowledged delivery of sync messages to peer BBS nodes.
+
+    Every change is stored in the sync_outbox table as one row per (peer, change) and
+    handed to ``send(peer, message_id, payload)`` by a worker thread until the peer
+    answers with ``SYNC_ACK|<message_id>``. Unacknowledged rows are retried with
+    exponential backoff (``retry_base`` doubling up to ``retry_max``) and dropped after
+    ``max_attempts``. Hearing from a peer again pulls its backed-off rows forward so the
+    backlog goes out in one burst.
+    """
+
+    def __init__(self, send, db_path=None, retry_base=120, retry_max=3600, max_attempts=20, batch_size=10,
+                 stats_interval=900):
+        self.send = send
+        self.db_path = db_path
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.stats_interval = stats_interval
+
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._heard = set()
+        self._last_catch_up = {}
+        self._last_lag = {}
+
+        self.queued = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.acked = 0
+        self.expired = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='sync-outbox', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        logging.info(f"Sync outbox stopped: {self.stats()}")
+
+    def enqueue(self, kind, item_key, payload, peers):
+        """Store a change for each peer, coalescing it with changes to the same item still in the outbox."""
+        now = time.time()
+        conn = db_manager.get_connection(self.db_path)
+        with conn:
+            for peer in peers:
+                if kind in DELETE_KINDS:
+                    cancelled = conn.execute("DELETE FROM sync_outbox WHERE peer = ? AND kind = ? AND item_key = ? "
+                                             "AND attempts = 0", (peer, DELETE_KINDS[kind], item_key)).rowcount
+                    if cancelled:
+                        # The peer never saw the item, so there is nothing to delete there
+                        self.coalesced += 1
+                        continue
+                    # A delete supersedes an add that was sent but never acknowledged
+                    self.coalesced += conn.execute("DELETE FROM sync_outbox WHERE peer = ? AND kind = ? AND item_key = ?",
+                                                   (peer, DELETE_KINDS[kind], item_key)).rowcount
+                conn.execute(
+                    "INSERT INTO sync_outbox (peer, kind, item_key, payload, message_id, created_at, next_attempt) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(peer, kind, item_key) DO UPDATE SET payload = excluded.payload, "
+                    "message_id = excluded.message_id, attempts = 0, next_attempt = excluded.next_attempt",
+                    (peer, kind, item_key, payload, uuid.uuid4().hex[:8], now, now)
+                )
+                self.queued += 1
+        self._wake.set()
+
+    def acknowledge(self, peer, message_id):
+        conn = db_manager.get_connection(self.db_path)
+        with conn:
+            row = conn.execute("SELECT created_at FROM sync_outbox WHERE peer = ? AND message_id = ?",
+                               (peer, message_id)).fetchone()
+            if row is None:
+                return False
+            conn.execute("DELETE FROM sync_outbox WHERE peer = ? AND message_id = ?", (peer, message_id))
+        self.acked += 1
+        self._last_lag[peer] = time.time() - row[0]
+        return True
+
+    def peer_heard(self, peer):
+        """Note that a peer is in range again; its backed-off changes are retried on the next pass."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_catch_up.get(peer, float('-inf')) < self.retry_base:
+                return
+            self._last_catch_up[peer] = now
+            self._heard.add(peer)
+        self._wake.set()
+
+    def backlog(self):
+        """Per-peer pending changes, age of the oldest one in seconds, and most retries of any one."""
+        conn = db_manager.get_connection(self.db_path)
+        now = time.time()
+        rows = conn.execute("SELECT peer, COUNT(*), MIN(created_at), MAX(attempts) FROM sync_outbox GROUP BY peer").fetchall()
+        return {peer: {'backlog': count, 'oldest_age': now - oldest, 'max_attempts': attempts,
+                       'last_ack_lag': self._last_lag.get(peer)}
+                for peer, count, oldest, attempts in rows}
+
+    def stats(self):
+        try:
+            peers = self.backlog()
+        except sqlite3.Error:
+            peers = {}
+        return {
+            'queued': self.queued,
+            'coalesced': self.coalesced,
+            'sent': self.sent,
+            'acked': self.acked,
+            'expired': self.expired,
+            'peers': peers
+        }
+
+    def _retry_delay(self, attempts):
+        delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+        # Jitter keeps peers that came back together from retrying in lockstep
+        return delay * random.uniform(0.9, 1.1)
+
+    def _catch_up(self, conn):
+        with self._lock:
+            heard, self._heard = self._heard, set()
+        now = time.time()
+        for peer in heard:
+            with conn:
+                moved = conn.execute("UPDATE sync_outbox SET next_attempt = ? WHERE peer = ? AND attempts > 0 "
+                                     "AND next_attempt > ?", (now, peer, now)).rowcount
+            if moved:
+                logging.info(f"Heard BBS peer {peer} again, retrying {moved} pending sync message(s)")
+
+    def _send_due(self, conn):
+        """Send one batch of due changes. Returns True if more may be due."""
+        now = time.time()
+        rows = conn.execute("SELECT id, peer, message_id, payload, attempts FROM sync_outbox WHERE next_attempt <= ? "
+                            "ORDER BY next_attempt, id LIMIT ?", (now, self.batch_size)).fetchall()
+        for row_id, peer, message_id, payload, attempts in rows:
+            if self.max_attempts and attempts >= self.max_attempts:
+                with conn:
+                    conn.execute("DELETE FROM sync_outbox WHERE id = ?", (row_id,))
+                self.expired += 1
+                logging.warning(f"Giving up on sync message {message_id} to {peer} after {attempts} attempts")
+                continue
+            # Count the attempt before sending, so a delete enqueued meanwhile no longer cancels an add the
+            # peer may already have; the row is skipped if it was cancelled or replaced since it was selected
+            with conn:
+                claimed = conn.execute("UPDATE sync_outbox SET attempts = ?, next_attempt = ? "
+                                       "WHERE id = ? AND message_id = ? AND attempts = ?",
+                                       (attempts + 1, now + self._retry_delay(attempts + 1), row_id, message_id,
+                                        attempts)).rowcount
+            if not claimed:
+                continue
+            if self.send(peer, message_id, payload):
+                self.sent += 1
+                continue
+            # The send queue is full; try again later without counting an attempt
+            with conn:
+                conn.execute("UPDATE sync_outbox SET attempts = ?, next_attempt = ? WHERE id = ? AND message_id = ?",
+                             (attempts, now + self.retry_base, row_id, message_id))
+        return len(rows) == self.batch_size
+
+    def _next_due(self, conn):
+        row = conn.execute("SELECT MIN(next_attempt) FROM sync_outbox").fetchone()
+        return row[0]
+
+    def _run(self):
+        last_stats = time.monotonic()
+        while not self._stop.is_set():
+            self._wake.clear()
+            conn = db_manager.get_connection(self.db_path)
+            try:
+                self._catch_up(conn)
+                if self._send_due(conn):
+                    continue
+                next_due = self._next_due(conn)
+            except sqlite3.Error as e:
+                logging.error(f"Sync outbox pass failed: {e}")
+                next_due = None
+            if self.stats_interval and time.monotonic() - last_stats >= self.stats_interval:
+                last_stats = time.monotonic()
+                logging.info(f"Sync outbox: {self.stats()}")
+            timeout = 60 if next_due is None else min(max(next_due - time.time(), 0.5), 60)
+            self._wake.wait(timeout)
+        db_manager.close_connection(self.db_path)
@@ -0,0 +1,194 @@
+import configparser
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from packer import split_utf8, utf8_len
+
+FRAME_PREFIX = "SYNC|"
+
+# Sync messages are split into frames of the form SYNC|<msgid>|<index>|<count>|<chunk>
+# and reassembled on the receiving BBS before being parsed
+MAX_PARTS = 99
+# Fewest payload bytes per frame worth sending after the header
+MIN_CHUNK_BYTES = 8
+MESSAGE_ID_LENGTH = 8
+
+
+def escape_field(value):
+    return str(value).replace('\\', '\\\\').replace('|', '\\|')
+
+
+def encode_fields(fields):
+    """Join sync message fields with '|', escaping any '|' (and '\\') inside a field."""
+    return '|'.join(escape_field(field) for field in fields)
+
+
+def decode_fields(payload):
+    """
+    Split a sync payload into fields, undoing ``encode_fields``.
+
+    Unknown escapes are kept as-is, so unescaped payloads from older peers decode the
+    same as a plain split on '|'.
+    """
+    fields = []
+    current = []
+    chars = iter(payload)
+    for char in chars:
+        if char == '\\':
+            following = next(chars, '')
+            if following in ('\\', '|'):
+                current.append(following)
+            else:
+                current.append(char + following)
+        elif char == '|':
+            fields.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+    fields.append(''.join(current))
+    return fields
+
+
+def chunk_bytes_for(max_bytes, message_id='0' * MESSAGE_ID_LENGTH):
+    """Payload bytes left in a frame of ``max_bytes`` after the header; ValueError if too few."""
+    # Room for the header with two-digit part numbers
+    chunk_bytes = max_bytes - utf8_len(f"{FRAME_PREFIX}{message_id}|{MAX_PARTS}|{MAX_PARTS}|")
+    if chunk_bytes < MIN_CHUNK_BYTES:
+        raise ValueError(f"Frames of {max_bytes} bytes leave {chunk_bytes} bytes for sync data, "
+                         f"at least {MIN_CHUNK_BYTES} are needed")
+    return chunk_bytes
+
+
+def frame_message(payload, max_bytes, message_id=None):
+    """Split a sync payload into numbered frames of at most ``max_bytes`` UTF-8 bytes each."""
+    message_id = message_id or uuid.uuid4().hex[:MESSAGE_ID_LENGTH]
+    chunks = split_utf8(payload, chunk_bytes_for(max_bytes, message_id)) or ['']
+    if len(chunks) > MAX_PARTS:
+        raise ValueError(f"Sync message too large: {utf8_len(payload)} bytes needs {len(chunks)} frames")
+    return [f"{FRAME_PREFIX}{message_id}|{index}|{len(chunks)}|{chunk}" for index, chunk in enumerate(chunks)]
+
+
+def parse_frame(frame):
+    """Return (message_id, index, count, chunk) for a sync frame, or None if it is malformed."""
+    parts = frame.split('|', 4)
+    if len(parts) != 5 or parts[0] != FRAME_PREFIX[:-1]:
+        return None
+    try:
+        index, count = int(parts[2]), int(parts[3])
+    except ValueError:
+        return None
+    if not 0 <= index < count <= MAX_PARTS:
+        return None
+    return parts[1], index, count, parts[4]
+
+
+class Reassembler:
+    """
+    Collects sync frames per (sender, message id) until every part has arrived.
+
+    At most ``max_pending`` partial messages are kept; the oldest is dropped when a new
+    one arrives beyond that, and partial messages older than ``timeout`` seconds are
+    discarded. Frames of recently completed messages (e.g. retransmissions) are ignored.
+    """
+
+    def __init__(self, timeout=300, max_pending=64):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._pending = OrderedDict()
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.completed = 0
+        self.expired = 0
+        self.evicted = 0
+        self.malformed = 0
+        self.duplicates = 0
+
+    def add(self, sender, frame):
+        """Add a frame. Returns the reassembled payload once its last missing frame arrives, else None."""
+        parsed = parse_frame(frame)
+        if parsed is None:
+            self.malformed += 1
+            logging.warning(f"Ignoring malformed sync frame from {sender}")
+            return None
+        message_id, index, count, chunk = parsed
+        key = (sender, message_id)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key in self._recent:
+                self.duplicates += 1
+                return None
+            entry = self._pending.get(key)
+            if entry is None:
+                if count == 1:
+                    self._complete(key)
+                    return chunk
+                while len(self._pending) >= self.max_pending:
+                    dropped, _ = self._pending.popitem(last=False)
+                    self.evicted += 1
+                    logging.warning(f"Sync reassembly buffer full, dropping partial message {dropped[1]} from {dropped[0]}")
+                entry = self._pending[key] = {'count': count, 'parts': {}, 'started': now}
+            elif entry['count'] != count:
+                self.malformed += 1
+                return None
+            entry['parts'][index] = chunk
+            if len(entry['parts']) < count:
+                return None
+            del self._pending[key]
+            self._complete(key)
+        return ''.join(entry['parts'][i] for i in range(count))
+
+    def completed_recently(self, sender, message_id):
+        with self._lock:
+            return (sender, message_id) in self._recent
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self):
+        return {
+            'pending': self.pending(),
+            'completed': self.completed,
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'malformed': self.malformed,
+            'duplicates': self.duplicates
+        }
+
+    def _complete(self, key):
+        self.completed += 1
+        self._recent[key] = True
+        while len(self._recent) > self.max_pending * 4:
+            self._recent.popitem(last=False)
+
+    def _expire(self, now):
+        while self._pending:
+            key, entry = next(iter(self._pending.items()))
+            if now - entry['started'] < self.timeout:
+                break
+            del self._pending[key]
+            self.expired += 1
+            logging.warning(f"Sync message {key[1]} from {key[0]} timed out with "
+                            f"{len(entry['parts'])}/{entry['count']} frames received")
+
+
+_reassembler = None
+_reassembler_lock = threading.Lock()
+
+
+def get_reassembler():
+    global _reassembler
+    with _reassembler_lock:
+        if _reassembler is None:
+            config = configparser.ConfigParser()
+            config.read('config.ini')
+            _reassembler = Reassembler(
+                timeout=config.getint('sync', 'reassembly_timeout', fallback=300),
+                max_pending=config.getint('sync', 'max_pending', fallback=64)
+            )
+        return _reassembler
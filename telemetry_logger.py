@@ -8,12 +8,13 @@ Runs independently alongside the BBS
 import logging
 import time
 import configparser
-import sqlite3
-from datetime import datetime
 import meshtastic
 import meshtastic.tcp_interface
 import meshtastic.serial_interface
 
+import db_manager
+from retention import TELEMETRY_TABLES, start_retention
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -26,221 +27,242 @@ logger = logging.getLogger(__name__)
 DB_PATH = '/home/seth/Wildcat-TC2-BBS/bulletins.db'
 
 
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_PATH)
-    return conn
-
-
-def log_telemetry(packet):
-    """Log telemetry data (battery, voltage, temperature, etc.)"""
-    try:
-        if 'decoded' not in packet:
-            return
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS telemetry_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER NOT NULL,
+        node_id TEXT NOT NULL,
+        node_name TEXT,
+        battery_level INTEGER,
+        voltage REAL,
+        channel_util REAL,
+        air_util_tx REAL,
+        temperature REAL,
+        humidity REAL,
+        pressure REAL,
+        gas_resistance INTEGER,
+        uptime_seconds INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS position_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER NOT NULL,
+        node_id TEXT NOT NULL,
+        node_name TEXT,
+        latitude REAL,
+        longitude REAL,
+        altitude INTEGER,
+        precision_bits INTEGER,
+        ground_speed INTEGER,
+        ground_track INTEGER,
+        satellites_in_view INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS neighbor_info (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER NOT NULL,
+        node_id TEXT NOT NULL,
+        neighbor_id TEXT NOT NULL,
+        snr REAL,
+        last_heard INTEGER
+    )""",
+    """CREATE TABLE IF NOT EXISTS node_info (
+        node_id TEXT PRIMARY KEY,
+        short_name TEXT,
+        long_name TEXT,
+        hw_model TEXT,
+        role TEXT,
+        firmware_version TEXT,
+        first_seen INTEGER,
+        last_seen INTEGER,
+        is_favorite BOOLEAN DEFAULT 0,
+        notes TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_telemetry_logs_node_timestamp ON telemetry_logs (node_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_position_logs_node_timestamp ON position_logs (node_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_neighbor_info_node_timestamp ON neighbor_info (node_id, timestamp)",
+]
+
+INSERT_TELEMETRY = """
+    INSERT INTO telemetry_logs (
+        timestamp, node_id, node_name, battery_level, voltage,
+        channel_util, air_util_tx, temperature, humidity,
+        pressure, gas_resistance, uptime_seconds
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
-        decoded = packet['decoded']
-        if decoded.get('portnum') != 'TELEMETRY_APP':
-            return
+INSERT_POSITION = """
+    INSERT INTO position_logs (
+        timestamp, node_id, node_name, latitude, longitude,
+        altitude, precision_bits, ground_speed, ground_track,
+        satellites_in_view
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
-        telemetry = decoded.get('telemetry', {})
-        device_metrics = telemetry.get('deviceMetrics', {})
-        environment_metrics = telemetry.get('environmentMetrics', {})
+INSERT_NEIGHBOR = """
+    INSERT INTO neighbor_info (
+        timestamp, node_id, neighbor_id, snr, last_heard
+    ) VALUES (?, ?, ?, ?, ?)
+"""
 
-        timestamp = packet.get('rxTime', int(time.time()))
-        node_id = packet.get('fromId', 'unknown')
+UPSERT_NODE_INFO = """
+    INSERT INTO node_info (
+        node_id, short_name, long_name, hw_model, role,
+        firmware_version, first_seen, last_seen
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(node_id) DO UPDATE SET
+        short_name = excluded.short_name,
+        long_name = excluded.long_name,
+        hw_model = excluded.hw_model,
+        role = excluded.role,
+        firmware_version = excluded.firmware_version,
+        last_seen = excluded.last_seen
+"""
 
-        conn = get_db_connection()
-        c = conn.cursor()
+writer = None
 
-        c.execute("""
-            INSERT INTO telemetry_logs (
-                timestamp, node_id, node_name, battery_level, voltage,
-                channel_util, air_util_tx, temperature, humidity,
-                pressure, gas_resistance, uptime_seconds
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            timestamp,
-            node_id,
-            packet.get('from'),  # node_name will be updated separately
-            device_metrics.get('batteryLevel'),
-            device_metrics.get('voltage'),
-            device_metrics.get('channelUtilization'),
-            device_metrics.get('airUtilTx'),
-            environment_metrics.get('temperature'),
-            environment_metrics.get('relativeHumidity'),
-            environment_metrics.get('barometricPressure'),
-            environment_metrics.get('gasResistance'),
-            device_metrics.get('uptimeSeconds')
-        ))
 
-        conn.commit()
-        conn.close()
+def initialize_database():
+    """Create the telemetry tables if they do not exist yet"""
+    conn = db_manager.get_connection(DB_PATH)
+    with conn:
+        for statement in SCHEMA:
+            conn.execute(statement)
 
-        logger.info(f"📊 Telemetry logged: {node_id} - Battery: {device_metrics.get('batteryLevel')}%")
 
-    except Exception as e:
-        logger.error(f"Error logging telemetry: {e}")
+def start_writer(config):
+    """Start the buffered writer that commits logged rows in batches"""
+    global writer
+    writer = db_manager.BatchWriter(
+        DB_PATH,
+        flush_rows=config.getint('telemetry', 'batch_rows', fallback=100),
+        flush_ms=config.getint('telemetry', 'batch_ms', fallback=5000),
+        name='telemetry-writer'
+    )
+    writer.start()
+    return writer
 
 
-def log_position(packet):
+def log_telemetry(packet, decoded, interface):
+    """Log telemetry data (battery, voltage, temperature, etc.)"""
+    telemetry = decoded.get('telemetry', {})
+    device_metrics = telemetry.get('deviceMetrics', {})
+    environment_metrics = telemetry.get('environmentMetrics', {})
+
+    timestamp = packet.get('rxTime', int(time.time()))
+    node_id = packet.get('fromId', 'unknown')
+
+    writer.add(INSERT_TELEMETRY, (
+        timestamp,
+        node_id,
+        packet.get('from'),  # node_name will be updated separately
+        device_metrics.get('batteryLevel'),
+        device_metrics.get('voltage'),
+        device_metrics.get('channelUtilization'),
+        device_metrics.get('airUtilTx'),
+        environment_metrics.get('temperature'),
+        environment_metrics.get('relativeHumidity'),
+        environment_metrics.get('barometricPressure'),
+        environment_metrics.get('gasResistance'),
+        device_metrics.get('uptimeSeconds')
+    ))
+
+    logger.info(f"📊 Telemetry logged: {node_id} - Battery: {device_metrics.get('batteryLevel')}%")
+
+
+def log_position(packet, decoded, interface):
     """Log position data (GPS coordinates, altitude, etc.)"""
-    try:
-        if 'decoded' not in packet:
-            return
+    position = decoded.get('position', {})
 
-        decoded = packet['decoded']
-        if decoded.get('portnum') != 'POSITION_APP':
-            return
-
-        position = decoded.get('position', {})
+    timestamp = packet.get('rxTime', int(time.time()))
+    node_id = packet.get('fromId', 'unknown')
 
-        timestamp = packet.get('rxTime', int(time.time()))
-        node_id = packet.get('fromId', 'unknown')
+    # Convert lat/lon from integer format (degrees * 1e7)
+    latitude = position.get('latitude')
+    longitude = position.get('longitude')
 
-        # Convert lat/lon from integer format (degrees * 1e7)
-        latitude = position.get('latitude')
-        longitude = position.get('longitude')
+    if latitude is None or longitude is None:
+        return
 
-        if latitude is None or longitude is None:
-            return
+    # Meshtastic stores as integer, convert to float
+    if isinstance(latitude, int):
+        latitude = latitude / 1e7
+    if isinstance(longitude, int):
+        longitude = longitude / 1e7
 
-        # Meshtastic stores as integer, convert to float
-        if isinstance(latitude, int):
-            latitude = latitude / 1e7
-        if isinstance(longitude, int):
-            longitude = longitude / 1e7
-
-        conn = get_db_connection()
-        c = conn.cursor()
-
-        c.execute("""
-            INSERT INTO position_logs (
-                timestamp, node_id, node_name, latitude, longitude,
-                altitude, precision_bits, ground_speed, ground_track,
-                satellites_in_view
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            timestamp,
-            node_id,
-            packet.get('from'),
-            latitude,
-            longitude,
-            position.get('altitude'),
-            position.get('precisionBits'),
-            position.get('groundSpeed'),
-            position.get('groundTrack'),
-            position.get('satsInView')
-        ))
+    writer.add(INSERT_POSITION, (
+        timestamp,
+        node_id,
+        packet.get('from'),
+        latitude,
+        longitude,
+        position.get('altitude'),
+        position.get('precisionBits'),
+        position.get('groundSpeed'),
+        position.get('groundTrack'),
+        position.get('satsInView')
+    ))
 
-        conn.commit()
-        conn.close()
+    logger.info(f"📍 Position logged: {node_id} - {latitude:.4f}, {longitude:.4f}")
 
-        logger.info(f"📍 Position logged: {node_id} - {latitude:.4f}, {longitude:.4f}")
 
-    except Exception as e:
-        logger.error(f"Error logging position: {e}")
-
-
-def log_neighbor_info(packet):
+def log_neighbor_info(packet, decoded, interface):
     """Log neighbor information (network topology)"""
-    try:
-        if 'decoded' not in packet:
-            return
-
-        decoded = packet['decoded']
-        if decoded.get('portnum') != 'NEIGHBORINFO_APP':
-            return
-
-        neighbors = decoded.get('neighborinfo', {}).get('neighbors', [])
-
-        timestamp = packet.get('rxTime', int(time.time()))
-        node_id = packet.get('fromId', 'unknown')
+    neighbors = decoded.get('neighborinfo', {}).get('neighbors', [])
 
-        conn = get_db_connection()
-        c = conn.cursor()
+    timestamp = packet.get('rxTime', int(time.time()))
+    node_id = packet.get('fromId', 'unknown')
 
-        for neighbor in neighbors:
-            c.execute("""
-                INSERT INTO neighbor_info (
-                    timestamp, node_id, neighbor_id, snr, last_heard
-                ) VALUES (?, ?, ?, ?, ?)
-            """, (
-                timestamp,
-                node_id,
-                neighbor.get('nodeId', 'unknown'),
-                neighbor.get('snr'),
-                neighbor.get('lastHeard')
-            ))
-
-        conn.commit()
-        conn.close()
-
-        logger.info(f"🔗 Neighbor info logged: {node_id} - {len(neighbors)} neighbors")
+    for neighbor in neighbors:
+        writer.add(INSERT_NEIGHBOR, (
+            timestamp,
+            node_id,
+            neighbor.get('nodeId', 'unknown'),
+            neighbor.get('snr'),
+            neighbor.get('lastHeard')
+        ))
 
-    except Exception as e:
-        logger.error(f"Error logging neighbor info: {e}")
+    logger.info(f"🔗 Neighbor info logged: {node_id} - {len(neighbors)} neighbors")
 
 
-def update_node_info(packet, interface):
+def update_node_info(packet, decoded, interface):
     """Update node metadata table"""
-    try:
-        if 'decoded' not in packet:
-            return
+    user = decoded.get('user', {})
+    node_id = packet.get('fromId', 'unknown')
+    timestamp = packet.get('rxTime', int(time.time()))
 
-        decoded = packet['decoded']
-        if decoded.get('portnum') != 'NODEINFO_APP':
-            return
+    # Get hardware info from the interface if available
+    node_info = interface.nodes.get(packet.get('from'), {}) if interface else {}
 
-        user = decoded.get('user', {})
-        node_id = packet.get('fromId', 'unknown')
-        timestamp = packet.get('rxTime', int(time.time()))
-
-        # Get hardware info from the interface if available
-        node_info = interface.nodes.get(packet.get('from'), {})
-
-        conn = get_db_connection()
-        c = conn.cursor()
-
-        c.execute("""
-            INSERT INTO node_info (
-                node_id, short_name, long_name, hw_model, role,
-                firmware_version, first_seen, last_seen
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(node_id) DO UPDATE SET
-                short_name = excluded.short_name,
-                long_name = excluded.long_name,
-                hw_model = excluded.hw_model,
-                role = excluded.role,
-                firmware_version = excluded.firmware_version,
-                last_seen = excluded.last_seen
-        """, (
-            node_id,
-            user.get('shortName'),
-            user.get('longName'),
-            user.get('hwModel'),
-            user.get('role'),
-            node_info.get('deviceMetrics', {}).get('firmwareVersion'),
-            timestamp,
-            timestamp
-        ))
+    writer.add(UPSERT_NODE_INFO, (
+        node_id,
+        user.get('shortName'),
+        user.get('longName'),
+        user.get('hwModel'),
+        user.get('role'),
+        node_info.get('deviceMetrics', {}).get('firmwareVersion'),
+        timestamp,
+        timestamp
+    ))
 
-        conn.commit()
-        conn.close()
+    logger.info(f"ℹ️ Node info updated: {user.get('shortName')} ({node_id})")
 
-        logger.info(f"ℹ️ Node info updated: {user.get('shortName')} ({node_id})")
 
-    except Exception as e:
-        logger.error(f"Error updating node info: {e}")
+PORTNUM_HANDLERS = {
+    'TELEMETRY_APP': log_telemetry,
+    'POSITION_APP': log_position,
+    'NEIGHBORINFO_APP': log_neighbor_info,
+    'NODEINFO_APP': update_node_info,
+}
 
 
 def on_receive(packet, interface):
-    """Main packet handler - routes to appropriate logger"""
+    """Main packet handler - routes to the logger for the packet's portnum"""
     try:
-        # Log different packet types
-        log_telemetry(packet)
-        log_position(packet)
-        log_neighbor_info(packet)
-        update_node_info(packet, interface)
+        decoded = packet.get('decoded')
+        if not decoded:
+            return
+        handler = PORTNUM_HANDLERS.get(decoded.get('portnum'))
+        if handler:
+            handler(packet, decoded, interface)
 
     except Exception as e:
         logger.error(f"Error processing packet: {e}")
@@ -255,6 +277,12 @@ def main():
     # Load config
     config = configparser.ConfigParser()
     config.read('/home/seth/Wildcat-TC2-BBS/config.ini')
+    db_manager.load_settings(config)
+    initialize_database()
+    start_writer(config)
+    checkpointer = db_manager.Checkpointer(DB_PATH)
+    checkpointer.start()
+    retention = start_retention(config, TELEMETRY_TABLES, DB_PATH)
 
     interface_type = config.get('interface', 'type', fallback='serial')
 
@@ -284,6 +312,10 @@ def main():
 
     except KeyboardInterrupt:
         logger.info("\n👋 Shutting down telemetry logger...")
+        writer.stop()
+        if retention:
+            retention.stop()
+        checkpointer.stop()
     except Exception as e:
         logger.error(f"❌ Error: {e}")
         raise
@@ -0,0 +1,24 @@
+import configparser
+import os
+import sys
+
+import pytest
+
+# The BBS modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_manager  # noqa: E402
+import db_operations  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A freshly migrated BBS database, set as the default for db_manager."""
+    path = str(tmp_path / 'bulletins.db')
+    config = configparser.ConfigParser()
+    config.read_dict({'database': {'path': path}})
+    db_manager.load_settings(config)
+    db_operations.initialize_database()
+    yield path
+    db_manager.close_connection(path)
+    db_manager.load_settings(configparser.ConfigParser())
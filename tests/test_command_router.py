@@ -0,0 +1,94 @@
+"""
+Golden corpus for direct-message routing.
+
+tests/data/router_corpus.json was recorded from the if/elif chain that process_message
+used before the command router: for every (user state, message) pair it holds the
+handler that was called and its arguments, or null when the message was ignored.
+"<sender>", "<message>", "<state>", "<step>", "<interface>" and "<bbs_nodes>" stand
+for the values of the case being replayed.
+"""
+import json
+import os
+
+import pytest
+
+import command_handlers
+import command_router
+import js8call_integration
+import message_processing
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'router_corpus.json')
+SENDER_ID = 1234
+BBS_NODES = ['!peer']
+
+
+class FakeInterface:
+    bbs_nodes = BBS_NODES
+
+
+with open(CORPUS_PATH, encoding='utf-8') as corpus_file:
+    CORPUS = json.load(corpus_file)
+
+
+def _prefix_routes(node):
+    for char, child in node.items():
+        if char is None:
+            yield child
+        else:
+            yield from _prefix_routes(child)
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    """Replace every handle_* handler with one that records its name and arguments."""
+    calls = []
+
+    def recorder(name):
+        return lambda *args: calls.append([name, *args])
+
+    def record(handler):
+        name = getattr(handler, '__name__', '')
+        return recorder(name) if name.startswith('handle_') else handler
+
+    for module in (command_handlers, js8call_integration, message_processing):
+        for name in dir(module):
+            if name.startswith('handle_') and callable(getattr(module, name)):
+                monkeypatch.setattr(module, name, recorder(name))
+    # Routes and menus keep the handlers that were registered at import time
+    for route in [*_prefix_routes(command_router.prefix_routes), *command_router.step_routes.values()]:
+        monkeypatch.setattr(route, 'handler', record(route.handler))
+    for handlers, _ in command_router.menus.values():
+        for letter, handler in list(handlers.items()):
+            monkeypatch.setitem(handlers, letter, record(handler))
+    return calls
+
+
+def _expected(call, state, message, interface):
+    if call is None:
+        return []
+    placeholders = {
+        '<sender>': SENDER_ID,
+        '<message>': message,
+        '<message.strip()>': message.strip(),
+        '<state>': state,
+        '<step>': state.get('step') if state else None,
+        '<interface>': interface,
+        '<bbs_nodes>': BBS_NODES,
+    }
+    name, *args = call
+    return [[name, *(placeholders.get(arg, arg) if isinstance(arg, str) else arg for arg in args)]]
+
+
+@pytest.mark.parametrize('case', CORPUS['cases'], ids=lambda case: json.dumps(case['state']))
+def test_routing_matches_corpus(recorded, monkeypatch, case):
+    interface = FakeInterface()
+    state = case['state']
+    monkeypatch.setattr(message_processing, 'get_user_state', lambda sender_id: state)
+    mismatches = []
+    for message, call_index in zip(CORPUS['messages'], case['routes']):
+        recorded.clear()
+        message_processing.process_message(SENDER_ID, message, interface)
+        expected = _expected(None if call_index is None else CORPUS['calls'][call_index], state, message, interface)
+        if recorded != expected:
+            mismatches.append(f"{message!r}: expected {expected}, got {recorded}")
+    assert not mismatches, "\n".join(mismatches)
@@ -0,0 +1,194 @@
+"""JS8CallClient's line decoder, reader and reconnect supervisor against a local fake JS8Call server."""
+import json
+import random
+import socket
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import js8call_integration
+from js8call_integration import JS8CallClient, LineDecoder, to_message
+
+MESSAGES = 10000
+
+
+def _directed(i):
+    return to_message('RX.DIRECTED', f"K1ABC @MESH message {i} ─ 73", {'FREQ': 7078000, '_ID': i})
+
+
+def _fragments(data, rng, largest=4096):
+    """``data`` cut into pieces of arbitrary size, as TCP may deliver it."""
+    start = 0
+    while start < len(data):
+        end = start + rng.randint(1, largest)
+        yield data[start:end]
+        start = end
+
+
+class FakeJS8Call:
+    """
+    A TCP server playing JS8Call's API: each accepted connection is handed to the next
+    function in ``sessions``, which talks to the client and returns when the server
+    should hang up. Lines the client sends are collected in ``received``.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = list(sessions)
+        self.received = []
+        self.connections = 0
+        self._listener = socket.create_server(('127.0.0.1', 0))
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    @property
+    def port(self):
+        return self._listener.getsockname()[1]
+
+    def _serve(self):
+        while self.sessions:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            session = self.sessions.pop(0)
+            reader = threading.Thread(target=self._read, args=(conn,), daemon=True)
+            reader.start()
+            with conn:
+                session(conn)
+                try:
+                    # Wakes the reader thread too; a plain close would wait for it to leave recv()
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _read(self, conn):
+        decoder = LineDecoder()
+        try:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    return
+                self.received.extend(decoder.feed(data))
+        except OSError:
+            return
+
+    def close(self):
+        self._listener.close()
+
+
+@pytest.fixture
+def make_client(tmp_path, monkeypatch):
+    clients = []
+
+    def make(port, **options):
+        settings = {'host': '127.0.0.1', 'port': port, 'db_file': str(tmp_path / 'js8call.db'),
+                    'js8groups': '@MESH', 'reconnect_min': 0.05, 'reconnect_max': 0.2, 'batch_ms': 50}
+        settings.update(options)
+        config_path = tmp_path / 'config.ini'
+        config_path.write_text('[js8call]\n' + ''.join(f"{key} = {value}\n" for key, value in settings.items()))
+        monkeypatch.setattr(js8call_integration, 'config_file', str(config_path))
+        client = JS8CallClient(interface=None)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def _wait(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def _group_rows(client):
+    with sqlite3.connect(client.db_file) as conn:
+        return conn.execute("SELECT COUNT(*) FROM groups").fetchone()[0]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_decoder_handles_split_and_coalesced_frames(seed):
+    rng = random.Random(seed)
+    lines = [_directed(i) for i in range(500)]
+    stream = ''.join(f"{line}\n" for line in lines).encode('utf-8')
+    decoder = LineDecoder()
+
+    decoded = [message for fragment in _fragments(stream, rng, largest=300) for message in decoder.feed(fragment)]
+
+    assert decoded == [json.loads(line) for line in lines]
+    assert decoder.invalid == 0
+
+
+def test_decoder_skips_bad_lines_and_overlong_partials():
+    decoder = LineDecoder(max_line=64)
+
+    assert decoder.feed(b'not json\n\n[1, 2]\n{"type": "RX.SPOT"}\n') == [{'type': 'RX.SPOT'}]
+    assert decoder.invalid == 2
+    assert decoder.feed(b'{"type": "' + b'x' * 100) == []
+    assert decoder.invalid == 3
+    assert decoder.feed(b'"}\n{"type": "PING"}\n') == [{'type': 'PING'}]
+
+
+def test_reads_10k_messages_a_second_in_arbitrary_fragments(make_client):
+    rng = random.Random(1)
+    stream = ''.join(f"{_directed(i)}\n" for i in range(MESSAGES)).encode('utf-8')
+    fragments = list(_fragments(stream, rng))
+    per_tick = max(1, len(fragments) // 100)
+
+    def session(conn):
+        # 100 ticks of 10 ms: 10k messages in one second
+        for start in range(0, len(fragments), per_tick):
+            conn.sendall(b''.join(fragments[start:start + per_tick]))
+            time.sleep(0.01)
+        _wait(lambda: client.frames_received >= MESSAGES)
+
+    server = FakeJS8Call([session])
+    client = make_client(server.port, queue_size=MESSAGES)
+    began = time.monotonic()
+    client.start()
+
+    assert _wait(lambda: client.frames_received >= MESSAGES)
+    elapsed = time.monotonic() - began
+    assert client.stats()['frames_invalid'] == 0
+    assert client.inbound_dropped == 0
+    assert elapsed < 5
+    assert _wait(lambda: _group_rows(client) == MESSAGES)
+    server.close()
+
+
+def test_supervisor_reconnects_with_backoff_after_the_server_hangs_up(make_client):
+    def hang_up(conn):
+        conn.sendall(f"{_directed(0)}\n".encode('utf-8'))
+        time.sleep(0.1)
+
+    def stay(conn):
+        conn.sendall(f"{_directed(1)}\n".encode('utf-8'))
+        _wait(lambda: client._stop.is_set(), timeout=10)
+
+    server = FakeJS8Call([hang_up, hang_up, stay])
+    client = make_client(server.port)
+    began = time.monotonic()
+    client.start()
+
+    assert _wait(lambda: client.frames_received == 3 and client.connected)
+    assert client.reconnects == 2
+    # Waited reconnect_min, then twice that, before the two reconnects
+    assert time.monotonic() - began >= 0.05 + 0.1
+    # Every connection asks for the station status again
+    assert _wait(lambda: [m['type'] for m in server.received].count('STATION.GET_STATUS') == 3)
+    server.close()
+
+
+def test_outbound_queue_is_bounded(make_client):
+    client = make_client(1, queue_size=2)
+
+    for _ in range(3):
+        client.send('STATION.GET_STATUS')
+
+    assert client.outbound.qsize() == 2
+    assert client.outbound_dropped == 1
@@ -0,0 +1,45 @@
+import random
+import time
+
+from node_stats import NodeStats
+
+
+def _nodes(count):
+    return {f"!{i}": {'user': {'shortName': f"n{i}", 'longName': f"Node {i}"}, 'snr': float(i), 'lastHeard': 1000 + i}
+            for i in range(count)}
+
+
+def test_node_updated_during_compaction_stays_in_top_k():
+    stats = NodeStats()
+    stats.rebuild(_nodes(10))
+    # Enough updates to one node to push the heaps past their compaction threshold
+    for i in range(1, 101):
+        stats.update_node('!0', {'snr': 100.0 + i, 'lastHeard': 2000 + i})
+        assert stats.top_snr(1) == [(100.0 + i, 'n0', 'Node 0')]
+        assert stats.most_recent(1)[0][0] == 2000 + i
+    assert [short for _, short, _ in stats.top_snr(3)] == ['n0', 'n9', 'n8']
+
+
+def test_aggregates_match_full_pass_through_compactions():
+    rng = random.Random(7)
+    nodes = _nodes(20)
+    stats = NodeStats()
+    stats.rebuild(nodes)
+    # Windows count against the wall clock, so the simulated packets end around now
+    clock = int(time.time()) - 3000
+    for _ in range(3000):
+        clock += rng.randint(0, 1)
+        node_id = rng.choice(list(nodes))
+        node = nodes[node_id]
+        node['snr'] = round(rng.uniform(-20, 12), 2)
+        node['lastHeard'] = clock
+        node['deviceMetrics'] = {'batteryLevel': rng.randint(0, 100)}
+        stats.update_node(node_id, node)
+
+        expected_snr = sorted((n['snr'] for n in nodes.values()), reverse=True)[:5]
+        assert [snr for snr, _, _ in stats.top_snr(5)] == expected_snr
+        expected_heard = sorted((n['lastHeard'] for n in nodes.values()), reverse=True)[:5]
+        assert [heard for heard, _, _, _ in stats.most_recent(5)] == expected_heard
+    low = sorted(n['user']['longName'] for n in nodes.values() if n['deviceMetrics']['batteryLevel'] < 20)
+    assert sorted(name for name, _ in stats.low_battery()) == low
+    assert stats.active_count(3600, now=clock) == sum(1 for n in nodes.values() if n['lastHeard'] >= clock - 3600)
@@ -0,0 +1,68 @@
+"""Randomized properties of the UTF-8 frame packer."""
+import random
+
+import pytest
+
+from packer import pack_message, split_utf8, utf8_len
+
+# ASCII, 2-, 3- and 4-byte characters, a ZWJ emoji sequence and every kind of whitespace packing cares about
+ALPHABET = ['a', 'b', 'Z', '7', ',', 'é', 'ß', '─', '│', '💾', '😀', '👨‍👩‍👧', ' ', ' ', '  ', '\n', '\n\n', '\t']
+WIDEST_CHARACTER = 4
+
+
+def _text(rng):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 120)))
+
+
+def _non_whitespace(text):
+    return ''.join(text.split())
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_frames_fit_and_keep_all_visible_text(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        message = _text(rng)
+        max_payload = rng.randint(WIDEST_CHARACTER, 64)
+        frames = pack_message(message, max_payload)
+        assert all(utf8_len(frame) <= max_payload for frame in frames), (message, max_payload, frames)
+        assert _non_whitespace(''.join(frames)) == _non_whitespace(message)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_payload_narrower_than_a_character_still_terminates(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        message = _text(rng)
+        frames = pack_message(message, rng.randint(1, WIDEST_CHARACTER - 1))
+        assert _non_whitespace(''.join(frames)) == _non_whitespace(message)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_split_utf8_round_trips_on_character_boundaries(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        text = _text(rng)
+        max_bytes = rng.randint(1, 16)
+        pieces = split_utf8(text, max_bytes)
+        assert ''.join(pieces) == text
+        assert all(pieces)
+        assert all(utf8_len(piece) <= max(max_bytes, WIDEST_CHARACTER) for piece in pieces)
+
+
+def test_message_that_fits_is_one_frame():
+    message = "💾Wildcat TC² BBS💾\n[B]ulletins\n[M]ail"
+    assert pack_message(message, utf8_len(message)) == [message]
+    assert pack_message('', 200) == []
+
+
+def test_lines_are_packed_whole_when_they_fit():
+    lines = [f"{i}. Bulletin subject ─ sender" for i in range(10)]
+    frames = pack_message('\n'.join(lines), 100)
+    assert len(frames) < len(lines)
+    assert [line for frame in frames for line in frame.split('\n')] == lines
+
+
+def test_split_utf8_rejects_non_positive_sizes():
+    with pytest.raises(ValueError):
+        split_utf8('abc', 0)
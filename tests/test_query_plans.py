@@ -0,0 +1,104 @@
+"""
+EXPLAIN QUERY PLAN checks for the queries run on every menu, listing, sync message
+and stats request. Each one must find its rows through an index or the primary key;
+a full table or index scan means a migration lost an index or a query stopped using it.
+"""
+import configparser
+import re
+
+import pytest
+
+import db_manager
+import db_operations
+from sync_outbox import SyncOutbox
+
+# Plan lines that read a whole table or index, e.g. "SCAN mail" or "SCAN mail USING INDEX ..."
+FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)')
+
+
+@pytest.fixture(scope='module')
+def db_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('db') / 'bulletins.db')
+    config = configparser.ConfigParser()
+    config.read_dict({'database': {'path': path}})
+    db_manager.load_settings(config)
+    db_operations.initialize_database()
+    conn = db_manager.get_connection(path)
+    with conn:
+        conn.execute("INSERT INTO mail (sender, sender_short_name, recipient, date, subject, content, unique_id) "
+                     "VALUES ('!a', 'A', '!b', '2024-01-01 00:00', 'Hi', 'Hello', 'mail-1')")
+        conn.execute("INSERT INTO bulletins (board, sender_short_name, date, subject, content, unique_id) "
+                     "VALUES ('General', 'A', '2024-01-01 00:00', 'News', 'Text', 'bulletin-1')")
+    yield path
+    db_manager.close_connection(path)
+    db_manager.load_settings(configparser.ConfigParser())
+
+
+def _outbox(db_path):
+    return SyncOutbox(lambda peer, message_id, payload: True, db_path=db_path)
+
+
+# name: (call that runs the queries, index its plan must use, or None when the primary key is enough)
+HOT_QUERIES = {
+    'get_channels_page': (lambda db_path: db_operations.get_channels_page(after_id=5), None),
+    'get_channel': (lambda db_path: db_operations.get_channel(1), None),
+    'get_bulletin_count': (lambda db_path: db_operations.get_bulletin_count('general'), 'idx_bulletins_board'),
+    'get_bulletins_page': (lambda db_path: db_operations.get_bulletins_page('general', after_id=5), 'idx_bulletins_board'),
+    'get_bulletin_content': (lambda db_path: db_operations.get_bulletin_content(1), None),
+    'upsert_bulletin': (lambda db_path: db_operations.upsert_bulletin('General', 'B', 'New', 'Text', 'bulletin-2'),
+                        'idx_bulletins_unique_id'),
+    'delete_bulletin': (lambda db_path: db_operations.delete_bulletin('bulletin-2', [], None), 'idx_bulletins_unique_id'),
+    'get_mail_page': (lambda db_path: db_operations.get_mail_page('!b', after_id=5), 'idx_mail_recipient'),
+    'get_mailbox_summary': (lambda db_path: db_operations.get_mailbox_summary('!b'), None),
+    'mark_mail_read': (lambda db_path: db_operations.mark_mail_read(1, '!b'), None),
+    'get_mail_content': (lambda db_path: db_operations.get_mail_content(1, '!b'), None),
+    'get_sender_id_by_mail_id': (lambda db_path: db_operations.get_sender_id_by_mail_id(1), None),
+    'upsert_mail': (lambda db_path: db_operations.upsert_mail('!a', 'A', '!b', 'Re', 'Text', 'mail-2'), 'idx_mail_unique_id'),
+    'delete_mail': (lambda db_path: db_operations.delete_mail('mail-2', None, [], None), 'idx_mail_unique_id'),
+    'get_sync_fields': (lambda db_path: db_operations.get_sync_fields('MAIL', 'mail-1'), 'idx_mail_unique_id'),
+    'prune_tombstones': (lambda db_path: db_operations.prune_tombstones(86400), 'idx_sync_tombstones_deleted'),
+    'get_channel_activity_stats': (lambda db_path: db_operations.get_channel_activity_stats(),
+                                   'idx_message_logs_timestamp'),
+    'get_message_stats': (lambda db_path: db_operations.get_message_stats(), 'idx_message_logs_timestamp'),
+    'get_propagation_trends': (lambda db_path: db_operations.get_propagation_trends(), None),
+    'get_propagation_trends_node': (lambda db_path: db_operations.get_propagation_trends(node_id='!a'),
+                                    'idx_message_logs_sender_timestamp'),
+    'get_best_worst_conditions': (lambda db_path: db_operations.get_best_worst_conditions(), None),
+    'get_hourly_propagation_stats': (lambda db_path: db_operations.get_hourly_propagation_stats(), None),
+    'get_node_reliability': (lambda db_path: db_operations.get_node_reliability('!a'), 'idx_message_log_hourly_sender'),
+    'sync_outbox_acknowledge': (lambda db_path: _outbox(db_path).acknowledge('!peer', 'abcd1234'),
+                                'idx_sync_outbox_message'),
+    'sync_outbox_send_due': (lambda db_path: _outbox(db_path)._send_due(db_manager.get_connection(db_path)),
+                             'idx_sync_outbox_due'),
+    'sync_outbox_next_due': (lambda db_path: _outbox(db_path)._next_due(db_manager.get_connection(db_path)),
+                             'idx_sync_outbox_due'),
+}
+
+
+def _traced(db_path, query):
+    """The SELECT, UPDATE and DELETE statements ``query`` runs."""
+    statements = []
+    conn = db_manager.get_connection(db_path)
+    conn.set_trace_callback(statements.append)
+    try:
+        query(db_path)
+    finally:
+        conn.set_trace_callback(None)
+    return [statement for statement in statements
+            if statement.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE')]
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_an_index(db_path, name):
+    query, index = HOT_QUERIES[name]
+    statements = _traced(db_path, query)
+    assert statements, f"{name} ran no queries"
+    conn = db_manager.get_connection(db_path)
+    plans = []
+    for statement in statements:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}")]
+        scans = [step for step in plan if FULL_SCAN.match(step)]
+        assert not scans, f"{name} scans instead of searching: {statement.strip()}\n" + "\n".join(plan)
+        plans.extend(plan)
+    if index is not None:
+        assert any(f"INDEX {index} " in f"{step} " for step in plans), f"{name} does not use {index}:\n" + "\n".join(plans)
@@ -0,0 +1,67 @@
+import gzip
+import json
+import os
+
+import pytest
+
+import db_manager
+from retention import DAY, RetentionEngine, RetentionPolicy
+
+NOW = 1_700_000_000
+
+
+@pytest.fixture
+def engine(tmp_path):
+    db_path = str(tmp_path / 'telemetry.db')
+    conn = db_manager.get_connection(db_path)
+    conn.execute("CREATE TABLE samples (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp INTEGER NOT NULL, "
+                 "node_id TEXT NOT NULL, snr REAL)")
+    conn.commit()
+    policy = RetentionPolicy('samples', raw_days=14, rollup_table='samples_hourly', keys=('node_id',),
+                             metrics=('snr',))
+    yield RetentionEngine(db_path, [policy], batch_size=10, pause=0, archive_dir=str(tmp_path / 'archive'))
+    db_manager.close_connection(db_path)
+
+
+def _insert(engine, rows):
+    conn = db_manager.get_connection(engine.db_path)
+    with conn:
+        conn.executemany("INSERT INTO samples (timestamp, node_id, snr) VALUES (?, ?, ?)", rows)
+
+
+def _traced_run(engine):
+    statements = []
+    conn = db_manager.get_connection(engine.db_path)
+    conn.set_trace_callback(statements.append)
+    try:
+        removed = engine.run(now=NOW)
+    finally:
+        conn.set_trace_callback(None)
+    return removed, statements
+
+
+def test_expired_rows_are_archived_rolled_up_and_deleted_in_batches(engine):
+    old = NOW - 20 * DAY
+    _insert(engine, [(old + i, '!a' if i % 2 else '!b', float(i)) for i in range(25)])
+    _insert(engine, [(NOW - 60, '!a', 1.0)])
+
+    removed, statements = _traced_run(engine)
+
+    assert removed == 25
+    assert sum(1 for statement in statements if statement.startswith("BEGIN IMMEDIATE")) == 3
+    conn = db_manager.get_connection(engine.db_path)
+    assert conn.execute("SELECT COUNT(*) FROM samples").fetchone()[0] == 1
+    rollup = dict(conn.execute("SELECT node_id, samples FROM samples_hourly").fetchall())
+    assert rollup == {'!a': 12, '!b': 13}
+    archive, = os.listdir(engine.archive_dir)
+    with gzip.open(os.path.join(engine.archive_dir, archive), 'rt', encoding='utf-8') as lines:
+        assert sorted(json.loads(line)['snr'] for line in lines) == [float(i) for i in range(25)]
+
+
+def test_pass_with_nothing_expired_never_takes_the_write_lock(engine):
+    _insert(engine, [(NOW - 60 * i, '!a', 1.0) for i in range(100)])
+
+    removed, statements = _traced_run(engine)
+
+    assert removed == 0
+    assert not [statement for statement in statements if statement.startswith("BEGIN")]
@@ -0,0 +1,120 @@
+"""
+The outbound send scheduler under load: handlers of 50 concurrent users queue long
+replies through utils.send_message while a fake radio records what goes on air.
+"""
+import threading
+import time
+
+import pytest
+
+import utils
+from packer import utf8_len
+from send_queue import PRIORITY_INTERACTIVE, PRIORITY_SYNC, SendScheduler
+
+USERS = 50
+MAX_PAYLOAD = 200
+PACING = 0.002
+
+
+class FakeRadio:
+    """Records (time, destination, chunk) for every transmitted chunk."""
+
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def transmit(self, chunk, destination, interface):
+        with self._lock:
+            self.sent.append((time.monotonic(), destination, chunk))
+
+    def chunks_for(self, destination):
+        with self._lock:
+            return [chunk for _, sent_to, chunk in self.sent if sent_to == destination]
+
+
+@pytest.fixture
+def radio(monkeypatch):
+    radio = FakeRadio()
+    scheduler = SendScheduler(radio.transmit, pacing=PACING, maxsize=10000, stats_interval=0)
+    scheduler.start()
+    monkeypatch.setattr(utils, '_send_scheduler', scheduler)
+    monkeypatch.setattr(utils, '_max_payload', MAX_PAYLOAD)
+    yield radio
+    scheduler.stop(timeout=0)
+
+
+def _listing(user, page):
+    return '\n'.join(f"{user}/{page}/{line}. Bulletin subject ─ a sender 💾" for line in range(20))
+
+
+def _wait_for(radio, frames, timeout=60):
+    deadline = time.monotonic() + timeout
+    while len(radio.sent) < frames and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def test_handlers_return_at_once_for_50_concurrent_users(radio):
+    latencies = {}
+    frame_counts = {}
+    start = threading.Barrier(USERS)
+
+    def handler(user):
+        start.wait()
+        began = time.monotonic()
+        frame_counts[user] = sum(utils.send_message(_listing(user, page), user, object()) for page in range(3))
+        latencies[user] = time.monotonic() - began
+
+    threads = [threading.Thread(target=handler, args=(user,)) for user in range(USERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    frames = sum(frame_counts.values())
+    _wait_for(radio, frames)
+
+    airtime = radio.sent[-1][0] - radio.sent[0][0]
+    assert len(latencies) == USERS
+    # Pacing the whole backlog takes seconds; no handler waits even for the pacing of its own reply
+    assert airtime >= (frames - 1) * PACING
+    assert all(latencies[user] < frame_counts[user] * PACING for user in range(USERS)), latencies
+    assert len(radio.sent) == frames
+    assert utils._send_scheduler.max_depth > 1
+    for user in range(USERS):
+        chunks = radio.chunks_for(user)
+        assert all(utf8_len(chunk) <= MAX_PAYLOAD for chunk in chunks)
+        # Each user's replies arrive whole and in the order they were sent
+        assert '\n'.join(chunks) == '\n'.join(_listing(user, page) for page in range(3))
+
+
+def test_chunks_are_paced(radio):
+    _wait_for(radio, utils.send_message(_listing(1, 0), 1, object()))
+    times = [sent_at for sent_at, _, _ in radio.sent]
+    assert len(times) > 1
+    assert all(later - earlier >= PACING * 0.9 for earlier, later in zip(times, times[1:]))
+
+
+def test_queue_depth_and_drops_when_full():
+    scheduler = SendScheduler(lambda chunk, destination, interface: None, maxsize=3, put_timeout=0)
+
+    assert scheduler.submit(['a'], 1, None)
+    assert scheduler.submit(['b', 'c'], 2, None)
+    assert scheduler.submit(['d'], 3, None, PRIORITY_SYNC)
+    assert not scheduler.submit(['e'], 4, None)
+
+    assert scheduler.depth() == 3
+    assert scheduler.depth_by_priority()[PRIORITY_INTERACTIVE] == 2
+    assert scheduler.depth_by_priority()[PRIORITY_SYNC] == 1
+    assert scheduler.stats()['max_depth'] == 3
+    assert scheduler.stats()['dropped'] == 1
+
+
+def test_interactive_replies_are_not_stuck_behind_a_sync_backlog():
+    scheduler = SendScheduler(lambda chunk, destination, interface: None)
+    for _ in range(100):
+        scheduler.submit(['sync'], '!peer', None, PRIORITY_SYNC)
+    scheduler.submit(['reply'], 1, None)
+    scheduler._running = True
+
+    served = [scheduler._next()[0] for _ in range(10)]
+
+    assert (PRIORITY_INTERACTIVE, 1) in served
@@ -0,0 +1,169 @@
+"""
+Three BBS nodes peered with each other, passing sync messages through their outboxes.
+
+Each node has its own database; the node a step runs on is selected by pointing the
+[database] settings at its file, as a separate BBS process would have them.
+"""
+import configparser
+
+import pytest
+
+import db_manager
+import db_operations
+import utils
+from db_operations import SYNC_APPLIED, SYNC_DUPLICATE
+from sync_apply import SyncApplier
+from sync_outbox import SyncOutbox
+from sync_transport import decode_fields
+
+NODES = ('!alpha', '!bravo', '!charlie')
+
+
+class Node:
+    def __init__(self, name, db_path):
+        self.name = name
+        self.db_path = db_path
+        self.bbs_nodes = [peer for peer in NODES if peer != name]
+        self.applier = SyncApplier()
+        self.sent = []
+        self.outbox = SyncOutbox(self._send, db_path=db_path)
+
+    def _send(self, peer, message_id, payload):
+        self.sent.append((peer, message_id, payload))
+        return True
+
+
+class Mesh:
+    def __init__(self, tmp_path, monkeypatch):
+        self.nodes = {name: Node(name, str(tmp_path / f"{name[1:]}.db")) for name in NODES}
+        self.monkeypatch = monkeypatch
+        # (origin, destination, kind, status) of every sync message delivered
+        self.log = []
+        for name in NODES:
+            with self.on(name):
+                db_operations.initialize_database()
+
+    def on(self, name):
+        return _OnNode(self, self.nodes[name])
+
+    def send_due(self, name):
+        """Run one outbox pass on a node and return what it sent."""
+        node = self.nodes[name]
+        with self.on(name):
+            node.outbox._send_due(db_manager.get_connection(node.db_path))
+        sent, node.sent = node.sent, []
+        return sent
+
+    def deliver(self, origin, destination, message_id, payload, ack=True):
+        fields = decode_fields(payload)
+        with self.on(destination):
+            status = self.nodes[destination].applier.apply(fields, None)
+        self.log.append((origin, destination, fields[0], status))
+        if ack:
+            with self.on(origin):
+                self.nodes[origin].outbox.acknowledge(destination, message_id)
+        return status
+
+    def settle(self):
+        """Send and deliver until no node has anything due."""
+        while True:
+            sent = [(name, message) for name in NODES for message in self.send_due(name)]
+            if not sent:
+                return
+            for origin, (destination, message_id, payload) in sent:
+                self.deliver(origin, destination, message_id, payload)
+
+    def backlog(self, name):
+        with self.on(name):
+            return sum(peer['backlog'] for peer in self.nodes[name].outbox.backlog().values())
+
+    def bulletins(self, name):
+        with self.on(name):
+            conn = db_manager.get_connection()
+            return conn.execute("SELECT unique_id, subject FROM bulletins ORDER BY unique_id").fetchall()
+
+    def close(self):
+        for node in self.nodes.values():
+            db_manager.close_connection(node.db_path)
+        db_manager.load_settings(configparser.ConfigParser())
+
+
+class _OnNode:
+    def __init__(self, mesh, node):
+        self.mesh = mesh
+        self.node = node
+
+    def __enter__(self):
+        config = configparser.ConfigParser()
+        config.read_dict({'database': {'path': self.node.db_path}})
+        db_manager.load_settings(config)
+        # Changes made on this node go into its own outbox
+        self.mesh.monkeypatch.setattr(utils, 'get_sync_outbox', lambda: self.node.outbox)
+        return self.node
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+@pytest.fixture
+def mesh(tmp_path, monkeypatch):
+    mesh = Mesh(tmp_path, monkeypatch)
+    yield mesh
+    mesh.close()
+
+
+def _post(mesh, name, subject, unique_id):
+    with mesh.on(name) as node:
+        db_operations.add_bulletin('General', 'AL', subject, 'Text', node.bbs_nodes, object(), unique_id=unique_id)
+
+
+def _delete(mesh, name, unique_id):
+    with mesh.on(name) as node:
+        db_operations.delete_bulletin(unique_id, node.bbs_nodes, object())
+
+
+def test_changes_reach_every_node_without_echoing_back(mesh):
+    _post(mesh, '!alpha', 'News', 'b-1')
+    mesh.settle()
+    _delete(mesh, '!bravo', 'b-1')
+    mesh.settle()
+
+    assert mesh.log == [
+        ('!alpha', '!bravo', 'BULLETIN', SYNC_APPLIED),
+        ('!alpha', '!charlie', 'BULLETIN', SYNC_APPLIED),
+        ('!bravo', '!alpha', 'DELETE_BULLETIN', SYNC_APPLIED),
+        ('!bravo', '!charlie', 'DELETE_BULLETIN', SYNC_APPLIED),
+    ]
+    assert all(mesh.bulletins(name) == [] for name in NODES)
+    assert all(mesh.backlog(name) == 0 for name in NODES)
+
+
+@pytest.mark.parametrize('fresh_applier', [False, True], ids=['remembered', 'restarted'])
+def test_replayed_add_delete_and_ack_are_idempotent(mesh, fresh_applier):
+    _post(mesh, '!alpha', 'News', 'b-1')
+    add = [message for message in mesh.send_due('!alpha') if message[0] == '!bravo']
+    destination, message_id, payload = add[0]
+
+    assert mesh.deliver('!alpha', destination, message_id, payload) == SYNC_APPLIED
+    if fresh_applier:
+        # A restarted node no longer remembers recent messages and relies on the database alone
+        mesh.nodes['!bravo'].applier = SyncApplier()
+    assert mesh.deliver('!alpha', destination, message_id, payload) == SYNC_DUPLICATE
+    assert mesh.bulletins('!bravo') == [('b-1', 'News')]
+    with mesh.on('!alpha') as alpha:
+        assert not alpha.outbox.acknowledge('!bravo', message_id)
+        assert alpha.outbox.acked == 1
+
+    _delete(mesh, '!alpha', 'b-1')
+    delete = [message for message in mesh.send_due('!alpha') if message[0] == '!bravo']
+    destination, message_id, payload = delete[0]
+    assert mesh.deliver('!alpha', destination, message_id, payload) == SYNC_APPLIED
+    if fresh_applier:
+        mesh.nodes['!bravo'].applier = SyncApplier()
+    assert mesh.deliver('!alpha', destination, message_id, payload) == SYNC_DUPLICATE
+    # The add arriving again after the delete must not bring the bulletin back
+    assert mesh.deliver('!alpha', *add[0], ack=False) == SYNC_DUPLICATE
+    assert mesh.bulletins('!bravo') == []
+
+    assert mesh.backlog('!bravo') == 0
+    assert mesh.send_due('!bravo') == []
@@ -0,0 +1,37 @@
+import db_manager
+from sync_outbox import SyncOutbox
+
+
+def _rows(db_path):
+    conn = db_manager.get_connection(db_path)
+    return conn.execute("SELECT kind, item_key, attempts FROM sync_outbox ORDER BY id").fetchall()
+
+
+def test_delete_during_send_is_queued_rather_than_cancelling_the_add(db_path):
+    sent = []
+
+    def send(peer, message_id, payload):
+        sent.append(payload)
+        if payload.startswith('BULLETIN'):
+            # The bulletin is deleted while its add is on the way to the peer
+            outbox.enqueue('DELETE_BULLETIN', 'b-1', 'DELETE_BULLETIN|b-1', ['!peer'])
+        return True
+
+    outbox = SyncOutbox(send, db_path=db_path)
+    outbox.enqueue('BULLETIN', 'b-1', 'BULLETIN|General|AL|News|Text|b-1', ['!peer'])
+    outbox._send_due(db_manager.get_connection(db_path))
+
+    assert _rows(db_path) == [('DELETE_BULLETIN', 'b-1', 0)]
+    outbox._send_due(db_manager.get_connection(db_path))
+    assert sent == ['BULLETIN|General|AL|News|Text|b-1', 'DELETE_BULLETIN|b-1']
+
+
+def test_add_the_send_queue_refused_is_still_cancelled_by_a_delete(db_path):
+    outbox = SyncOutbox(lambda peer, message_id, payload: False, db_path=db_path)
+    outbox.enqueue('BULLETIN', 'b-1', 'BULLETIN|General|AL|News|Text|b-1', ['!peer'])
+    outbox._send_due(db_manager.get_connection(db_path))
+
+    assert _rows(db_path) == [('BULLETIN', 'b-1', 0)]
+    outbox.enqueue('DELETE_BULLETIN', 'b-1', 'DELETE_BULLETIN|b-1', ['!peer'])
+    assert _rows(db_path) == []
+    assert outbox.coalesced == 1
@@ -0,0 +1,133 @@
+"""Framing and reassembly of sync messages sent by several nodes over a lossy, reordering mesh."""
+import random
+
+import pytest
+
+import sync_transport
+from sync_transport import Reassembler, encode_fields, frame_message
+
+MAX_BYTES = 64
+ALPHABET = ['a', 'Z', '7', ' ', '|', '\\', 'é', '─', '💾', '\n']
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(sync_transport.time, 'monotonic', fake)
+    return fake
+
+
+def _payload(rng):
+    fields = ['MAIL', *(''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 60))) for _ in range(4))]
+    return encode_fields(fields)
+
+
+def _deliver(reassembler, frames):
+    """Feed (sender, frame) pairs to ``reassembler`` and return the (sender, payload) pairs it completes."""
+    received = []
+    for sender, frame in frames:
+        payload = reassembler.add(sender, frame)
+        if payload is not None:
+            received.append((sender, payload))
+    return received
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_interleaved_senders_with_reordered_and_duplicated_frames(clock, seed):
+    rng = random.Random(seed)
+    sent = []
+    on_air = []
+    for sender in ('!alpha', '!bravo', '!charlie'):
+        for _ in range(rng.randint(1, 5)):
+            payload = _payload(rng)
+            frames = frame_message(payload, MAX_BYTES)
+            assert all(sync_transport.utf8_len(frame) <= MAX_BYTES for frame in frames)
+            sent.append((sender, payload))
+            on_air.extend((sender, frame) for frame in frames)
+    # Every frame may be retransmitted, and the mesh delivers them in any order
+    on_air.extend(rng.sample(on_air, len(on_air) // 2))
+    rng.shuffle(on_air)
+    reassembler = Reassembler(timeout=300, max_pending=64)
+
+    received = _deliver(reassembler, on_air)
+
+    assert sorted(received) == sorted(sent)
+    assert reassembler.pending() == 0
+    assert reassembler.completed == len(sent)
+
+
+def test_retransmission_after_completion_is_ignored(clock):
+    frames = frame_message(_payload(random.Random(1)), MAX_BYTES)
+    reassembler = Reassembler()
+
+    assert len(_deliver(reassembler, [('!alpha', frame) for frame in frames])) == 1
+    assert _deliver(reassembler, [('!alpha', frame) for frame in reversed(frames)]) == []
+    assert reassembler.duplicates == len(frames)
+    assert reassembler.completed_recently('!alpha', frames[0].split('|')[1])
+
+
+def test_same_message_id_from_two_senders_is_kept_apart(clock):
+    first = frame_message('x' * 100, MAX_BYTES, message_id='deadbeef')
+    second = frame_message('y' * 100, MAX_BYTES, message_id='deadbeef')
+    reassembler = Reassembler()
+
+    interleaved = [pair for frames in zip(first, second) for pair in zip(('!alpha', '!bravo'), frames)]
+    received = _deliver(reassembler, interleaved)
+
+    assert sorted(received) == [('!alpha', 'x' * 100), ('!bravo', 'y' * 100)]
+
+
+def test_partial_message_expires_after_reassembly_timeout(clock):
+    frames = frame_message('x' * 200, MAX_BYTES)
+    reassembler = Reassembler(timeout=300)
+
+    assert _deliver(reassembler, [('!alpha', frame) for frame in frames[:-1]]) == []
+    clock.now += 299
+    assert reassembler.add('!bravo', frame_message('ping', MAX_BYTES)[0]) == 'ping'
+    assert reassembler.pending() == 1
+
+    clock.now += 1
+    # The late last frame starts a new partial message instead of completing the expired one
+    assert reassembler.add('!alpha', frames[-1]) is None
+    assert reassembler.expired == 1
+    assert reassembler.pending() == 1
+    # A full retransmission still gets through
+    assert _deliver(reassembler, [('!alpha', frame) for frame in frames]) == [('!alpha', 'x' * 200)]
+
+
+def test_oldest_partial_message_is_evicted_past_max_pending(clock):
+    reassembler = Reassembler(max_pending=3)
+    messages = {f"!node{i}": frame_message(str(i) * 100, MAX_BYTES) for i in range(5)}
+
+    # First frame of every message, so all five are partial at once
+    for sender, frames in messages.items():
+        clock.now += 1
+        assert reassembler.add(sender, frames[0]) is None
+
+    assert reassembler.pending() == 3
+    assert reassembler.evicted == 2
+    rest = [(sender, frame) for sender, frames in reversed(messages.items()) for frame in frames[1:]]
+    received = _deliver(reassembler, rest)
+    # The evicted messages lost their first frame, so only the three kept ones complete
+    assert sorted(received) == [(f"!node{i}", str(i) * 100) for i in (2, 3, 4)]
+
+
+def test_malformed_and_inconsistent_frames_are_counted(clock):
+    frames = frame_message('x' * 100, MAX_BYTES, message_id='cafebabe')
+    reassembler = Reassembler()
+
+    assert reassembler.add('!alpha', 'SYNC|cafebabe|5|2|oops') is None
+    assert reassembler.add('!alpha', 'hello') is None
+    assert reassembler.add('!alpha', frames[0]) is None
+    assert reassembler.add('!alpha', 'SYNC|cafebabe|1|7|oops') is None
+
+    assert reassembler.malformed == 3
+    assert _deliver(reassembler, [('!alpha', frame) for frame in frames[1:]]) == [('!alpha', 'x' * 100)]
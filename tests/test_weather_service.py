@@ -0,0 +1,193 @@
+"""WeatherService against a local stub of the OpenWeatherMap API."""
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from weather_service import STATUS_ERROR, STATUS_NOT_FOUND, STATUS_OK, STATUS_UNAVAILABLE, WeatherService
+
+NOT_FOUND_ZIP = '00000'
+BROKEN_ZIP = '99999'
+
+
+class StubWeatherApi(ThreadingHTTPServer):
+    """Answers every ZIP with a fixed report; counts requests and can hold them until released."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubWeatherHandler)
+        self.requests = Counter()
+        self.release = threading.Event()
+        self.release.set()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/data/2.5/weather"
+
+
+class StubWeatherHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        zip_code = parse_qs(urlparse(self.path).query)['zip'][0].split(',')[0]
+        self.server.requests[zip_code] += 1
+        self.server.release.wait(5)
+        if zip_code == NOT_FOUND_ZIP:
+            self._reply(404, {'cod': '404', 'message': 'city not found'})
+        elif zip_code == BROKEN_ZIP:
+            self._reply(500, {'cod': 500})
+        else:
+            self._reply(200, {'name': f"Town {zip_code}", 'main': {'temp': 71.6, 'feels_like': 70.2, 'humidity': 40},
+                              'weather': [{'description': 'clear sky'}]})
+
+    def _reply(self, code, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Replies:
+    """Collects (status, message) callbacks and waits for a number of them."""
+
+    def __init__(self):
+        self.received = []
+        self._cond = threading.Condition()
+
+    def __call__(self, status, message):
+        with self._cond:
+            self.received.append((status, message))
+            self._cond.notify_all()
+
+    def wait(self, count, timeout=10):
+        with self._cond:
+            assert self._cond.wait_for(lambda: len(self.received) >= count, timeout), self.received
+        return self.received
+
+
+@pytest.fixture
+def api():
+    server = StubWeatherApi()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_service(api, db_path):
+    services = []
+
+    def make(**kwargs):
+        service = WeatherService(api_key='test', base_url=api.url, db_path=db_path, **kwargs)
+        service.start()
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        service.stop()
+
+
+def test_second_lookup_is_a_cache_hit(api, make_service):
+    service = make_service()
+    replies = Replies()
+
+    service.request('12345', replies)
+    replies.wait(1)
+    service.request('12345', replies)
+
+    status, message = replies.wait(2)[1]
+    assert status == STATUS_OK
+    assert message.startswith("☁️ Town 12345 Weather ☁️")
+    assert api.requests['12345'] == 1
+    assert service.stats()['hits'] == 1
+    assert service.stats()['hit_rate'] == 0.5
+
+
+def test_concurrent_lookups_for_one_zip_share_a_fetch(api, make_service):
+    service = make_service()
+    replies = Replies()
+    api.release.clear()
+
+    threads = [threading.Thread(target=service.request, args=('12345', replies)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert replies.received == []
+    api.release.set()
+
+    assert len(set(replies.wait(20))) == 1
+    assert api.requests['12345'] == 1
+    assert service.stats()['coalesced'] == 19
+
+
+def test_request_never_waits_for_the_api(api, make_service):
+    service = make_service()
+    replies = Replies()
+    api.release.clear()
+
+    began = time.monotonic()
+    service.request('12345', replies)
+    assert time.monotonic() - began < 0.5
+    api.release.set()
+    assert replies.wait(1)[0][0] == STATUS_OK
+
+
+def test_cache_survives_a_restart(api, make_service):
+    replies = Replies()
+    first = make_service()
+    first.request('12345', replies)
+    replies.wait(1)
+    first.stop()
+
+    second = make_service()
+    second.request('12345', replies)
+
+    assert replies.wait(2)[1] == replies.received[0]
+    assert api.requests['12345'] == 1
+    assert second.stats()['hits'] == 1
+
+
+def test_only_definitive_answers_are_cached(api, make_service):
+    service = make_service()
+    replies = Replies()
+
+    for count, zip_code in enumerate((NOT_FOUND_ZIP, BROKEN_ZIP, NOT_FOUND_ZIP, BROKEN_ZIP), 1):
+        service.request(zip_code, replies)
+        replies.wait(count)
+
+    assert [status for status, _ in replies.received] == [STATUS_NOT_FOUND, STATUS_UNAVAILABLE] * 2
+    assert api.requests == {NOT_FOUND_ZIP: 1, BROKEN_ZIP: 2}
+
+
+def test_unreachable_api_is_an_error(db_path):
+    service = WeatherService(api_key='test', base_url='http://127.0.0.1:9/', timeout=1, db_path=db_path)
+    assert service.fetch('12345') == (STATUS_ERROR, None)
+    assert service.stats()['errors'] == 1
+
+
+def test_popular_zips_are_prefetched_before_they_expire(api, make_service):
+    service = make_service(ttl=0.6, prefetch_interval=0.2, prefetch_count=1)
+    replies = Replies()
+    for count, zip_code in enumerate(('11111', '11111', '22222'), 1):
+        service.request(zip_code, replies)
+        replies.wait(count)
+
+    deadline = time.monotonic() + 5
+    while api.requests['11111'] < 3 and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert api.requests['11111'] >= 3
+    assert api.requests['22222'] == 1
@@ -1,50 +1,109 @@
+import configparser
 import logging
-import time
-
-user_states = {}
+import threading
+import uuid
 
+from node_index import get_node_index
+from packer import DEFAULT_MAX_PAYLOAD, MIN_MAX_PAYLOAD, pack_message
+from session_store import get_session_store
+from send_queue import SendScheduler, PRIORITY_INTERACTIVE, PRIORITY_SYNC
+from sync_outbox import SyncOutbox
+from sync_transport import chunk_bytes_for, encode_fields, frame_message
 
 def update_user_state(user_id, state):
-    user_states[user_id] = state
+    get_session_store().set(user_id, state)
 
 
 def get_user_state(user_id):
-    return user_states.get(user_id, None)
-
-
-def send_message(message, destination, interface):
-    max_payload_size = 200
-    for i in range(0, len(message), max_payload_size):
-        chunk = message[i:i + max_payload_size]
-        try:
-            d = interface.sendText(
-                text=chunk,
-                destinationId=destination,
-                wantAck=True,
-                wantResponse=False
+    return get_session_store().get(user_id)
+
+
+def start_draft(user_id):
+    get_session_store().start_draft(user_id)
+
+
+def append_draft(user_id, line):
+    return get_session_store().append_draft(user_id, line)
+
+
+def take_draft(user_id):
+    return get_session_store().take_draft(user_id)
+
+
+def _transmit_chunk(chunk, destination, interface):
+    d = interface.sendText(
+        text=chunk,
+        destinationId=destination,
+        wantAck=True,
+        wantResponse=False
+    )
+    destid = get_node_id_from_num(destination, interface)
+    chunk = chunk.replace('\n', '\\n')
+    logging.info(f"Sending message to user '{get_node_short_name(destid, interface)}' ({destid}) with sendID {d.id}: \"{chunk}\"")
+
+
+_send_scheduler = None
+_send_scheduler_lock = threading.Lock()
+_max_payload = DEFAULT_MAX_PAYLOAD
+
+
+def get_send_scheduler():
+    global _send_scheduler, _max_payload
+    with _send_scheduler_lock:
+        if _send_scheduler is None:
+            config = configparser.ConfigParser()
+            config.read('config.ini')
+            _max_payload = config.getint('send_queue', 'max_payload', fallback=DEFAULT_MAX_PAYLOAD)
+            if _max_payload < MIN_MAX_PAYLOAD:
+                logging.warning(f"[send_queue] max_payload {_max_payload} is too small, using {MIN_MAX_PAYLOAD}")
+                _max_payload = MIN_MAX_PAYLOAD
+            weights = {
+                priority: config.getfloat('send_queue', f'{priority}_weight', fallback=None)
+                for priority in ('urgent', 'interactive', 'sync')
+            }
+            _send_scheduler = SendScheduler(
+                _transmit_chunk,
+                pacing=config.getfloat('send_queue', 'pacing', fallback=2.0),
+                maxsize=config.getint('send_queue', 'max_queue', fallback=500),
+                weights={priority: weight for priority, weight in weights.items() if weight},
+                stats_interval=config.getint('send_queue', 'stats_interval', fallback=900)
             )
-            destid = get_node_id_from_num(destination, interface)
-            chunk = chunk.replace('\n', '\\n')
-            logging.info(f"Sending message to user '{get_node_short_name(destid, interface)}' ({destid}) with sendID {d.id}: \"{chunk}\"")
-        except Exception as e:
-            logging.info(f"REPLY SEND ERROR {e.message}")
+            _send_scheduler.start()
+        return _send_scheduler
+
+
+def get_max_payload():
+    """Maximum UTF-8 bytes per radio frame, from [send_queue] max_payload."""
+    get_send_scheduler()
+    return _max_payload
+
+
+def shutdown_send_scheduler(timeout=10.0):
+    if _send_scheduler is not None:
+        _send_scheduler.stop(timeout)
+
 
-        
-        time.sleep(2)
+def send_message(message, destination, interface, priority=PRIORITY_INTERACTIVE):
+    """Queue a message for sending, packed into radio frames. Returns the number of frames."""
+    scheduler = get_send_scheduler()
+    chunks = pack_message(message, _max_payload)
+    if not chunks:
+        return 0
+    scheduler.submit(chunks, destination, interface, priority)
+    logging.debug(f"Queued {len(chunks)} frame(s) ({len(message.encode('utf-8'))} bytes), send queue depth: {scheduler.depth()}")
+    return len(chunks)
 
 
 def get_node_info(interface, short_name):
-    nodes = [{'num': node_id, 'shortName': node['user']['shortName'], 'longName': node['user']['longName']}
-             for node_id, node in interface.nodes.items()
-             if node['user']['shortName'].lower() == short_name]
+    nodes = []
+    for node_id in get_node_index(interface).ids_by_short_name(short_name, interface.nodes):
+        node = interface.nodes[node_id]
+        nodes.append({'num': node_id, 'shortName': node['user']['shortName'], 'longName': node['user']['longName']})
     return nodes
 
 
 def get_node_id_from_num(node_num, interface):
-    for node_id, node in interface.nodes.items():
-        if node['num'] == node_num:
-            return node_id
-    return None
+    return get_node_index(interface).id_from_num(node_num, interface.nodes)
 
 
 def get_node_short_name(node_id, interface):
@@ -54,34 +113,83 @@ def get_node_short_name(node_id, interface):
     return None
 
 
+_sync_outbox = None
+_sync_outbox_lock = threading.Lock()
+_sync_interface = None
+
+
+def _send_sync_payload(peer, message_id, payload):
+    if _sync_interface is None:
+        return False
+    frames = frame_message(payload, get_max_payload(), message_id)
+    return get_send_scheduler().submit(frames, peer, _sync_interface, PRIORITY_SYNC)
+
+
+def get_sync_outbox():
+    global _sync_outbox
+    with _sync_outbox_lock:
+        if _sync_outbox is None:
+            config = configparser.ConfigParser()
+            config.read('config.ini')
+            _sync_outbox = SyncOutbox(
+                _send_sync_payload,
+                retry_base=config.getint('sync', 'retry_base', fallback=120),
+                retry_max=config.getint('sync', 'retry_max', fallback=3600),
+                max_attempts=config.getint('sync', 'max_attempts', fallback=20)
+            )
+        return _sync_outbox
+
+
+def start_sync_outbox(interface):
+    global _sync_interface
+    # Fail at startup rather than on the outbox thread if frames cannot hold the sync header
+    chunk_bytes_for(get_max_payload())
+    _sync_interface = interface
+    get_sync_outbox().start()
+
+
+def shutdown_sync_outbox():
+    if _sync_outbox is not None:
+        _sync_outbox.stop()
+
+
+def send_sync_message(fields, item_key, bbs_nodes, interface):
+    """Queue a sync message for every peer BBS in the durable outbox; it is retried until acknowledged."""
+    if not bbs_nodes:
+        return
+    get_sync_outbox().enqueue(fields[0], str(item_key), encode_fields(fields), bbs_nodes)
+    logging.debug(f"Queued {fields[0]} sync for {item_key} to {len(bbs_nodes)} BBS node(s)")
+
+
+def send_sync_request(fields, peer):
+    """Send a one-off sync message to a peer BBS without queueing it for acknowledgement."""
+    return _send_sync_payload(peer, uuid.uuid4().hex[:8], encode_fields(fields))
+
+
+def send_sync_ack(message_id, destination, interface):
+    send_message(f"SYNC_ACK|{message_id}", destination, interface, PRIORITY_SYNC)
+
+
 def send_bulletin_to_bbs_nodes(board, sender_short_name, subject, content, unique_id, bbs_nodes, interface):
-    message = f"BULLETIN|{board}|{sender_short_name}|{subject}|{content}|{unique_id}"
-    for node_id in bbs_nodes:
-        send_message(message, node_id, interface)
+    send_sync_message(["BULLETIN", board, sender_short_name, subject, content, unique_id], unique_id,
+                      bbs_nodes, interface)
 
 
 def send_mail_to_bbs_nodes(sender_id, sender_short_name, recipient_id, subject, content, unique_id, bbs_nodes,
                            interface):
-    message = f"MAIL|{sender_id}|{sender_short_name}|{recipient_id}|{subject}|{content}|{unique_id}"
     logging.info(f"SERVER SYNC: Syncing new mail message {subject} sent from {sender_short_name} to other BBS systems.")
-    for node_id in bbs_nodes:
-        send_message(message, node_id, interface)
+    send_sync_message(["MAIL", sender_id, sender_short_name, recipient_id, subject, content, unique_id],
+                      unique_id, bbs_nodes, interface)
 
 
-def send_delete_bulletin_to_bbs_nodes(bulletin_id, bbs_nodes, interface):
-    message = f"DELETE_BULLETIN|{bulletin_id}"
-    for node_id in bbs_nodes:
-        send_message(message, node_id, interface)
+def send_delete_bulletin_to_bbs_nodes(unique_id, bbs_nodes, interface):
+    send_sync_message(["DELETE_BULLETIN", unique_id], unique_id, bbs_nodes, interface)
 
 
 def send_delete_mail_to_bbs_nodes(unique_id, bbs_nodes, interface):
-    message = f"DELETE_MAIL|{unique_id}"
     logging.info(f"SERVER SYNC: Sending delete mail sync message with unique_id: {unique_id}")
-    for node_id in bbs_nodes:
-        send_message(message, node_id, interface)
+    send_sync_message(["DELETE_MAIL", unique_id], unique_id, bbs_nodes, interface)
 
 
 def send_channel_to_bbs_nodes(name, url, bbs_nodes, interface):
-    message = f"CHANNEL|{name}|{url}"
-    for node_id in bbs_nodes:
-        send_message(message, node_id, interface)
+    send_sync_message(["CHANNEL", name, url], name, bbs_nodes, interface)
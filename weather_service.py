@@ -0,0 +1,218 @@
+import configparser
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+import requests
+
+import db_manager
+
+STATUS_OK = 'ok'
+STATUS_NOT_FOUND = 'not_found'
+STATUS_UNAVAILABLE = 'unavailable'
+STATUS_ERROR = 'error'
+
+# Only definitive answers are cached; transient failures are retried on the next request
+CACHEABLE = (STATUS_OK, STATUS_NOT_FOUND)
+
+DEFAULT_API_KEY = "b5f7bc717799c13af6c652a35002edd6"
+DEFAULT_BASE_URL = "http://api.openweathermap.org/data/2.5/weather"
+
+
+def format_weather(data):
+    temp = data["main"]["temp"]
+    feels_like = data["main"]["feels_like"]
+    humidity = data["main"]["humidity"]
+    conditions = data["weather"][0]["description"].title()
+    city = data["name"]
+
+    return (f"☁️ {city} Weather ☁️\n\n"
+            f"Temp: {temp:.0f}°F (feels {feels_like:.0f}°F)\n"
+            f"Conditions: {conditions}\n"
+            f"Humidity: {humidity}%")
+
+
+class WeatherService:
+    """
+    Cached, asynchronous OpenWeatherMap lookups by ZIP code.
+
+    ``request`` never blocks on the network. Fresh cache entries (in memory, backed by
+    the weather_cache table so they survive restarts) are answered immediately.
+    Otherwise the ZIP is queued for the worker thread, and concurrent requests for a
+    ZIP that is already being fetched just add their callback to the pending fetch.
+    Callbacks receive ``(status, message)`` and run on the worker thread.
+    """
+
+    def __init__(self, api_key=DEFAULT_API_KEY, base_url=DEFAULT_BASE_URL, country_code='us', ttl=600,
+                 timeout=5, prefetch_interval=0, prefetch_count=3, db_path=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.country_code = country_code
+        self.ttl = ttl
+        self.timeout = timeout
+        self.prefetch_interval = prefetch_interval
+        self.prefetch_count = prefetch_count
+        self.db_path = db_path
+
+        self._cache = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = []
+
+        self.request_counts = Counter()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.errors = 0
+
+    def start(self):
+        if self._threads:
+            return
+        self._load_cache()
+        worker = threading.Thread(target=self._run_worker, name='weather-worker', daemon=True)
+        worker.start()
+        self._threads.append(worker)
+        if self.prefetch_interval > 0:
+            prefetcher = threading.Thread(target=self._run_prefetch, name='weather-prefetch', daemon=True)
+            prefetcher.start()
+            self._threads.append(prefetcher)
+
+    def stop(self):
+        self._stop.set()
+        self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=self.timeout + 1)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'fetches': self.fetches,
+            'errors': self.errors,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'cached_zips': len(self._cache)
+        }
+
+    def request(self, zip_code, callback):
+        with self._lock:
+            self.request_counts[zip_code] += 1
+            cached = self._cache.get(zip_code)
+            if cached and time.time() - cached[0] < self.ttl:
+                self.hits += 1
+                status, message = cached[1], cached[2]
+            else:
+                self.misses += 1
+                waiting = self._in_flight.get(zip_code)
+                if waiting is not None:
+                    self.coalesced += 1
+                    waiting.append(callback)
+                else:
+                    self._in_flight[zip_code] = [callback]
+                    self._queue.put(zip_code)
+                return
+        callback(status, message)
+
+    def fetch(self, zip_code):
+        """Synchronously call the weather API. Returns (status, message)."""
+        self.fetches += 1
+        try:
+            response = requests.get(self.base_url, params={
+                'zip': f"{zip_code},{self.country_code}",
+                'appid': self.api_key,
+                'units': 'imperial'
+            }, timeout=self.timeout)
+            if response.status_code == 200:
+                return STATUS_OK, format_weather(response.json())
+            elif response.status_code == 404:
+                return STATUS_NOT_FOUND, None
+            return STATUS_UNAVAILABLE, None
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"Error getting weather: {e}")
+            return STATUS_ERROR, None
+
+    def _run_worker(self):
+        while not self._stop.is_set():
+            zip_code = self._queue.get()
+            if zip_code is None:
+                break
+            status, message = self.fetch(zip_code)
+            fetched_at = time.time()
+            with self._lock:
+                if status in CACHEABLE:
+                    self._cache[zip_code] = (fetched_at, status, message)
+                callbacks = self._in_flight.pop(zip_code, [])
+            if status in CACHEABLE:
+                self._store(zip_code, fetched_at, status, message)
+            for callback in callbacks:
+                try:
+                    callback(status, message)
+                except Exception as e:
+                    logging.error(f"Error delivering weather for {zip_code}: {e}")
+        db_manager.close_connection(self.db_path)
+
+    def _run_prefetch(self):
+        while not self._stop.wait(self.prefetch_interval):
+            with self._lock:
+                popular = [zip_code for zip_code, _ in self.request_counts.most_common(self.prefetch_count)]
+                for zip_code in popular:
+                    cached = self._cache.get(zip_code)
+                    stale = not cached or time.time() - cached[0] >= self.ttl - self.prefetch_interval
+                    if stale and zip_code not in self._in_flight:
+                        self._in_flight[zip_code] = []
+                        self._queue.put(zip_code)
+
+    def _load_cache(self):
+        try:
+            conn = db_manager.get_connection(self.db_path)
+            rows = conn.execute("SELECT zip, fetched_at, status, message FROM weather_cache WHERE fetched_at >= ?",
+                                (time.time() - self.ttl,)).fetchall()
+        except Exception as e:
+            logging.error(f"Error loading weather cache: {e}")
+            return
+        with self._lock:
+            for zip_code, fetched_at, status, message in rows:
+                self._cache[zip_code] = (fetched_at, status, message)
+
+    def _store(self, zip_code, fetched_at, status, message):
+        try:
+            conn = db_manager.get_connection(self.db_path)
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO weather_cache (zip, fetched_at, status, message) VALUES (?, ?, ?, ?)",
+                             (zip_code, fetched_at, status, message))
+        except Exception as e:
+            logging.error(f"Error saving weather cache: {e}")
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_weather_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            config = configparser.ConfigParser()
+            config.read('config.ini')
+            _service = WeatherService(
+                api_key=config.get('weather', 'api_key', fallback=DEFAULT_API_KEY),
+                base_url=config.get('weather', 'base_url', fallback=DEFAULT_BASE_URL),
+                ttl=config.getint('weather', 'cache_ttl', fallback=600),
+                prefetch_interval=config.getint('weather', 'prefetch_interval', fallback=0),
+                prefetch_count=config.getint('weather', 'prefetch_count', fallback=3)
+            )
+            _service.start()
+        return _service
+
+
+def shutdown_weather_service():
+    if _service is not None:
+        _service.stop()
+        logging.info(f"Weather service stopped: {_service.stats()}")